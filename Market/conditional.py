@@ -0,0 +1,46 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) для списков.
+
+Валидаторы считаются одним агрегирующим запросом max(updated_at) и count()
+по отфильтрованному queryset, без выборки и сериализации самих строк:
+любое изменение строки обновляет updated_at, добавление и удаление
+меняют количество, а параметры запроса входят в ETag.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+
+def validators(request, queryset, *salt):
+    """
+    Возвращает заголовки ETag и Last-Modified для ответа по queryset.
+    salt - дополнительные значения, от которых зависит ответ
+    (например, id пользователя).
+    """
+    stats = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+    last_modified = stats['last_modified']
+    query = sorted((name, value) for name, values in request.query_params.lists() for value in values)
+    fingerprint = repr((request.path, query, stats['count'],
+                        last_modified.isoformat() if last_modified else None, salt))
+    headers = {'ETag': '"%s"' % hashlib.md5(fingerprint.encode('utf-8')).hexdigest()}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified.timestamp())
+    return headers
+
+
+def not_modified(request, headers):
+    """
+    Возвращает ответ 304, если клиент прислал If-None-Match или
+    If-Modified-Since, совпадающие с валидаторами, иначе None.
+    """
+    response = get_conditional_response(
+        request,
+        etag=headers.get('ETag'),
+        last_modified=parse_http_date_safe(headers.get('Last-Modified', '')),
+    )
+    if response is not None:
+        for name, value in headers.items():
+            response[name] = value
+    return response
@@ -115,6 +115,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # тестовая БД в файле, а не в памяти: тесты одновременных заказов
+        # работают из нескольких потоков с отдельными соединениями
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -238,8 +241,32 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
     },
+    # кэш, общий для всех процессов веб-сервера и worker'ов Celery: корзины
+    # и версии кэша каталога должны быть видны каждому процессу. База Redis
+    # отдельная и без maxmemory-policy с вытеснением ключей
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('SHARED_CACHE_URL', 'redis://localhost:6379/1'),
+    },
 }
 
+# Курсорная пагинация каталога продуктов
+PRODUCTS_PAGE_SIZE = 50 # размер страницы по умолчанию
+PRODUCTS_MAX_PAGE_SIZE = 500 # максимальный размер страницы, который может запросить клиент
+PRODUCTS_EXPORT_CHUNK_SIZE = 1000 # количество продуктов, читаемых за один запрос при выгрузке каталога
+PRODUCTS_IMPORT_BATCH_SIZE = 1000 # количество строк в одном INSERT/UPDATE при импорте прайс-листа
+PRODUCTS_IMPORT_WORKERS = 0 # число процессов для проверки товаров при импорте (0 - в процессе задачи)
+
+# Кэш ответов каталога с версионированными ключами (Products/cache.py)
+CATALOG_CACHE = 'shared' # алиас кэша из CACHES: версии должны быть общими для всех процессов
+CATALOG_CACHE_TIMEOUT = 300 # время жизни сохраненного ответа в секундах
+
+# Хранилище корзин (Products/carts.py): 'db' - Cart/CartProduct,
+# 'cache' - кэш CART_CACHE с отложенной записью в БД
+CART_BACKEND = 'db'
+CART_CACHE = 'shared' # алиас общего для всех процессов кэша из CACHES, не вытесняющего ключи
+CART_PERSIST_DELAY = 30 # задержка отложенной записи корзины в БД в секундах
+
 CACHALOT_CACHE = 'default' # Или название вашего кэша Redis
 CACHALOT_ENABLED = True # Включить cachalot
 #AUTH_USER_MODEL = 'Users.MarketUser'
\ No newline at end of file
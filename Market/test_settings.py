@@ -0,0 +1,13 @@
+"""
+Настройки для тестов: общий кэш 'shared' заменяется локальным,
+чтобы тесты не требовали запущенного Redis.
+"""
+from .settings import *  # noqa: F401,F403
+
+CACHES = {
+    **CACHES,
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared',
+    },
+}
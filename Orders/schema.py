@@ -13,7 +13,8 @@ order_list_schema = extend_schema_view(
     get = extend_schema(
         tags=['Заказы'],
         summary="Получение заказов",
-        description="Получение заказа по id или списка заказов (если id не передан) для текущего пользователя (покупателя, продавца или админа)",
+        description="Получение заказа по id или списка заказов (если id не передан) для текущего пользователя (покупателя, продавца или админа). "
+                    "Поддерживает условные запросы по заголовкам ETag и Last-Modified (ответ 304).",
         parameters=[
             OpenApiParameter(
                 name='id',
@@ -45,6 +46,7 @@ order_list_schema = extend_schema_view(
                     )
                 ]
             ),
+            304: OpenApiResponse(description="Заказы не изменились с версии, указанной в If-None-Match / If-Modified-Since."),
             403: OpenApiResponse(
                 description="Нет прав",
                 examples=[
@@ -14,6 +14,7 @@ from Orders.serializers import OrderProductSerializer, OrderSearchSerializer, Or
 from Users.models import MarketUser
 from rest_framework import status
 from Orders.schema import order_list_schema
+from Market import conditional
 from django.http import HttpResponse
 from  rest_framework.decorators import api_view
 
@@ -53,9 +54,14 @@ class OrderView(APIView):
                 orders_list = user.order_products_seller.all()
             if user.user_type == 'Admin':
                 orders_list = OrderProduct.objects.all()
+            # если у клиента актуальная версия списка, отвечаем 304 до сериализации
+            headers = conditional.validators(request, orders_list, user.id)
+            not_modified = conditional.not_modified(request, headers)
+            if not_modified:
+                return not_modified
             return Response({'message': 'Все заказы',
                              'orders': OrderProductSerializer(orders_list, many=True).data
-                             }, status=status.HTTP_200_OK)
+                             }, status=status.HTTP_200_OK, headers=headers)
         # если переданы данные, выводим список заказов по id
         try:
             order_product = OrderProduct.objects.get(id=serializer.validated_data['id'])
@@ -67,9 +73,13 @@ class OrderView(APIView):
             orders_list = user.order_products_seller.filter(**serializer.validated_data)
         if user.user_type == 'Admin':
             orders_list = OrderProduct.objects.filter(**serializer.validated_data)
+        headers = conditional.validators(request, orders_list, user.id)
+        not_modified = conditional.not_modified(request, headers)
+        if not_modified:
+            return not_modified
         return Response({'message': 'Заказ найден',
                             'orders': OrderProductSerializer(orders_list, many=True).data
-                            }, status=status.HTTP_200_OK)
+                            }, status=status.HTTP_200_OK, headers=headers)
     # вьюшка для изменения статуса заказа по id
     def put(self, request, perm='Users.update_order_status'):
         """
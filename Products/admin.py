@@ -1,10 +1,12 @@
 from django.contrib import admin
 
-from .models import Product, Category, Cart, CartProduct
+from .models import Product, Category, Cart, CartProduct, ImportJob, CategoryMapping
 
 admin.site.register(Product)
 admin.site.register(Category)
 admin.site.register(Cart)
 admin.site.register(CartProduct)
+admin.site.register(ImportJob)
+admin.site.register(CategoryMapping)
 
 # Register your models here.
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Products'
+
+    def ready(self):
+        # подключаем обработчики сигналов приложения
+        from . import signals  # noqa: F401
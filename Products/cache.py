@@ -0,0 +1,188 @@
+"""
+Кэш ответов каталога (списки продуктов и категорий) с версионированными ключами.
+
+В отличие от cachalot, который сбрасывает все запросы к таблице при
+изменении любой ее строки, здесь каждый сохраненный ответ помнит версии
+того, от чего он зависит:
+
+- версии продуктов, попавших в ответ (product:<id>);
+- версии категорий, по которым фильтровался список (category:<id>);
+- версии общих областей: listing (состав и порядок полного списка),
+  parameters (значения параметров для фильтров), search (поисковый индекс),
+  categories (список категорий).
+
+При изменении данных увеличиваются только версии затронутых продуктов,
+категорий и областей, поэтому ответы, не содержащие измененных продуктов,
+остаются в кэше. Ответ считается актуальным, если все сохраненные
+в нем версии совпадают с текущими.
+
+Версии областей и категорий читаются до выборки данных (snapshot), поэтому
+изменение, зафиксированное во время выборки, делает ответ устаревшим.
+Продукты ответа известны только после выборки: если во время нее
+изменился любой продукт (общая версия products), ответ не сохраняется.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+CACHE_ALIAS = getattr(settings, 'CATALOG_CACHE', 'default')
+# время жизни сохраненного ответа в секундах
+TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+PREFIX = 'catalog'
+
+LISTING = 'listing'
+PARAMETERS = 'parameters'
+SEARCH = 'search'
+CATEGORIES = 'categories'
+# общая версия всех продуктов: увеличивается при любом изменении продукта
+# и проверяется только при сохранении ответа, в ответах не хранится
+PRODUCTS = 'products'
+SCOPES = (LISTING, PARAMETERS, SEARCH, CATEGORIES)
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def product_key(product_id):
+    return f'{PREFIX}:v:product:{product_id}'
+
+
+def category_key(category_id):
+    return f'{PREFIX}:v:category:{category_id}'
+
+
+def scope_key(scope):
+    return f'{PREFIX}:v:{scope}'
+
+
+def _initial_version():
+    # начальная версия зависит от времени, чтобы ключ, вытесненный из кэша
+    # и созданный заново, не совпал с версией, сохраненной в старом ответе
+    return time.time_ns()
+
+
+def _incr(key, initial=None):
+    cache = _cache()
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version() if initial is None else initial, None)
+
+
+def _bump(keys):
+    for key in keys:
+        _incr(key)
+
+
+def touch(*scopes):
+    """
+    Увеличивает версии общих областей кэша.
+    """
+    _bump(scope_key(scope) for scope in scopes)
+
+
+def touch_products(product_ids, *scopes):
+    """
+    Увеличивает версии продуктов и, при необходимости, общих областей.
+    """
+    product_ids = list(product_ids)
+    if product_ids:
+        scopes += (PRODUCTS,)
+    _bump([product_key(product_id) for product_id in product_ids] + [scope_key(scope) for scope in scopes])
+
+
+def touch_categories(category_ids, *scopes):
+    """
+    Увеличивает версии категорий и, при необходимости, общих областей.
+    """
+    _bump([category_key(category_id) for category_id in category_ids] + [scope_key(scope) for scope in scopes])
+
+
+def current_versions(keys):
+    """
+    Возвращает текущие версии для ключей, создавая отсутствующие.
+    """
+    cache = _cache()
+    keys = list(keys)
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _initial_version(), None)
+            versions[key] = cache.get(key)
+    return versions
+
+
+def snapshot(category_ids=()):
+    """
+    Читает версии, от которых может зависеть ответ и которые известны до
+    выборки данных: общих областей, указанных категорий и общую версию
+    продуктов. Вызывается до выборки, результат передается в store().
+    """
+    return current_versions([scope_key(scope) for scope in SCOPES + (PRODUCTS,)]
+                            + [category_key(category_id) for category_id in category_ids])
+
+
+def dependencies(scopes=(), product_ids=(), category_ids=()):
+    """
+    Собирает список ключей версий, от которых зависит ответ.
+    """
+    return ([scope_key(scope) for scope in scopes]
+            + [category_key(category_id) for category_id in category_ids]
+            + [product_key(product_id) for product_id in product_ids])
+
+
+def response_key(request):
+    """
+    Ключ ответа: путь и отсортированные параметры запроса.
+    """
+    query = sorted((name, value) for name, values in request.query_params.lists() for value in values)
+    digest = hashlib.md5(repr(query).encode('utf-8')).hexdigest()
+    return f'{PREFIX}:response:{request.path}:{digest}'
+
+
+def lookup(request):
+    """
+    Возвращает кортеж (данные ответа, заголовки ответа) или None,
+    если ответа нет или хотя бы одна из его зависимостей изменилась.
+    """
+    cache = _cache()
+    entry = cache.get(response_key(request))
+    if entry is not None and cache.get_many(list(entry['versions'])) == entry['versions']:
+        _incr(f'{PREFIX}:stats:hits', initial=1)
+        return entry['data'], entry['headers']
+    _incr(f'{PREFIX}:stats:misses', initial=1)
+    return None
+
+
+def store(request, data, keys, before, headers=None):
+    """
+    Сохраняет данные и заголовки ответа вместе с версиями его зависимостей.
+
+    before - версии, прочитанные snapshot() до выборки данных; для областей
+    и категорий сохраняются они. Версии продуктов читаются после выборки,
+    и если общая версия продуктов за это время изменилась, ответ
+    не сохраняется. Возвращает True, если ответ сохранен.
+    """
+    products = scope_key(PRODUCTS)
+    after = current_versions([key for key in keys if key not in before] + [products])
+    if after.pop(products) != before[products]:
+        return False
+    versions = {key: before[key] if key in before else after[key] for key in keys}
+    _cache().set(response_key(request), {'data': data, 'headers': headers or {}, 'versions': versions}, TIMEOUT)
+    return True
+
+
+def stats():
+    """
+    Счетчики попаданий и промахов кэша ответов каталога.
+    """
+    counters = _cache().get_many([f'{PREFIX}:stats:hits', f'{PREFIX}:stats:misses'])
+    return {
+        'hits': counters.get(f'{PREFIX}:stats:hits', 0),
+        'misses': counters.get(f'{PREFIX}:stats:misses', 0),
+    }
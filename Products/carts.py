@@ -0,0 +1,322 @@
+"""
+Хранилища корзин покупателей.
+
+Представления работают с корзиной через хранилище, выбранное настройкой
+CART_BACKEND:
+
+- 'db' (по умолчанию) - корзина хранится в Cart/CartProduct, каждое
+  изменение сразу записывается в БД;
+- 'cache' - актуальная корзина хранится в кэше CART_CACHE (Redis в боевом
+  окружении) и изменяется без обращений к БД. Изменения записываются в
+  Cart/CartProduct отложенно задачей persist_cart (не чаще одного раза за
+  CART_PERSIST_DELAY секунд) и обязательно перед оформлением заказа (checkout),
+  поэтому заказ всегда оформляется по актуальному содержимому корзины.
+
+Корзина в кэше хранится без срока жизни: кэш CART_CACHE не должен вытеснять
+ключи (для Redis - отдельная база без maxmemory-policy с вытеснением),
+иначе изменения, еще не записанные в БД, будут потеряны. Отсутствующая
+в кэше корзина загружается из БД.
+
+Изменение корзины в кэше и ее запись в БД выполняются под блокировкой
+корзины (ключ, добавляемый cache.add), поэтому одновременные запросы
+покупателя, задача persist_cart и оформление заказа не теряют изменения
+друг друга и не записывают одну корзину дважды.
+"""
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Cart, CartProduct, Product
+
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'cart'
+# время жизни блокировки корзины в секундах: блокировку, которую не снял
+# завершившийся с ошибкой процесс, следующий запрос получит по истечении этого времени
+LOCK_TIMEOUT = 10
+# пауза между попытками получить блокировку в секундах
+LOCK_POLL_INTERVAL = 0.01
+
+
+class DatabaseCartStore:
+    """
+    Корзина в БД: изменения записываются сразу.
+    """
+
+    def set_quantity(self, user_id, product_id, quantity):
+        """
+        Добавляет продукт в корзину или меняет его количество.
+        Возвращает id корзины.
+        """
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(user_id=user_id)
+            if not CartProduct.objects.filter(cart=cart, product_id=product_id).set_quantity(quantity):
+                CartProduct.objects.create(cart=cart, product_id=product_id, quantity=quantity)
+        return cart.id
+
+    def update_quantity(self, user_id, product_id, quantity):
+        """
+        Меняет количество продукта, который уже есть в корзине.
+        Возвращает False, если продукта в корзине нет.
+        """
+        return CartProduct.objects.filter(cart__user_id=user_id, product_id=product_id).set_quantity(quantity) > 0
+
+    def remove(self, user_id, product_id):
+        """
+        Удаляет продукт из корзины. Возвращает False, если продукта в корзине нет.
+        """
+        deleted, _ = CartProduct.objects.filter(cart__user_id=user_id, product_id=product_id).delete()
+        return deleted > 0
+
+    def apply(self, user_id, upserts, removals, prices):
+        """
+        Применяет пакет изменений в одной транзакции. upserts - словарь
+        {id продукта: количество}, removals - id удаляемых продуктов
+        (продукты, которых нет в корзине, пропускаются), prices - цены
+        продуктов из upserts {id продукта: цена}, уже загруженные вызывающим.
+        Возвращает id корзины.
+
+        Измененные и новые позиции записываются одним INSERT ... ON CONFLICT
+        (cart, product) DO UPDATE, поэтому позиция, добавленная параллельным
+        запросом, обновляется, а не нарушает уникальность (cart, product).
+        """
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(user_id=user_id)
+            # (количество, цена) позиций, которые уже есть в корзине
+            current = {product_id: (quantity, price) for product_id, quantity, price in CartProduct.objects.filter(
+                cart=cart, product_id__in=list(upserts)).values_list('product_id', 'quantity', 'price')}
+            previous = {product_id: current.get(product_id, (0, prices[product_id]))
+                        for product_id, quantity in upserts.items() if current.get(product_id, (0,))[0] != quantity}
+            # у измененных позиций цена не перезаписывается (не входит в update_fields)
+            CartProduct.objects.bulk_create(
+                [CartProduct(cart=cart, product_id=product_id, quantity=upserts[product_id], price=price)
+                 for product_id, (_, price) in previous.items()],
+                update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity', 'updated_at'])
+            # итоги корзины сдвигаются одним UPDATE на все позиции пакета
+            Cart.objects.filter(pk=cart.pk).shift_totals(
+                sum(upserts[product_id] - quantity for product_id, (quantity, _) in previous.items()),
+                sum((upserts[product_id] - quantity) * price for product_id, (quantity, price) in previous.items()))
+            if removals:
+                CartProduct.objects.filter(cart=cart, product_id__in=list(removals)).delete()
+        return cart.id
+
+    def lines(self, user_id):
+        """
+        Возвращает id корзины и список пар (продукт с продавцом, количество)
+        в порядке продуктов каталога (название, id).
+        """
+        cart, _ = Cart.objects.get_or_create(user_id=user_id)
+        return cart.id, [(line.product, line.quantity) for line in cart.cart_products.select_related(
+            'product__seller').order_by('product__name', 'product__id')]
+
+    def summary(self, user_id):
+        """
+        Возвращает id корзины, количество единиц товара и стоимость корзины
+        из одной строки Cart (id None для покупателя без корзины).
+        """
+        cart = Cart.objects.filter(user_id=user_id).values('id', 'items_count', 'total_price').first()
+        return cart or {'id': None, 'items_count': 0, 'total_price': Decimal('0.00')}
+
+    def flush(self, user_id):
+        """
+        Записывает корзину в БД.
+        """
+
+    @contextmanager
+    def checkout(self, user_id):
+        """
+        Оформление заказа: внутри блока корзина в Cart/CartProduct актуальна.
+        """
+        yield
+
+
+class CacheCartStore(DatabaseCartStore):
+    """
+    Корзина в кэше с отложенной записью в БД.
+
+    Состояние корзины - словарь {'cart_id': id корзины, 'lines': {id продукта: количество}}.
+    Изменение перезаписывает состояние целиком, поэтому чтение, изменение
+    и запись состояния выполняются под блокировкой корзины (см. _lock).
+    """
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'CART_CACHE', 'default')]
+        self.delay = getattr(settings, 'CART_PERSIST_DELAY', 30)
+
+    def _key(self, user_id):
+        return f'{PREFIX}:{user_id}'
+
+    @contextmanager
+    def _lock(self, user_id):
+        """
+        Блокировка корзины покупателя. cache.add атомарно добавляет ключ,
+        только если его нет (в Redis - SET NX), поэтому блокировку получает
+        один запрос, а остальные ждут ее снятия или истечения LOCK_TIMEOUT.
+        """
+        key = f'{self._key(user_id)}:lock'
+        token = uuid.uuid4().hex
+        while not self.cache.add(key, token, LOCK_TIMEOUT):
+            time.sleep(LOCK_POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            # истекшую блокировку мог получить другой запрос - ее не снимаем
+            if self.cache.get(key) == token:
+                self.cache.delete(key)
+
+    def _load(self, user_id):
+        state = self.cache.get(self._key(user_id))
+        if state is None:
+            cart, _ = Cart.objects.get_or_create(user_id=user_id)
+            state = {'cart_id': cart.id,
+                     'lines': dict(CartProduct.objects.filter(cart=cart).values_list('product_id', 'quantity'))}
+            # корзину мог загрузить параллельный запрос - используем сохраненную первой
+            if not self.cache.add(self._key(user_id), state, None):
+                state = self.cache.get(self._key(user_id), state)
+        return state
+
+    def _save(self, user_id, state):
+        self.cache.set(self._key(user_id), state, None)
+        self._schedule(user_id)
+
+    def _schedule(self, user_id):
+        """
+        Ставит в очередь запись корзины в БД, если она еще не запланирована.
+        """
+        # метка живет дольше задержки: если задача потеряется, следующее изменение запланирует новую
+        if not self.cache.add(f'{self._key(user_id)}:scheduled', True, self.delay + 60):
+            return
+        from .tasks import persist_cart
+        try:
+            persist_cart.apply_async((user_id,), countdown=self.delay)
+        except Exception as e:
+            # корзина все равно будет записана при оформлении заказа
+            logger.warning(f"Не удалось запланировать запись корзины пользователя {user_id}: {e}")
+            self.cache.delete(f'{self._key(user_id)}:scheduled')
+
+    def set_quantity(self, user_id, product_id, quantity):
+        with self._lock(user_id):
+            state = self._load(user_id)
+            state['lines'][product_id] = quantity
+            self._save(user_id, state)
+        return state['cart_id']
+
+    def update_quantity(self, user_id, product_id, quantity):
+        with self._lock(user_id):
+            state = self._load(user_id)
+            if product_id not in state['lines']:
+                return False
+            state['lines'][product_id] = quantity
+            self._save(user_id, state)
+        return True
+
+    def remove(self, user_id, product_id):
+        with self._lock(user_id):
+            state = self._load(user_id)
+            if state['lines'].pop(product_id, None) is None:
+                return False
+            self._save(user_id, state)
+        return True
+
+    def apply(self, user_id, upserts, removals, prices):
+        with self._lock(user_id):
+            state = self._load(user_id)
+            state['lines'].update(upserts)
+            for product_id in removals:
+                state['lines'].pop(product_id, None)
+            self._save(user_id, state)
+        return state['cart_id']
+
+    def lines(self, user_id):
+        state = self._load(user_id)
+        products = Product.objects.select_related('seller').in_bulk(list(state['lines']))
+        # продукты, удаленные из каталога, в корзине не показываются
+        ordered = sorted(products.values(), key=lambda product: (product.name, product.id))
+        return state['cart_id'], [(product, state['lines'][product.id]) for product in ordered]
+
+    def summary(self, user_id):
+        # итоги в БД отстают от кэша до записи корзины, поэтому считаются по кэшу
+        state = self._load(user_id)
+        prices = dict(Product.objects.filter(id__in=list(state['lines'])).values_list('id', 'price'))
+        return {'id': state['cart_id'],
+                'items_count': sum(state['lines'][product_id] for product_id in prices),
+                'total_price': sum((state['lines'][product_id] * price for product_id, price in prices.items()),
+                                   Decimal('0.00'))}
+
+    def flush(self, user_id):
+        """
+        Приводит Cart/CartProduct к состоянию корзины в кэше.
+        Измененные и новые позиции записываются одним INSERT ... ON CONFLICT
+        (cart, product) DO UPDATE, поэтому повторная запись не создает
+        вторую позицию продукта.
+        """
+        with self._lock(user_id):
+            self.cache.delete(f'{self._key(user_id)}:scheduled')
+            state = self.cache.get(self._key(user_id))
+            if state is None:
+                return
+            self._write(state)
+
+    def _write(self, state):
+        lines = state['lines']
+        with transaction.atomic():
+            current = {product_id: (line_id, quantity, price) for line_id, product_id, quantity, price in
+                       CartProduct.objects.filter(cart_id=state['cart_id']).values_list('id', 'product_id', 'quantity', 'price')}
+            removed = [line_id for product_id, (line_id, _, _) in current.items() if product_id not in lines]
+            changed = [(product_id, quantity) for product_id, quantity in lines.items()
+                       if product_id in current and current[product_id][1] != quantity]
+            added = dict(Product.objects.filter(id__in=[product_id for product_id in lines if product_id not in current])
+                         .values_list('id', 'price'))
+            CartProduct.objects.filter(id__in=removed).delete()
+            # у измененных позиций цена не перезаписывается (не входит в update_fields)
+            CartProduct.objects.bulk_create(
+                [CartProduct(cart_id=state['cart_id'], product_id=product_id, quantity=quantity,
+                             price=current[product_id][2]) for product_id, quantity in changed]
+                + [CartProduct(cart_id=state['cart_id'], product_id=product_id, quantity=lines[product_id], price=price)
+                   for product_id, price in added.items()],
+                update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity', 'updated_at'])
+            Cart.objects.filter(pk=state['cart_id']).shift_totals(
+                sum(quantity - current[product_id][1] for product_id, quantity in changed)
+                + sum(lines[product_id] for product_id in added),
+                sum((quantity - current[product_id][1]) * current[product_id][2] for product_id, quantity in changed)
+                + sum(lines[product_id] * price for product_id, price in added.items()))
+
+    @contextmanager
+    def checkout(self, user_id):
+        """
+        Записывает корзину в БД и держит блокировку корзины до конца
+        оформления заказа. После блока состояние в кэше сбрасывается
+        (оно совпадает с БД или устарело после заказа) и загружается
+        из БД при следующем обращении; изменения корзины и задача
+        persist_cart, ожидающие блокировку, не восстановят оформленную корзину.
+        """
+        with self._lock(user_id):
+            self.cache.delete(f'{self._key(user_id)}:scheduled')
+            state = self.cache.get(self._key(user_id))
+            if state is not None:
+                self._write(state)
+            try:
+                yield
+            finally:
+                self.cache.delete(self._key(user_id))
+
+
+# хранилище корзин: название в настройке CART_BACKEND -> класс
+STORES = {
+    'db': DatabaseCartStore,
+    'cache': CacheCartStore,
+}
+
+
+def get_store():
+    """
+    Возвращает хранилище корзин, выбранное настройкой CART_BACKEND.
+    """
+    return STORES[getattr(settings, 'CART_BACKEND', 'db')]()
@@ -0,0 +1,80 @@
+"""
+Потоковая выгрузка всего каталога в NDJSON или CSV.
+
+Продукты читаются порциями через .iterator(chunk_size) вместе с продавцом,
+параметрами и категориями (prefetch выполняется на каждую порцию),
+а каждая строка отдается клиенту сразу после формирования, поэтому
+расход памяти не зависит от размера каталога.
+"""
+import csv
+import json
+
+from cachalot.api import cachalot_disabled
+from django.conf import settings
+
+from .models import Product
+
+
+# количество продуктов, читаемых из БД за один запрос
+CHUNK_SIZE = getattr(settings, 'PRODUCTS_EXPORT_CHUNK_SIZE', 1000)
+
+CSV_COLUMNS = ['id', 'name', 'price', 'description', 'quantity', 'is_available', 'seller', 'categories', 'parameters']
+
+
+def export_rows():
+    """
+    Генератор словарей с данными продуктов в порядке id.
+    """
+    # cachalot сохраняет в кэш результат запроса целиком, что для выгрузки
+    # всего каталога лишает смысла чтение порциями
+    with cachalot_disabled():
+        for product in Product.objects.for_catalog().order_by('id').iterator(chunk_size=CHUNK_SIZE):
+            yield {
+                'id': product.id,
+                'name': product.name,
+                'price': str(product.price),
+                'description': product.description or '',
+                'quantity': product.quantity,
+                'is_available': product.is_available,
+                'seller': product.seller.username if product.seller else None,
+                'categories': [category.name for category in product.categories.all()],
+                'parameters': {parameter.name: parameter.value for parameter in product.parameters.all()},
+            }
+
+
+def ndjson_lines():
+    """
+    Генератор строк NDJSON: один продукт - одна строка JSON.
+    """
+    for row in export_rows():
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    """
+    Псевдо-файл для csv.writer: возвращает записанную строку,
+    чтобы ее можно было сразу отдать в ответ.
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines():
+    """
+    Генератор строк CSV с заголовком. Категории перечисляются через '; ',
+    параметры записываются объектом JSON.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for row in export_rows():
+        row['categories'] = '; '.join(row['categories'])
+        row['parameters'] = json.dumps(row['parameters'], ensure_ascii=False)
+        yield writer.writerow([row[column] for column in CSV_COLUMNS])
+
+
+# формат выгрузки: (генератор строк, content type, расширение файла)
+FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson; charset=utf-8', 'ndjson'),
+    'csv': (csv_lines, 'text/csv; charset=utf-8', 'csv'),
+}
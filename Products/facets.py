@@ -0,0 +1,128 @@
+"""
+Инкрементальное обновление предрасчитанных фасетов (ParameterFacet).
+
+Фасет - это число продуктов категории, у которых параметр name имеет
+значение value. Вклад продукта в фасеты определяется его категориями и
+параметрами, поэтому любое изменение оформляется так:
+
+    with track_facets([product.id]):
+        ... меняем параметры или категории продукта ...
+
+До и после изменения снимается вклад затронутых продуктов (два запроса
+по индексам), а разница применяется к счетчикам set-based UPDATE
+с F()-выражениями.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from functools import reduce
+from operator import or_
+
+from django.db.models import F, Q
+
+from .models import Category, Parameters, ParameterFacet
+
+
+CHUNK_SIZE = 500
+
+
+def _chunks(items):
+    items = list(items)
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start:start + CHUNK_SIZE]
+
+
+def snapshot(product_ids):
+    """
+    Возвращает вклад продуктов в фасеты: Counter по ключам
+    (id категории, название параметра, значение параметра).
+    """
+    contribution = Counter()
+    through = Category.products.through
+    for chunk in _chunks(set(product_ids)):
+        categories = {}
+        for category_id, product_id in through.objects.filter(product_id__in=chunk).values_list('category_id', 'product_id'):
+            categories.setdefault(product_id, []).append(category_id)
+        if not categories:
+            continue
+        parameters = Parameters.objects.filter(product_id__in=list(categories)).values_list(
+            'product_id', 'parameter_name__name', 'value')
+        for product_id, name, value in parameters:
+            for category_id in categories[product_id]:
+                contribution[(category_id, name, value or '')] += 1
+    return contribution
+
+
+def apply_delta(delta):
+    """
+    Применяет изменение счетчиков: положительные значения увеличивают,
+    отрицательные уменьшают счетчик соответствующего фасета.
+    """
+    delta = {key: amount for key, amount in delta.items() if amount}
+    if not delta:
+        return
+
+    # создаем недостающие строки фасетов с нулевым счетчиком
+    ParameterFacet.objects.bulk_create(
+        [ParameterFacet(category_id=c, name=n, value=v, count=0) for (c, n, v), amount in delta.items() if amount > 0],
+        ignore_conflicts=True,
+    )
+
+    # ключи с одинаковым приращением обновляем одним UPDATE
+    by_amount = {}
+    for key, amount in delta.items():
+        by_amount.setdefault(amount, []).append(key)
+    for amount, keys in by_amount.items():
+        for chunk in _chunks(keys):
+            condition = reduce(or_, [Q(category_id=c, name=n, value=v) for c, n, v in chunk])
+            ParameterFacet.objects.filter(condition).update(count=F('count') + amount)
+
+    # значения, которых больше нет ни у одного продукта категории, убираем
+    categories = {category_id for category_id, _, _ in delta}
+    ParameterFacet.objects.filter(category_id__in=categories, count__lte=0).delete()
+
+
+@contextmanager
+def track_facets(product_ids):
+    """
+    Контекстный менеджер, пересчитывающий фасеты для изменяемых продуктов.
+    Новые продукты можно не передавать: их вклад до изменения пуст,
+    поэтому достаточно вызвать add_products после создания.
+    """
+    product_ids = list(product_ids)
+    before = snapshot(product_ids)
+    yield
+    after = snapshot(product_ids)
+    after.subtract(before)
+    apply_delta(after)
+
+
+def add_products(product_ids):
+    """
+    Добавляет в фасеты вклад только что созданных продуктов.
+    """
+    apply_delta(snapshot(product_ids))
+
+
+def rebuild():
+    """
+    Полностью пересчитывает фасеты по текущим данным.
+    Нужен для первичного заполнения и восстановления после сбоев.
+    """
+    ParameterFacet.objects.all().delete()
+    product_ids = Parameters.objects.filter(product__isnull=False).values_list('product_id', flat=True).distinct()
+    apply_delta(snapshot(product_ids))
+
+
+def facet_counts(category_ids):
+    """
+    Возвращает фасеты категорий в виде списка
+    [{'name': ..., 'values': [{'value': ..., 'count': ...}, ...]}, ...].
+    Для нескольких категорий счетчики суммируются.
+    """
+    totals = Counter()
+    for name, value, count in ParameterFacet.objects.filter(category_id__in=category_ids, count__gt=0).values_list('name', 'value', 'count'):
+        totals[(name, value)] += count
+    facets = {}
+    for (name, value), count in sorted(totals.items(), key=lambda item: (item[0][0], -item[1], item[0][1])):
+        facets.setdefault(name, []).append({'value': value, 'count': count})
+    return [{'name': name, 'values': values} for name, values in facets.items()]
@@ -0,0 +1,796 @@
+"""
+Пакетный импорт прайс-листа продавца.
+
+Вместо обработки каждого товара отдельными запросами импорт выполняется
+порциями по BATCH_SIZE товаров:
+
+1. продавцы, категории, названия параметров, существующие продукты, их
+   параметры и связи с категориями загружаются для порции несколькими
+   запросами в словари (id названий параметров запоминаются на весь импорт);
+2. каждый товар проверяется сериализатором AddProductImportSerializer
+   (без обращений к БД, при WORKERS > 1 - параллельно в пуле процессов)
+   и сравнивается с текущим состоянием в памяти;
+3. изменения записываются через bulk_create/bulk_update в одной
+   транзакции на порцию;
+4. полнотекстовый индекс, фасеты и версии кэша каталога обновляются
+   явно, так как массовые операции не вызывают save() и сигналы.
+
+В режиме замены (replace=True) прайс-лист считается полным каталогом
+продавцов, товары которых в нем есть: встреченные продукты отмечаются
+меткой импорта, а после последней порции остальные продукты этих продавцов
+снимаются с продажи одним запросом UPDATE по метке в отдельной транзакции.
+Порции и в этом режиме записываются каждая в своей транзакции: одна
+транзакция на весь импорт держала бы блокировку SQLite на запись все время
+импорта, и оформление заказов и изменения корзин ждали бы его окончания.
+Прерванный импорт оставляет записанные порции (как импорт в режиме
+обновления), но ничего не снимает с продажи. Повторный импорт с той же
+меткой (ImportJobView.post для задания, контрольная точка команды
+import_products) пропускает записанные товары по хэшу данных, дописывает
+остальные и снимает с продажи отсутствующие.
+
+Для товаров с id (goods[].id) сохраняется хэш данных (ImportedItem):
+товар, данные которого не изменились с прошлого импорта, пропускается
+без проверки и записи. Изменения, внесенные в продукт не через импорт
+(например, через API), в этом случае не перезаписываются.
+
+Категории прайс-листа (goods[].category) сопоставляются категориям каталога
+через CategoryMapping: соответствия продавцов загружаются один раз за импорт,
+новые сохраняются одним запросом на порцию, а переименование категории
+в прайс-листе не создает новую категорию каталога.
+
+Прайс-лист любого формата читается потоково (см. Products/pricelists.py),
+поэтому расход памяти определяется размером порции, а не размером файла.
+
+Пробный импорт (dry_run=True) проходит все этапы, включая запись, но
+транзакция каждой порции откатывается сразу после записи, поэтому
+блокировка базы на запись не держится все время импорта. Продукты,
+созданные в откатанных порциях, считаются существующими в следующих,
+а снимаемые с продажи продукты в режиме замены считаются по id продуктов,
+встреченных в прайс-листе. Отчет содержит количество продуктов, которые
+были бы созданы, изменены и сняты с продажи, ошибки и время каждого этапа
+(чтение, проверка, сравнение, запись).
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone, translation
+
+from Users.models import MarketUser
+from .models import Product, Category, CategoryMapping, Parameters, ParameterName, ImportedItem, CartProduct
+from .serializers import AddProductImportSerializer
+from . import search, facets
+from . import cache as catalog_cache
+
+
+logger = logging.getLogger(__name__)
+
+# количество строк в одном INSERT/UPDATE и в одном условии IN
+BATCH_SIZE = getattr(settings, 'PRODUCTS_IMPORT_BATCH_SIZE', 1000)
+
+# число процессов для проверки товаров; 0 или 1 - проверка в текущем процессе
+WORKERS = getattr(settings, 'PRODUCTS_IMPORT_WORKERS', 0)
+
+# поля продукта, которые импорт переносит из прайс-листа
+PRODUCT_FIELDS = ('price', 'description', 'quantity')
+
+# этапы импорта, время которых приводится в отчете
+STAGES = ('parse', 'validate', 'diff', 'write')
+
+
+def _chunks(items):
+    items = list(items)
+    for start in range(0, len(items), BATCH_SIZE):
+        yield items[start:start + BATCH_SIZE]
+
+
+def validate_item(item_data, partial):
+    """
+    Проверяет товар сериализатором и приводит данные к виду для записи.
+    Возвращает (True, (поля продукта, параметры, названия категорий))
+    или (False, ошибки сериализатора).
+
+    Выполняется и в дочерних процессах, поэтому не обращается к БД.
+    """
+    serializer = AddProductImportSerializer(data=item_data, partial=partial)
+    if not serializer.is_valid():
+        return False, serializer.errors
+    data = serializer.validated_data
+    return True, (
+        {field: data[field] for field in PRODUCT_FIELDS if field in data},
+        {parameter['name']: (parameter['value'], parameter['numeric_value'], parameter['unit'])
+         for parameter in data.get('parameters', [])},
+        list(dict.fromkeys(data.get('categories', []))),
+    )
+
+
+def _validate_chunk(chunk):
+    return [validate_item(item_data, partial) for item_data, partial in chunk]
+
+
+def _init_worker(language):
+    # процессы, запущенные через spawn или forkserver, настраивают Django заново
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    # сообщения об ошибках на том же языке, что и при проверке в текущем процессе
+    translation.activate(language)
+
+
+class ImportItem:
+    """
+    Проверенный товар прайс-листа, готовый к записи.
+    """
+
+    def __init__(self, seller_id, name, fields, parameters, categories, fingerprints, external_category=None):
+        self.seller_id = seller_id
+        self.name = name
+        # поля продукта из PRODUCT_FIELDS, присутствующие в прайс-листе
+        self.fields = fields
+        # {название параметра: (значение, числовое значение, единица измерения)}
+        self.parameters = parameters
+        # названия категорий
+        self.categories = categories
+        # (id категории в прайс-листе, ее название) для товара с goods[].category
+        self.external_category = external_category
+        # id категорий каталога, заполняются при записи
+        self.category_ids = []
+        # пары (id товара в прайс-листе, хэш данных) для сохранения в ImportedItem
+        self.fingerprints = fingerprints
+        # id продукта, заполняется при записи
+        self.product_id = None
+
+    @property
+    def key(self):
+        return self.seller_id, self.name
+
+
+class CatalogImporter:
+    """
+    Импорт товаров прайс-листа.
+
+    Для каждого товара продукт ищется по паре (название, продавец):
+    найденный продукт обновляется, иначе создается новый. Параметры
+    и категории продукта приводятся к указанным в прайс-листе.
+    """
+
+    def __init__(self, user=None, progress=None, replace=False, token=None, dry_run=False):
+        # продавец по умолчанию для товаров без seller_id
+        self.user = user
+        # режим замены каталога продавцов
+        self.replace = replace
+        # пробный импорт: все изменения откатываются
+        self.dry_run = dry_run
+        # функция progress(importer) вызывается после записи каждой порции товаров
+        self.progress = progress
+        self.total = 0
+        self.processed = 0
+        self.imported_count = 0
+        self.updated_count = 0
+        self.unchanged_count = 0
+        self.removed_count = 0
+        self.deactivated_count = 0
+        self.errors = []
+        # метка импорта в ImportedItem (и в Product в режиме замены);
+        # записи продавцов из seller_ids с другой меткой отсутствуют в прайс-листе.
+        # Продолженный после прерывания импорт передает метку прерванного
+        self.token = token or uuid.uuid4().hex
+        self.seller_ids = set()
+        self._pool = None
+        # id продуктов и категорий, версии которых в кэше каталога нужно увеличить
+        self._changed_ids = set()
+        self._changed_category_ids = set()
+        # {название параметра: id в справочнике ParameterName} на время импорта
+        self._parameter_name_ids = {}
+        # {(id продавца, id категории в прайс-листе): id категории каталога}
+        # для продавцов из _mapped_seller_ids
+        self._category_mappings = {}
+        self._mapped_seller_ids = set()
+        # пробный импорт: {(id продавца, название): поля} продуктов, созданных
+        # в откатанных порциях, а в режиме замены - id встреченных продуктов и записей ImportedItem
+        self._dry_run_created = {}
+        self._dry_run_present_ids = set()
+        self._dry_run_seen_item_ids = set()
+        # время этапов импорта в секундах
+        self.timings = dict.fromkeys(STAGES, 0.0)
+        self._started = time.perf_counter()
+
+    def report(self):
+        return {
+            'imported_count': self.imported_count,
+            'updated_count': self.updated_count,
+            'unchanged_count': self.unchanged_count,
+            'removed_count': self.removed_count,
+            'deactivated_count': self.deactivated_count,
+            'errors': self.errors,
+            'timings': self.timings_report(),
+        }
+
+    def timings_report(self):
+        """
+        Время этапов и всего импорта в секундах и скорость импорта (товаров в секунду).
+        """
+        elapsed = time.perf_counter() - self._started
+        report = {stage: round(seconds, 3) for stage, seconds in self.timings.items()}
+        report['total'] = round(elapsed, 3)
+        report['items_per_second'] = round(self.processed / elapsed, 1) if elapsed > 0 else 0.0
+        return report
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Добавляет время выполнения блока к времени этапа name.
+        Используется и снаружи, например для первого прохода по файлу.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - started
+
+    def run(self, categories_data, goods, total=None):
+        """
+        Выполняет импорт и возвращает отчет (см. report()).
+
+        categories_data - список категорий прайс-листа ({'id': ..., 'name': ...}),
+        goods - итерируемый набор товаров (например, YamlPriceList.goods()),
+        total - число товаров, если оно известно заранее.
+        """
+        category_id_to_name_map = {cat['id']: cat['name'] for cat in categories_data
+                                   if isinstance(cat, dict) and 'id' in cat and 'name' in cat}
+        goods = iter(goods)
+        self.total = total or 0
+        self._start_pool()
+        try:
+            while True:
+                with self.stage('parse'):
+                    batch = list(islice(goods, BATCH_SIZE))
+                if not batch:
+                    break
+                self._import_batch(batch, category_id_to_name_map)
+                self.processed += len(batch)
+                self.total = max(self.total, self.processed)
+                self._touch_cache()
+                if self.progress is not None:
+                    self.progress(self)
+            with self.stage('write'):
+                if self.replace and self.dry_run:
+                    self._count_missing()
+                elif self.replace:
+                    # снятие с продажи выполняется только после записи всех порций
+                    with transaction.atomic():
+                        self._deactivate_missing()
+                        self._forget_removed()
+        finally:
+            self._close_pool()
+        return self.report()
+
+    def _start_pool(self):
+        """
+        Запускает пул процессов для проверки товаров, если WORKERS > 1.
+        Демонический процесс (например, рабочий процесс Celery с пулом prefork)
+        не может запускать дочерние процессы, в нем товары проверяются без пула.
+        """
+        if WORKERS < 2:
+            return
+        if multiprocessing.current_process().daemon:
+            logger.info("Импорт выполняется в демоническом процессе, проверка выполняется без пула процессов")
+            return
+        self._pool = ProcessPoolExecutor(max_workers=WORKERS, initializer=_init_worker,
+                                         initargs=(translation.get_language(),))
+
+    def _close_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def _validate_all(self, tasks):
+        """
+        Проверяет товары (список пар (данные, partial)) и возвращает
+        результаты validate_item в том же порядке. При наличии пула
+        товары делятся на WORKERS частей, которые проверяются параллельно.
+        """
+        if self._pool is None or len(tasks) < 2:
+            return _validate_chunk(tasks)
+        size = -(-len(tasks) // WORKERS)
+        chunks = [tasks[start:start + size] for start in range(0, len(tasks), size)]
+        try:
+            return [result for chunk in self._pool.map(_validate_chunk, chunks) for result in chunk]
+        except (BrokenProcessPool, OSError, AssertionError) as e:
+            # процессы не удалось запустить (например, в окружении без fork
+            # или в демоническом процессе) - проверяем здесь
+            logger.warning(f"Пул процессов импорта недоступен, проверка выполняется в текущем процессе: {e}")
+            self._close_pool()
+            return _validate_chunk(tasks)
+
+    def _import_batch(self, goods, category_id_to_name_map):
+        """
+        Импортирует порцию товаров в отдельной транзакции. Транзакция порции
+        пробного импорта откатывается сразу после записи.
+        """
+        if not self.dry_run:
+            self._write_batch(goods, category_id_to_name_map)
+            return
+        with transaction.atomic():
+            self._write_batch(goods, category_id_to_name_map)
+            transaction.set_rollback(True)
+        # id, записанные в откатанной порции, недействительны;
+        # данные не изменились, версии кэша увеличивать не нужно
+        self._parameter_name_ids = {}
+        self._category_mappings, self._mapped_seller_ids = {}, set()
+        self._changed_ids, self._changed_category_ids = set(), set()
+
+    def _write_batch(self, goods, category_id_to_name_map):
+        """
+        Проверяет порцию товаров и записывает изменения.
+        """
+        with self.stage('validate'):
+            sellers = self._load_sellers(goods)
+            candidates = [candidate for candidate in (self._normalize(raw, sellers, category_id_to_name_map) for raw in goods)
+                          if candidate is not None]
+        self.seller_ids |= {candidate[0] for candidate in candidates}
+        with self.stage('diff'):
+            candidates, unchanged_product_ids = self._skip_unchanged(candidates)
+            existing = self._load_products({candidate[:2] for candidate in candidates})
+        with self.stage('validate'):
+            items = self._validate(candidates, existing)
+
+        with transaction.atomic():
+            changed_ids, category_ids = self._write(items, existing)
+            with self.stage('write'):
+                self._save_fingerprints(items)
+                if self.replace:
+                    # продукты из прайс-листа, в том числе не прошедшие проверку
+                    present = {product.id for product in existing.values()} | set(changed_ids) | set(unchanged_product_ids)
+                    if self.dry_run:
+                        self._dry_run_present_ids |= present
+                    for chunk in _chunks(present):
+                        Product.objects.filter(id__in=chunk).update(import_token=self.token)
+        self._changed_ids.update(changed_ids)
+        self._changed_category_ids.update(category_ids)
+
+    def _touch_cache(self):
+        """
+        Увеличивает версии кэша каталога для записанных продуктов и категорий.
+        Вызывается после фиксации транзакции.
+        """
+        if self._changed_ids:
+            catalog_cache.touch_products(self._changed_ids, catalog_cache.LISTING, catalog_cache.PARAMETERS,
+                                         catalog_cache.SEARCH)
+        if self._changed_category_ids:
+            catalog_cache.touch_categories(self._changed_category_ids, catalog_cache.CATEGORIES)
+        self._changed_ids, self._changed_category_ids = set(), set()
+
+    # подготовка
+
+    def _load_sellers(self, goods):
+        seller_ids = set()
+        for raw in goods:
+            if isinstance(raw, dict) and 'seller_id' in raw:
+                try:
+                    seller_ids.add(int(raw['seller_id']))
+                except (TypeError, ValueError):
+                    pass
+        return MarketUser.objects.in_bulk(seller_ids) if seller_ids else {}
+
+    def _normalize(self, raw, sellers, category_id_to_name_map):
+        """
+        Приводит товар прайс-листа к данным для AddProductImportSerializer.
+        Возвращает кортеж (id продавца, название, данные, исходный товар,
+        (id товара в прайс-листе, хэш данных) или None, если у товара нет id,
+        (id категории в прайс-листе, ее название) или None)
+        или None, если товар содержит ошибку.
+        """
+        if not isinstance(raw, dict):
+            self.errors.append({"item": raw, "error": "Элемент списка 'goods' должен быть словарем."})
+            return None
+        item_data = raw.copy()
+
+        # Определяем продавца для этого продукта
+        if 'seller_id' in item_data:
+            try:
+                seller = sellers.get(int(item_data['seller_id']))
+            except (TypeError, ValueError):
+                seller = None
+            if seller is None:
+                self.errors.append({"item": raw, "error": f"Продавец с ID {item_data['seller_id']} не найден."})
+                return None
+        elif self.user is not None:
+            seller = self.user
+        else:
+            self.errors.append({"item": raw, "error": "Продавец не указан в YAML и пользователь не аутентифицирован."})
+            return None
+
+        # Преобразование параметров: из словаря в список {'name': ..., 'value': ...}
+        parameters = item_data.get('parameters')
+        if parameters is not None and not isinstance(parameters, dict):
+            self.errors.append({"item": raw, "error": "Поле 'parameters' должно быть словарем."})
+            return None
+        item_data['parameters'] = [{'name': name, 'value': str(value)} for name, value in (parameters or {}).items()]
+
+        # Преобразование категорий: из ID в список названий;
+        # табличные форматы передают названия категорий в списке categories
+        categories = item_data.get('categories')
+        item_data['categories'] = [str(name) for name in categories] if isinstance(categories, list) else []
+        external_category = None
+        if 'category' in item_data:
+            category = item_data['category']
+            if isinstance(category, dict):
+                # категория, указанная в самом товаре: {'id': ..., 'name': ...}
+                category_id, category_name = category.get('id'), category.get('name')
+            else:
+                category_id, category_name = category, category_id_to_name_map.get(category)
+            if category_name:
+                # сериализатор обрезает пробелы в названиях категорий, соответствие ищем по тому же названию
+                category_name = str(category_name).strip()
+                item_data['categories'].append(category_name)
+                if category_id is not None:
+                    external_category = str(category_id), category_name
+            else:
+                # товар все равно импортируется, но без категории
+                self.errors.append({"item": raw, "error": f"Категория с ID {item_data['category']} не найдена в верхнеуровневом списке категорий."})
+
+        external_id = item_data.get('id')
+
+        # Удаляем поля, которые не соответствуют модели Product напрямую
+        for field in ('id', 'model', 'price_rrc', 'category', 'seller_id'):
+            item_data.pop(field, None)
+
+        if 'name' not in item_data:
+            self.errors.append({"item": raw, "error": "Отсутствует обязательное поле 'name' для продукта."})
+            return None
+        # сериализатор обрезает пробелы в названии, продукт ищем по тому же названию
+        if isinstance(item_data['name'], str):
+            item_data['name'] = item_data['name'].strip()
+        fingerprint = None
+        if external_id is not None:
+            content = json.dumps(item_data, sort_keys=True, ensure_ascii=False, default=str)
+            fingerprint = str(external_id), hashlib.md5(content.encode('utf-8')).hexdigest()
+        return seller.pk, item_data['name'], item_data, raw, fingerprint, external_category
+
+    def _skip_unchanged(self, candidates):
+        """
+        Отбрасывает товары, данные которых не изменились с прошлого импорта.
+        Записи о встреченных в прайс-листе товарах отмечаются текущей меткой импорта.
+        Возвращает оставшиеся товары и id продуктов пропущенных товаров.
+        """
+        keys = {(seller_id, fingerprint[0]) for seller_id, _, _, _, fingerprint, _ in candidates if fingerprint}
+        if not keys:
+            return candidates, []
+        external_ids_by_seller = {}
+        for seller_id, external_id in keys:
+            external_ids_by_seller.setdefault(seller_id, []).append(external_id)
+        stored = {}
+        for seller_id, external_ids in external_ids_by_seller.items():
+            for chunk in _chunks(external_ids):
+                for pk, external_id, content_hash, product_id in ImportedItem.objects.filter(
+                        seller_id=seller_id, external_id__in=chunk).values_list('id', 'external_id', 'content_hash', 'product_id'):
+                    stored[(seller_id, external_id)] = pk, content_hash, product_id
+
+        pending, seen, unchanged_product_ids = [], [], []
+        for candidate in candidates:
+            seller_id, fingerprint = candidate[0], candidate[4]
+            entry = stored.get((seller_id, fingerprint[0])) if fingerprint else None
+            if entry is not None:
+                # товар есть в прайс-листе, даже если не пройдет проверку
+                seen.append(entry[0])
+            if entry is not None and entry[1] == fingerprint[1]:
+                self.unchanged_count += 1
+                unchanged_product_ids.append(entry[2])
+            else:
+                pending.append(candidate)
+        if self.dry_run and self.replace:
+            self._dry_run_seen_item_ids.update(seen)
+        for chunk in _chunks(seen):
+            ImportedItem.objects.filter(id__in=chunk).update(import_token=self.token)
+        return pending, unchanged_product_ids
+
+    def _load_products(self, keys):
+        """
+        Загружает существующие продукты по парам (id продавца, название).
+        """
+        names_by_seller = {}
+        for seller_id, name in keys:
+            names_by_seller.setdefault(seller_id, []).append(name)
+        products = {}
+        for seller_id, names in names_by_seller.items():
+            for chunk in _chunks(names):
+                for product in Product.objects.filter(seller_id=seller_id, name__in=chunk):
+                    products[(product.seller_id, product.name)] = product
+        return products
+
+    def _validate(self, candidates, existing):
+        """
+        Проверяет товары сериализатором. Повторное упоминание продукта
+        в прайс-листе обновляет данные, подготовленные для него ранее.
+
+        Первые упоминания продуктов проверяются вместе (см. _validate_all);
+        повторные зависят от результата проверки предыдущих и проверяются
+        по порядку в текущем процессе.
+        """
+        first = {}
+        for index, (seller_id, name, *_) in enumerate(candidates):
+            first.setdefault((seller_id, name), index)
+        results = dict(zip(first.values(), self._validate_all(
+            [(candidates[index][2], key in existing or key in self._dry_run_created) for key, index in first.items()])))
+
+        items = {}
+        for index, (seller_id, name, item_data, raw, fingerprint, external_category) in enumerate(candidates):
+            key = (seller_id, name)
+            exists = key in existing or key in items or key in self._dry_run_created
+            valid, result = results[index] if index in results else validate_item(item_data, exists)
+            if not valid:
+                self.errors.append({"item": raw, "error": result})
+                continue
+            fields, parameters, categories = result
+            item = ImportItem(seller_id, name, fields, parameters, categories, [fingerprint] if fingerprint else [],
+                              external_category)
+            if key in items:
+                # поля дополняются, параметры и категории заменяются, как при обновлении
+                item.fields = {**items[key].fields, **item.fields}
+                item.fingerprints = items[key].fingerprints + item.fingerprints
+            elif key in self._dry_run_created and key not in existing:
+                item.fields = {**self._dry_run_created[key], **item.fields}
+            items[key] = item
+            if exists:
+                self.updated_count += 1
+            else:
+                self.imported_count += 1
+        if self.dry_run:
+            self._dry_run_created.update((key, item.fields) for key, item in items.items() if key not in existing)
+        return list(items.values())
+
+    # запись
+
+    def _load_categories(self, names):
+        """
+        Возвращает словарь {название: id категории}, создавая недостающие категории.
+        """
+        categories = {}
+        for chunk in _chunks(names):
+            categories.update(Category.objects.filter(name__in=chunk).values_list('name', 'id'))
+        missing = [name for name in names if name not in categories]
+        if missing:
+            Category.objects.bulk_create([Category(name=name) for name in missing],
+                                         batch_size=BATCH_SIZE, ignore_conflicts=True)
+            for chunk in _chunks(missing):
+                categories.update(Category.objects.filter(name__in=chunk).values_list('name', 'id'))
+        return categories
+
+    def _load_category_mappings(self, seller_ids):
+        """
+        Загружает сохраненные соответствия категорий продавцов,
+        которые еще не встречались в этом импорте.
+        """
+        seller_ids = set(seller_ids) - self._mapped_seller_ids
+        if not seller_ids:
+            return
+        self._mapped_seller_ids |= seller_ids
+        for seller_id, external_id, category_id in CategoryMapping.objects.filter(
+                seller_id__in=seller_ids).values_list('seller_id', 'external_id', 'category_id'):
+            self._category_mappings[(seller_id, external_id)] = category_id
+
+    def _resolve_categories(self, items):
+        """
+        Заполняет id категорий каталога товаров (ImportItem.category_ids).
+        Категория прайс-листа с сохраненным соответствием берется из него,
+        остальные категории ищутся и создаются по названию, а соответствия
+        для новых категорий прайс-листа сохраняются одним запросом.
+        """
+        self._load_category_mappings({item.seller_id for item in items})
+        mapped = {}
+        for item in items:
+            if item.external_category is not None:
+                category_id = self._category_mappings.get((item.seller_id, item.external_category[0]))
+                if category_id is not None:
+                    mapped[item] = category_id
+        category_map = self._load_categories(sorted({
+            name for item in items for name in item.categories
+            if item not in mapped or name != item.external_category[1]}))
+
+        new_mappings = {}
+        for item in items:
+            category_ids = [mapped[item] if item in mapped and name == item.external_category[1] else category_map[name]
+                            for name in item.categories]
+            item.category_ids = list(dict.fromkeys(category_ids))
+            if item.external_category is not None and item not in mapped:
+                new_mappings[(item.seller_id, item.external_category[0])] = category_map[item.external_category[1]]
+        if new_mappings:
+            CategoryMapping.objects.bulk_create(
+                [CategoryMapping(seller_id=seller_id, external_id=external_id, category_id=category_id)
+                 for (seller_id, external_id), category_id in new_mappings.items()],
+                batch_size=BATCH_SIZE, ignore_conflicts=True)
+            self._category_mappings.update(new_mappings)
+
+    def _load_relations(self, product_ids):
+        """
+        Загружает параметры и категории существующих продуктов.
+        """
+        parameters, links = {}, {}
+        through = Category.products.through
+        for chunk in _chunks(product_ids):
+            for parameter in Parameters.objects.filter(product_id__in=chunk):
+                parameters.setdefault(parameter.product_id, {})[parameter.parameter_name_id] = parameter
+            for product_id, category_id in through.objects.filter(product_id__in=chunk).values_list('product_id', 'category_id'):
+                links.setdefault(product_id, set()).add(category_id)
+        return parameters, links
+
+    def _write(self, items, existing):
+        """
+        Записывает изменения. Возвращает id созданных и измененных
+        продуктов и id категорий, состав которых изменился.
+        """
+        now = timezone.now()
+        with self.stage('write'):
+            self._resolve_categories(items)
+            name_ids = ParameterName.objects.ids_for(
+                sorted({name for item in items for name in item.parameters}), self._parameter_name_ids)
+
+            # новые продукты
+            new_items = [item for item in items if item.key not in existing]
+            new_products = []
+            for item in new_items:
+                product = Product(seller_id=item.seller_id, name=item.name, **{'description': '', **item.fields})
+                if product.quantity == 0:
+                    product.is_available = False
+                new_products.append(product)
+            Product.objects.bulk_create(new_products, batch_size=BATCH_SIZE)
+            for product, item in zip(new_products, new_items):
+                item.product_id = product.id
+
+        with self.stage('diff'):
+            # существующие продукты: сравниваем поля, параметры и категории
+            current_parameters, current_links = self._load_relations([product.id for product in existing.values()])
+            changed_products = []
+            new_parameters, changed_parameters, removed_parameters = [], [], []
+            new_links, removed_links = [], []
+            relations_changed = set()
+            category_ids = set()
+
+            for item in items:
+                product = existing.get(item.key)
+                if product is None:
+                    continue
+                item.product_id = product.id
+                changed = False
+                for field, value in item.fields.items():
+                    if getattr(product, field) != value:
+                        setattr(product, field, value)
+                        changed = True
+                if product.quantity == 0 and product.is_available:
+                    product.is_available = False
+                    changed = True
+
+                parameters = current_parameters.get(product.id, {})
+                for name, (value, numeric_value, unit) in item.parameters.items():
+                    parameter = parameters.get(name_ids[name])
+                    if parameter is None:
+                        new_parameters.append(Parameters(product_id=product.id, parameter_name_id=name_ids[name], value=value,
+                                                         numeric_value=numeric_value, unit=unit))
+                    elif parameter.value != value:
+                        parameter.value, parameter.numeric_value, parameter.unit = value, numeric_value, unit
+                        changed_parameters.append(parameter)
+                    else:
+                        continue
+                    relations_changed.add(product.id)
+                wanted_names = {name_ids[name] for name in item.parameters}
+                for name_id, parameter in parameters.items():
+                    if name_id not in wanted_names:
+                        removed_parameters.append(parameter.id)
+                        relations_changed.add(product.id)
+
+                links = current_links.get(product.id, set())
+                wanted = set(item.category_ids)
+                for category_id in wanted - links:
+                    new_links.append((product.id, category_id))
+                for category_id in links - wanted:
+                    removed_links.append((product.id, category_id))
+                if wanted != links:
+                    relations_changed.add(product.id)
+                    category_ids |= wanted ^ links
+
+                if changed or product.id in relations_changed:
+                    product.updated_at = now
+                    changed_products.append(product)
+
+        with self.stage('write'):
+            Product.objects.bulk_update(changed_products, PRODUCT_FIELDS + ('is_available', 'updated_at'), batch_size=BATCH_SIZE)
+            # корзины с продуктами, цена которых изменилась, пересчитываются по новым ценам
+            for chunk in _chunks([product.id for product in changed_products]):
+                CartProduct.objects.filter(product_id__in=chunk).reprice()
+
+            # параметры и категории новых продуктов
+            for product, item in zip(new_products, new_items):
+                for name, (value, numeric_value, unit) in item.parameters.items():
+                    new_parameters.append(Parameters(product_id=product.id, parameter_name_id=name_ids[name], value=value,
+                                                     numeric_value=numeric_value, unit=unit))
+                for category_id in item.category_ids:
+                    new_links.append((product.id, category_id))
+                    category_ids.add(category_id)
+
+            through = Category.products.through
+            with facets.track_facets(relations_changed):
+                for chunk in _chunks(removed_parameters):
+                    # удаление без загрузки объектов и сигналов: индекс и кэш обновляются ниже для всех продуктов сразу
+                    Parameters.objects.filter(id__in=chunk)._raw_delete(Parameters.objects.db)
+                for chunk in _chunks(removed_links):
+                    through.objects.filter(reduce(or_, [Q(product_id=p, category_id=c) for p, c in chunk])).delete()
+                Parameters.objects.bulk_update(changed_parameters, ['value', 'numeric_value', 'unit'], batch_size=BATCH_SIZE)
+                Parameters.objects.bulk_create(new_parameters, batch_size=BATCH_SIZE)
+                through.objects.bulk_create([through(product_id=p, category_id=c) for p, c in new_links], batch_size=BATCH_SIZE)
+            facets.add_products([product.id for product in new_products])
+
+            changed_ids = [product.id for product in new_products] + [product.id for product in changed_products]
+            search.index_products(changed_ids)
+        return changed_ids, category_ids
+
+    def _save_fingerprints(self, items):
+        """
+        Сохраняет хэши данных записанных товаров.
+        """
+        rows = {}
+        for item in items:
+            for external_id, content_hash in item.fingerprints:
+                rows[(item.seller_id, external_id)] = ImportedItem(
+                    seller_id=item.seller_id, external_id=external_id, product_id=item.product_id,
+                    content_hash=content_hash, import_token=self.token)
+        ImportedItem.objects.bulk_create(
+            rows.values(), batch_size=BATCH_SIZE, update_conflicts=True,
+            unique_fields=['seller', 'external_id'], update_fields=['product', 'content_hash', 'import_token'])
+
+    def _forget_removed(self):
+        """
+        Режим замены: удаляет записи о товарах продавцов, которых нет
+        в прайс-листе, чтобы при появлении в следующем импорте они были
+        обработаны заново. В режиме обновления файл может содержать только
+        часть каталога, поэтому отсутствующие в нем товары не забываются.
+        """
+        if self.seller_ids:
+            removed = ImportedItem.objects.filter(seller_id__in=self.seller_ids).exclude(import_token=self.token)
+            self.removed_count, _ = removed.delete()
+
+    def _count_missing(self):
+        """
+        Пробный импорт в режиме замены: метки импорта откатаны вместе с порциями,
+        поэтому продукты, которые были бы сняты с продажи, и записи о товарах,
+        которые были бы забыты, считаются по id, встреченным в прайс-листе.
+        """
+        if not self.seller_ids:
+            return
+        available = Product.objects.filter(seller_id__in=self.seller_ids, is_available=True).values_list('id', flat=True)
+        self.deactivated_count = sum(1 for product_id in available.iterator() if product_id not in self._dry_run_present_ids)
+        items = ImportedItem.objects.filter(seller_id__in=self.seller_ids).values_list('id', flat=True)
+        self.removed_count = sum(1 for item_id in items.iterator() if item_id not in self._dry_run_seen_item_ids)
+
+    def _deactivate_missing(self):
+        """
+        Режим замены: снимает с продажи продукты продавцов, отсутствующие
+        в прайс-листе, одним запросом UPDATE и возвращает в продажу
+        снятые прошлыми импортами продукты, которые снова есть в нем
+        с ненулевым количеством. Продукты, снятые с продажи продавцом,
+        остаются снятыми.
+        """
+        if not self.seller_ids:
+            return
+        now = timezone.now()
+        products = Product.objects.filter(seller_id__in=self.seller_ids)
+        missing = products.exclude(import_token=self.token).filter(is_available=True)
+        returned = products.filter(import_token=self.token, delisted_by_import=True, is_available=False, quantity__gt=0)
+        # id нужны только для версий кэша каталога
+        self._changed_ids.update(missing.values_list('id', flat=True))
+        self._changed_ids.update(returned.values_list('id', flat=True))
+        self.deactivated_count = missing.update(is_available=False, delisted_by_import=True, updated_at=now)
+        returned.update(is_available=True, delisted_by_import=False, updated_at=now)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from Products import cache as catalog_cache
+
+
+class Command(BaseCommand):
+    help = ('Показывает счетчики попаданий и промахов кэша ответов каталога. '
+            'Счетчики хранятся в кэше CATALOG_CACHE, поэтому видны из команды только для общего кэша (например, Redis).')
+
+    def handle(self, *args, **options):
+        counters = catalog_cache.stats()
+        total = counters['hits'] + counters['misses']
+        ratio = counters['hits'] / total * 100 if total else 0
+        self.stdout.write(f"Попаданий: {counters['hits']}, промахов: {counters['misses']}, доля попаданий: {ratio:.1f}%")
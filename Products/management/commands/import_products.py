@@ -0,0 +1,157 @@
+import json
+import os
+import time
+from contextlib import ExitStack
+from itertools import chain, islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Products import pricelists
+from Products.importer import CatalogImporter
+from Users.models import MarketUser
+
+
+def goods_with_categories(price_list):
+    """
+    Товары прайс-листа, в которых id категории из списка categories файла
+    заменен категорией {'id': ..., 'name': ...} из этого же файла, чтобы товары
+    нескольких файлов можно было импортировать одним потоком, сохраняя
+    соответствие категорий продавца (CategoryMapping).
+    """
+    categories = {cat['id']: cat for cat in price_list.categories
+                  if isinstance(cat, dict) and 'id' in cat and 'name' in cat}
+    for item in price_list.goods():
+        if isinstance(item, dict) and not isinstance(item.get('category'), (dict, list)) \
+                and item.get('category') in categories:
+            category = categories[item['category']]
+            item = {**item, 'category': {'id': category['id'], 'name': category['name']}}
+        yield item
+
+
+class Command(BaseCommand):
+    help = ('Импортирует прайс-листы из файлов или каталогов тем же конвейером, что и Products/import/. '
+            'Все файлы импортируются как один прайс-лист порциями, после каждой порции обновляется '
+            'файл контрольной точки, поэтому прерванный импорт при повторном запуске продолжается '
+            'с места остановки. С --dry-run каждая порция записывается в транзакции, которая '
+            'сразу откатывается, и выводится отчет о возможных изменениях и время этапов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Файлы прайс-листов или каталоги с ними.')
+        parser.add_argument('--seller', help='Id или имя продавца для товаров без seller_id.')
+        parser.add_argument('--mode', choices=['update', 'replace'], default='update',
+                            help='Режим импорта: update - создание и обновление продуктов, '
+                                 'replace - файлы являются полным каталогом продавца.')
+        parser.add_argument('--checkpoint', default='import_products.checkpoint.json',
+                            help='Файл контрольной точки (удаляется после успешного импорта).')
+        parser.add_argument('--restart', action='store_true',
+                            help='Начать импорт заново, не используя контрольную точку.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Пробный импорт: изменения не сохраняются, контрольная точка не используется.')
+
+    def handle(self, *args, **options):
+        seller = self._get_seller(options['seller'])
+        files = self._collect_files(options['paths'])
+        checkpoint_path = options['checkpoint']
+        replace = options['mode'] == 'replace'
+        dry_run = options['dry_run']
+
+        # контрольная точка действительна для того же набора неизмененных файлов
+        signature = [[path, os.stat(path).st_size, os.stat(path).st_mtime] for path in files] + [options['mode']]
+        checkpoint = None if options['restart'] or dry_run else self._read_checkpoint(checkpoint_path)
+        if checkpoint is None or checkpoint['signature'] != signature:
+            checkpoint = {'signature': signature, 'processed': 0, 'token': None}
+        # в режиме замены импорт продолжается с начала файлов с меткой прерванного
+        # импорта: записанные порции пропускаются по хэшу данных, а продавцы всех
+        # товаров нужны для снятия с продажи; пробный импорт ничего не сохраняет
+        skip = 0 if replace or dry_run else checkpoint['processed']
+        started = time.monotonic()
+
+        def save_progress(importer):
+            checkpoint['processed'] = importer.processed
+            if not dry_run:
+                self._write_checkpoint(checkpoint_path, checkpoint)
+            elapsed = time.monotonic() - started
+            rate = (importer.processed - skip) / elapsed if elapsed else 0
+            self.stdout.write(f"{importer.processed}/{importer.total} товаров, {rate:.0f} товаров/с")
+
+        # метка импорта сохраняется, чтобы продолженный импорт не счел
+        # товары, записанные до прерывания, отсутствующими в файлах
+        importer = CatalogImporter(user=seller, progress=save_progress, replace=replace, token=checkpoint['token'],
+                                   dry_run=dry_run)
+        with ExitStack() as stack:
+            price_lists = []
+            for path in files:
+                stream = stack.enter_context(open(path, 'rb'))
+                try:
+                    with importer.stage('parse'):
+                        price_lists.append(pricelists.reader_for(path)(stream))
+                except pricelists.PriceListError as e:
+                    raise CommandError(f"{path}: {e}")
+                self.stdout.write(f"{path}: {price_lists[-1].total} товаров")
+
+            checkpoint['token'] = importer.token
+            if not dry_run:
+                self._write_checkpoint(checkpoint_path, checkpoint)
+            if skip:
+                self.stdout.write(f"Продолжаем после {skip} товаров")
+
+            goods = chain.from_iterable(goods_with_categories(price_list) for price_list in price_lists)
+            importer.processed = skip
+            try:
+                report = importer.run([], islice(goods, skip, None), total=sum(price_list.total for price_list in price_lists))
+            except pricelists.PriceListError as e:
+                raise CommandError(str(e))
+
+        if not dry_run:
+            os.remove(checkpoint_path)
+        title = "Пробный импорт завершен, изменения не сохранены" if dry_run else "Импорт завершен"
+        self.stdout.write(self.style.SUCCESS(
+            f"{title}: создано {report['imported_count']}, обновлено {report['updated_count']}, "
+            f"без изменений {report['unchanged_count']}, отсутствует в файлах {report['removed_count']}, "
+            f"снято с продажи {report['deactivated_count']}, ошибок {len(report['errors'])}"))
+        timings = report['timings']
+        self.stdout.write(
+            f"Время, с: чтение {timings['parse']}, проверка {timings['validate']}, сравнение {timings['diff']}, "
+            f"запись {timings['write']}, всего {timings['total']} ({timings['items_per_second']} товаров/с)")
+        if options['verbosity'] > 1:
+            for error in report['errors']:
+                self.stdout.write(self.style.WARNING(json.dumps(error, ensure_ascii=False, default=str)))
+
+    def _get_seller(self, value):
+        if value is None:
+            return None
+        lookup = {'id': value} if value.isdigit() else {'username': value}
+        try:
+            return MarketUser.objects.get(**lookup)
+        except MarketUser.DoesNotExist:
+            raise CommandError(f"Продавец {value} не найден.")
+
+    def _collect_files(self, paths):
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(sorted(
+                    os.path.abspath(os.path.join(root, name))
+                    for root, _, names in os.walk(path) for name in names
+                    if pricelists.reader_for(name) is not None))
+            elif os.path.isfile(path):
+                if pricelists.reader_for(path) is None:
+                    raise CommandError(f"{path}: неподдерживаемый формат, ожидается один из {', '.join(pricelists.FORMATS)}.")
+                files.append(os.path.abspath(path))
+            else:
+                raise CommandError(f"{path}: файл или каталог не найден.")
+        if not files:
+            raise CommandError("Не найдено ни одного прайс-листа.")
+        return files
+
+    def _read_checkpoint(self, path):
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as checkpoint_file:
+            return json.load(checkpoint_file)
+
+    def _write_checkpoint(self, path, checkpoint):
+        # запись через временный файл, чтобы прерывание не оставило поврежденную контрольную точку
+        with open(path + '.tmp', 'w', encoding='utf-8') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Создает виртуальную таблицу SQLite FTS5 для полнотекстового поиска
+    по названию, описанию и параметрам продуктов и заполняет ее
+    существующими данными.
+    """
+
+    dependencies = [
+        ('Products', '0007_product_name_id_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                """
+                CREATE VIRTUAL TABLE products_fts USING fts5(
+                    name, description, parameters,
+                    tokenize = 'unicode61 remove_diacritics 2',
+                    prefix = '2 3 4'
+                )
+                """,
+                """
+                INSERT INTO products_fts (rowid, name, description, parameters)
+                SELECT p.id, p.name, COALESCE(p.description, ''),
+                       COALESCE((SELECT group_concat(pr.name || ' ' || COALESCE(pr.value, ''), ' ')
+                                 FROM "Products_parameters" pr WHERE pr.product_id = p.id), '')
+                FROM "Products_product" p
+                """,
+            ],
+            reverse_sql='DROP TABLE products_fts',
+        ),
+    ]
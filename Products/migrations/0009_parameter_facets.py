@@ -0,0 +1,62 @@
+# Generated by Django 5.2.3 on 2026-10-17 21:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_facets(apps, schema_editor):
+    """
+    Первичное заполнение счетчиков фасетов по существующим параметрам.
+    """
+    Parameters = apps.get_model('Products', 'Parameters')
+    ParameterFacet = apps.get_model('Products', 'ParameterFacet')
+    rows = (
+        Parameters.objects.filter(product__categories__isnull=False)
+        .values_list('product__categories', 'name', 'value')
+        .annotate(count=Count('product', distinct=True))
+        .order_by()
+    )
+    ParameterFacet.objects.bulk_create(
+        [ParameterFacet(category_id=category_id, name=name, value=value or '', count=count)
+         for category_id, name, value, count in rows],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Products', '0008_products_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Название параметра')),
+                ('value', models.CharField(blank=True, default='', max_length=255, verbose_name='Значение параметра')),
+                ('count', models.IntegerField(default=0, verbose_name='Количество продуктов')),
+            ],
+            options={
+                'verbose_name': 'Фасет параметра',
+                'verbose_name_plural': 'Фасеты параметров',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='parameters',
+            index=models.Index(fields=['name', 'value', 'product'], name='parameters_name_value_idx'),
+        ),
+        migrations.AddField(
+            model_name='parameterfacet',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='Products.category', verbose_name='Категория'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='parameterfacet',
+            unique_together={('category', 'name', 'value')},
+        ),
+        migrations.RunPython(fill_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.3 on 2026-10-17 21:07
+
+import re
+
+from django.db import migrations, models
+
+
+# копия разбора из Products.models на момент миграции: миграция не должна
+# зависеть от последующих изменений кода модели
+NUMERIC_VALUE_RE = re.compile(r'^\s*([-+]?\d+(?:[.,]\d+)?)\s*([^\d]*?)\s*$')
+NAME_UNIT_RE = re.compile(r'\(([^()\d]+)\)\s*$')
+
+
+def parse_numeric_value(value, name=None):
+    """
+    Разбирает строковое значение параметра на число и единицу измерения.
+    Если в значении нет единицы, она берется из скобок в названии параметра.
+    Возвращает кортеж (число или None, единица измерения или '').
+    """
+    match = NUMERIC_VALUE_RE.match(str(value)) if value is not None else None
+    if match is None:
+        return None, ''
+    unit = match.group(2)
+    if not unit and name:
+        name_match = NAME_UNIT_RE.search(name)
+        unit = name_match.group(1).strip() if name_match else ''
+    return float(match.group(1).replace(',', '.')), unit[:32]
+
+
+def fill_numeric_values(apps, schema_editor):
+    """
+    Разбирает числовые значения уже существующих параметров.
+    """
+    Parameters = apps.get_model('Products', 'Parameters')
+    changed = []
+    for parameter in Parameters.objects.only('id', 'name', 'value').iterator(chunk_size=2000):
+        parameter.numeric_value, parameter.unit = parse_numeric_value(parameter.value, parameter.name)
+        if parameter.numeric_value is not None or parameter.unit:
+            changed.append(parameter)
+    Parameters.objects.bulk_update(changed, ['numeric_value', 'unit'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Products', '0009_parameter_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parameters',
+            name='numeric_value',
+            field=models.FloatField(blank=True, null=True, verbose_name='Числовое значение параметра'),
+        ),
+        migrations.AddField(
+            model_name='parameters',
+            name='unit',
+            field=models.CharField(blank=True, default='', max_length=32, verbose_name='Единица измерения'),
+        ),
+        migrations.AddIndex(
+            model_name='parameters',
+            index=models.Index(fields=['name', 'numeric_value', 'product'], name='parameters_name_numeric_idx'),
+        ),
+        migrations.RunPython(fill_numeric_values, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-17 21:32
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Products', '0011_category_updated_at'),
+        ('Users', '0005_alter_marketuser_avatar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(upload_to='imports/', verbose_name='Файл прайс-листа')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает обработки'), ('running', 'Выполняется'), ('done', 'Завершено'), ('failed', 'Ошибка')], default='pending', max_length=16, verbose_name='Состояние')),
+                ('total', models.IntegerField(default=0, verbose_name='Количество товаров')),
+                ('processed', models.IntegerField(default=0, verbose_name='Обработано товаров')),
+                ('imported_count', models.IntegerField(default=0, verbose_name='Создано продуктов')),
+                ('updated_count', models.IntegerField(default=0, verbose_name='Обновлено продуктов')),
+                ('errors', models.JSONField(blank=True, default=list, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Ошибки')),
+                ('message', models.TextField(blank=True, default='', verbose_name='Сообщение')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата завершения')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to='Users.marketuser', verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Задание импорта',
+                'verbose_name_plural': 'Задания импорта',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
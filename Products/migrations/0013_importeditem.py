@@ -0,0 +1,41 @@
+# Generated by Django 5.2.3 on 2026-10-17 21:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Products', '0012_importjob'),
+        ('Users', '0005_alter_marketuser_avatar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='removed_count',
+            field=models.IntegerField(default=0, verbose_name='Товаров, отсутствующих в файле'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='unchanged_count',
+            field=models.IntegerField(default=0, verbose_name='Товаров без изменений'),
+        ),
+        migrations.CreateModel(
+            name='ImportedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_id', models.CharField(max_length=255, verbose_name='Id товара в прайс-листе')),
+                ('content_hash', models.CharField(max_length=32, verbose_name='Хэш данных товара')),
+                ('import_token', models.CharField(blank=True, default='', max_length=32, verbose_name='Метка импорта')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='imported_items', to='Products.product', verbose_name='Продукт')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='imported_items', to='Users.marketuser', verbose_name='Продавец')),
+            ],
+            options={
+                'verbose_name': 'Импортированный товар',
+                'verbose_name_plural': 'Импортированные товары',
+                'unique_together': {('seller', 'external_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-17 21:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Products', '0013_importeditem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='deactivated_count',
+            field=models.IntegerField(default=0, verbose_name='Снято с продажи продуктов'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='mode',
+            field=models.CharField(choices=[('update', 'Создание и обновление продуктов'), ('replace', 'Замена каталога продавца')], default='update', max_length=16, verbose_name='Режим импорта'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='import_token',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32, verbose_name='Метка импорта'),
+        ),
+    ]
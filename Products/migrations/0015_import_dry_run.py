@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Products', '0014_import_replace_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='dry_run',
+            field=models.BooleanField(default=False, verbose_name='Пробный импорт'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='timings',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Время этапов'),
+        ),
+    ]
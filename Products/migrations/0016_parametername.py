@@ -0,0 +1,101 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_parameter_names(apps, schema_editor):
+    """
+    Переносит названия существующих параметров в справочник ParameterName.
+    """
+    ParameterName = apps.get_model('Products', 'ParameterName')
+    Parameters = apps.get_model('Products', 'Parameters')
+    names = list(Parameters.objects.order_by().values_list('name', flat=True).distinct())
+    ParameterName.objects.bulk_create([ParameterName(name=name) for name in names], batch_size=1000)
+    # одно UPDATE на каждое название вместо обновления каждой строки
+    for name, name_id in ParameterName.objects.values_list('name', 'id'):
+        Parameters.objects.filter(name=name).update(parameter_name_id=name_id)
+
+
+def fill_names(apps, schema_editor):
+    """
+    Возвращает названия из справочника в строки параметров.
+    """
+    ParameterName = apps.get_model('Products', 'ParameterName')
+    Parameters = apps.get_model('Products', 'Parameters')
+    for name, name_id in ParameterName.objects.values_list('name', 'id'):
+        Parameters.objects.filter(parameter_name_id=name_id).update(name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Products', '0015_import_dry_run'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterName',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Название параметра')),
+            ],
+            options={
+                'verbose_name': 'Название параметра',
+                'verbose_name_plural': 'Названия параметров',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='parameters',
+            name='parameter_name',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='parameters',
+                                    to='Products.parametername', verbose_name='Название параметра'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='parameters',
+            unique_together=set(),
+        ),
+        migrations.RemoveIndex(
+            model_name='parameters',
+            name='parameters_name_value_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='parameters',
+            name='parameters_name_numeric_idx',
+        ),
+        migrations.RunPython(fill_parameter_names, fill_names),
+        # значение по умолчанию только в состоянии миграций: при откате
+        # столбец name добавляется к существующим строкам и заполняется fill_names
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='parameters',
+                    name='name',
+                    field=models.CharField(default='', max_length=255, verbose_name='Название параметра'),
+                ),
+            ],
+        ),
+        migrations.RemoveField(
+            model_name='parameters',
+            name='name',
+        ),
+        migrations.AlterField(
+            model_name='parameters',
+            name='parameter_name',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='parameters',
+                                    to='Products.parametername', verbose_name='Название параметра'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='parameters',
+            unique_together={('parameter_name', 'product')},
+        ),
+        migrations.AddIndex(
+            model_name='parameters',
+            index=models.Index(fields=['parameter_name', 'value', 'product'], name='parameters_name_value_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parameters',
+            index=models.Index(fields=['parameter_name', 'numeric_value', 'product'], name='parameters_name_numeric_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Products', '0016_parametername'),
+        ('Users', '0005_alter_marketuser_avatar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryMapping',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_id', models.CharField(max_length=255, verbose_name='Id категории в прайс-листе')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mappings', to='Products.category', verbose_name='Категория')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_mappings', to='Users.marketuser', verbose_name='Продавец')),
+            ],
+            options={
+                'verbose_name': 'Соответствие категории прайс-листа',
+                'verbose_name_plural': 'Соответствия категорий прайс-листов',
+                'unique_together': {('seller', 'external_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:05
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_cart_totals(apps, schema_editor):
+    """
+    Запоминает текущие цены продуктов в позициях и считает итоги корзин.
+    """
+    Cart = apps.get_model('Products', 'Cart')
+    CartProduct = apps.get_model('Products', 'CartProduct')
+    Product = apps.get_model('Products', 'Product')
+    CartProduct.objects.update(price=models.Subquery(
+        Product.objects.filter(pk=models.OuterRef('product_id')).values('price')[:1]))
+    lines = CartProduct.objects.filter(cart=models.OuterRef('pk')).order_by().values('cart')
+    Cart.objects.update(
+        items_count=Coalesce(models.Subquery(lines.annotate(total=models.Sum('quantity')).values('total')), 0),
+        total_price=Coalesce(models.Subquery(lines.annotate(total=models.Sum(
+            models.F('price') * models.F('quantity'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2))).values('total')),
+            models.Value(0), output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Products', '0017_categorymapping'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество единиц товара'),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Стоимость корзины'),
+        ),
+        migrations.AddField(
+            model_name='cartproduct',
+            name='price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Цена'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_cart_totals, migrations.RunPython.noop),
+    ]
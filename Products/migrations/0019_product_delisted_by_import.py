@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Products', '0018_cart_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='delisted_by_import',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Снят с продажи импортом'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:28
+
+from django.db import migrations, models
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    """
+    Объединяет позиции одного продукта в корзине: количество суммируется
+    в первой позиции, остальные удаляются, стоимость корзины пересчитывается
+    по ценам оставшихся позиций.
+    """
+    Cart = apps.get_model('Products', 'Cart')
+    CartProduct = apps.get_model('Products', 'CartProduct')
+    duplicates = (CartProduct.objects.order_by().values('cart_id', 'product_id')
+                  .annotate(lines=models.Count('id'), total=models.Sum('quantity'), first=models.Min('id'))
+                  .filter(lines__gt=1))
+    cart_ids = set()
+    for row in duplicates:
+        CartProduct.objects.filter(pk=row['first']).update(quantity=row['total'])
+        CartProduct.objects.filter(cart_id=row['cart_id'], product_id=row['product_id']).exclude(pk=row['first']).delete()
+        cart_ids.add(row['cart_id'])
+    for cart_id in cart_ids:
+        amount = CartProduct.objects.filter(cart_id=cart_id).aggregate(amount=models.Sum(
+            models.F('price') * models.F('quantity'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)))['amount']
+        Cart.objects.filter(pk=cart_id).update(total_price=amount or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Products', '0019_product_delisted_by_import'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='cartproduct',
+            unique_together={('cart', 'product')},
+        ),
+    ]
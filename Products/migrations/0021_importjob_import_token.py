@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Products', '0020_cartproduct_unique_cart_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='import_token',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32, verbose_name='Метка импорта'),
+        ),
+    ]
@@ -1,6 +1,93 @@
-from django.db import models
+import re
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.utils import timezone
 from Users.models import MarketUser
 from easy_thumbnails.fields import ThumbnailerImageField
+from . import cache as catalog_cache
+
+
+class ProductQuerySet(models.QuerySet):
+    """
+    QuerySet продуктов с заготовками для чтения каталога.
+    """
+
+    def for_catalog(self):
+        """
+        Подгружает продавца, параметры и категории продуктов заранее,
+        чтобы сериализация списка любой длины выполнялась за постоянное
+        число запросов, а не по несколько запросов на каждый продукт.
+        """
+        return self.select_related('seller').prefetch_related(
+            models.Prefetch('parameters', queryset=Parameters.objects.select_related('parameter_name').order_by('id')),
+            models.Prefetch('categories', queryset=Category.objects.all()),
+        )
+
+    def with_parameters(self, predicates):
+        """
+        Оставляет продукты, у которых есть все указанные значения параметров.
+        predicates - список пар (название параметра, значение).
+        Каждое условие - подзапрос по индексу (parameter_name, value, product).
+        """
+        queryset = self
+        for name, value in predicates:
+            queryset = queryset.filter(id__in=Parameters.objects.filter(
+                parameter_name__name=name, value=value).values('product_id'))
+        return queryset
+
+    def touch(self, *scopes):
+        """
+        Отмечает продукты измененными без вызова save(): обновляет updated_at
+        (по нему считаются ETag и Last-Modified списков) и версии продуктов
+        в кэше каталога. Используется, когда меняются связанные данные,
+        которые выводятся вместе с продуктом (параметры, категории).
+        """
+        product_ids = list(self.values_list('id', flat=True))
+        self.model.objects.filter(id__in=product_ids).update(updated_at=timezone.now())
+        catalog_cache.touch_products(product_ids, *scopes)
+
+    def with_parameter_ranges(self, minimums=(), maximums=()):
+        """
+        Оставляет продукты, у которых числовое значение параметра попадает
+        в диапазон. minimums и maximums - списки пар (название параметра, граница).
+        Границы одного параметра объединяются в одно условие, которое
+        выполняется по индексу (parameter_name, numeric_value).
+        """
+        bounds = {}
+        for name, value in minimums:
+            bounds.setdefault(name, {})['numeric_value__gte'] = value
+        for name, value in maximums:
+            bounds.setdefault(name, {})['numeric_value__lte'] = value
+        queryset = self
+        for name, lookups in bounds.items():
+            queryset = queryset.filter(id__in=Parameters.objects.filter(
+                parameter_name__name=name, **lookups).values('product_id'))
+        return queryset
+
+
+# число в начале значения параметра и необязательная единица измерения без цифр:
+# "6.5", "512 ГБ", "-10,5 °C"; значения вроде "2688x1242" числом не считаются
+NUMERIC_VALUE_RE = re.compile(r'^\s*([-+]?\d+(?:[.,]\d+)?)\s*([^\d]*?)\s*$')
+# единица измерения в названии параметра: "Встроенная память (Гб)"
+NAME_UNIT_RE = re.compile(r'\(([^()\d]+)\)\s*$')
+
+
+def parse_numeric_value(value, name=None):
+    """
+    Разбирает строковое значение параметра на число и единицу измерения.
+    Если в значении нет единицы, она берется из скобок в названии параметра.
+    Возвращает кортеж (число или None, единица измерения или '').
+    """
+    match = NUMERIC_VALUE_RE.match(str(value)) if value is not None else None
+    if match is None:
+        return None, ''
+    unit = match.group(2)
+    if not unit and name:
+        name_match = NAME_UNIT_RE.search(name)
+        unit = name_match.group(1).strip() if name_match else ''
+    return float(match.group(1).replace(',', '.')), unit[:32]
 
 
 # модель продукта
@@ -15,6 +102,8 @@ class Product(models.Model):
     Поле created_at - дата создания
     Поле updated_at - дата обновления
     Поле seller - продавец продукта
+    Поле import_token - метка последнего импорта прайс-листа в режиме замены, в котором встречался продукт
+    Поле delisted_by_import - продукт снят с продажи импортом в режиме замены, а не продавцом
     """
     name = models.CharField(max_length=255, verbose_name="Название")
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена")
@@ -33,25 +122,54 @@ class Product(models.Model):
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
    
     seller = models.ForeignKey('Users.MarketUser', on_delete=models.CASCADE, null=True, related_name='products', verbose_name="Продавец")
+    import_token = models.CharField(max_length=32, blank=True, default='', editable=False, verbose_name="Метка импорта")
+    delisted_by_import = models.BooleanField(default=False, editable=False, verbose_name="Снят с продажи импортом")
 
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Продукт"
         verbose_name_plural = "Продукты"
-        ordering = ['name']
+        # id добавлен как уникальный второй ключ, чтобы порядок был полным
+        # и по нему работала курсорная пагинация каталога
+        ordering = ['name', 'id']
+        indexes = [
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+        ]
         # Уникальность (name, seller) позволяет идентифицировать продукт для обновления
         # без поля SKU, которое отсутствует в вашей модели.
         unique_together = ('name', 'seller')
 
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # запоминаем загруженное название, чтобы при сохранении понять,
+        # изменился ли порядок продукта в каталоге, и цену - чтобы понять,
+        # нужно ли пересчитывать корзины
+        instance._loaded_name = instance.__dict__.get('name')
+        instance._loaded_price = instance.__dict__.get('price')
+        return instance
+
     def save(self, *args, **kwargs):
         """
         Переопределенный метод save, который при изменении quantity до 0
         изменяет is_available на False.
+        При изменении цены переснимает цену продукта в позициях корзин
+        и сдвигает стоимость этих корзин (CartProductQuerySet.reprice).
+        Также увеличивает версию продукта в кэше каталога, а при создании
+        или переименовании - и версию полного списка продуктов.
         """
         if self.quantity == 0:
             self.is_available = False
-        super().save(*args, **kwargs)
+        listing_changed = self._state.adding or getattr(self, '_loaded_name', None) != self.name
+        price_changed = not self._state.adding and getattr(self, '_loaded_price', None) != self.price
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if price_changed:
+                CartProduct.objects.filter(product=self).reprice()
+        self._loaded_name, self._loaded_price = self.name, self.price
+        catalog_cache.touch_products([self.pk], *([catalog_cache.LISTING] if listing_changed else []))
 
     def __str__(self):
         """
@@ -94,23 +212,103 @@ class ProductImage(models.Model):
     
 
 # модель параметра продукта
+class ParameterNameManager(models.Manager):
+    def ids_for(self, names, cache=None):
+        """
+        Возвращает словарь {название: id} для названий параметров,
+        создавая недостающие. cache - словарь {название: id}, в котором
+        ищутся и сохраняются найденные id (например, на время импорта).
+        """
+        cache = {} if cache is None else cache
+        missing = [name for name in dict.fromkeys(names) if name not in cache]
+        self._load(missing, cache)
+        missing = [name for name in missing if name not in cache]
+        if missing:
+            # названия, созданные параллельно, пропускаются и загружаются повторным запросом
+            self.bulk_create([self.model(name=name) for name in missing], ignore_conflicts=True)
+            self._load(missing, cache)
+        return {name: cache[name] for name in names}
+
+    def _load(self, names, cache):
+        for start in range(0, len(names), 500):
+            cache.update(self.filter(name__in=names[start:start + 500]).values_list('name', 'id'))
+
+
+class ParameterName(models.Model):
+    """
+    Модель справочника названий параметров.
+    Поле name - название параметра
+
+    Параметры продуктов ссылаются на название по id, поэтому строка
+    названия хранится один раз, а не в каждой строке Parameters.
+    """
+    name = models.CharField(max_length=255, unique=True, verbose_name="Название параметра")
+
+    objects = ParameterNameManager()
+
+    class Meta:
+        verbose_name = "Название параметра"
+        verbose_name_plural = "Названия параметров"
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
 class Parameters(models.Model):
     """
     Модель параметра продукта.
-    Поле name - название параметра
+    Поле parameter_name - название параметра из справочника ParameterName
+    (свойство name возвращает и принимает само название)
     Поле value - значение параметра
     Поле product - продукт, к которому относится данный параметр
+    Поле numeric_value - числовое значение параметра, если value является числом
+    Поле unit - единица измерения числового значения
     """
-    name = models.CharField(max_length=255, verbose_name="Название параметра")
+    parameter_name = models.ForeignKey(ParameterName, on_delete=models.PROTECT, related_name='parameters',
+                                       verbose_name="Название параметра")
     value = models.CharField(max_length=255, blank=True, null=True, verbose_name="Значение параметра")
+    # заполняются автоматически из value, используются для фильтрации по диапазону
+    numeric_value = models.FloatField(blank=True, null=True, verbose_name="Числовое значение параметра")
+    unit = models.CharField(max_length=32, blank=True, default='', verbose_name="Единица измерения")
     # Связь с моделью Product
     product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, related_name='parameters', verbose_name="Продукт")
 
     class Meta:
         verbose_name = "Параметр"
         verbose_name_plural = "Параметры"
-        # Уникальность (name, product) для предотвращения дублирования параметров для одного продукта
-        unique_together = ('name', 'product')
+        # Уникальность (parameter_name, product) для предотвращения дублирования параметров для одного продукта
+        unique_together = ('parameter_name', 'product')
+        indexes = [
+            # фильтрация каталога по значениям параметров
+            models.Index(fields=['parameter_name', 'value', 'product'], name='parameters_name_value_idx'),
+            # фильтрация каталога по диапазону числовых значений
+            models.Index(fields=['parameter_name', 'numeric_value', 'product'], name='parameters_name_numeric_idx'),
+        ]
+
+    @property
+    def name(self):
+        """
+        Название параметра. Новое название, присвоенное до сохранения,
+        добавляется в справочник при save().
+        """
+        if '_new_name' in self.__dict__:
+            return self._new_name
+        return self.parameter_name.name
+
+    @name.setter
+    def name(self, value):
+        self._new_name = value
+
+    def save(self, *args, **kwargs):
+        """
+        Перед сохранением заполняет числовое значение и единицу измерения
+        и находит (или создает) название параметра в справочнике.
+        """
+        if '_new_name' in self.__dict__:
+            self.parameter_name, _ = ParameterName.objects.get_or_create(name=self.__dict__.pop('_new_name'))
+        self.numeric_value, self.unit = parse_numeric_value(self.value, self.name)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         """
@@ -119,27 +317,107 @@ class Parameters(models.Model):
         return f"{self.name}: {self.value}"
 
 
+class CartQuerySet(models.QuerySet):
+    """
+    QuerySet корзин с изменением итогов корзины без пересчета по позициям.
+    """
+
+    def shift_totals(self, items, amount):
+        """
+        Сдвигает количество единиц товара на items и стоимость на amount
+        одним UPDATE через F(), не читая корзины.
+        """
+        if not items and not amount:
+            return 0
+        return self.update(items_count=models.F('items_count') + items, total_price=models.F('total_price') + amount)
+
+
 # модель корзины
 class Cart(models.Model):
     """
     Модель корзины. 
     Поле user - пользователь, которому принадлежит корзина
     Поле products - продукты в корзине
+    Поле items_count - количество единиц товара в корзине
+    Поле total_price - стоимость корзины по ценам позиций
     Поле created_at - дата создания
     Поле updated_at - дата обновления
+
+    items_count и total_price поддерживаются при каждом изменении позиций
+    (см. CartProduct и CartProductQuerySet), поэтому счетчик и сумма корзины
+    читаются из одной строки без обращения к позициям.
     """
     # unique=True - означает, что для каждого пользователя может быть только одна корзина.
     # Если создать для пользователя еще одну корзину, то предыдущая будет удалена.
     user = models.ForeignKey('Users.MarketUser', on_delete=models.SET_NULL, null=True, related_name='carts', unique=True)
     products = models.ManyToManyField(Product, related_name='carts', through='CartProduct')
+    items_count = models.PositiveIntegerField(default=0, verbose_name="Количество единиц товара")
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Стоимость корзины")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartQuerySet.as_manager()
+
     def TotalPrice(self):
         """
-        общая стоимость корзины
+        общая стоимость корзины: сумма цена * количество по всем позициям,
+        считается одним агрегирующим запросом. Возвращает Decimal
+        с копейками (Decimal('0.00') для пустой корзины).
         """
-        return sum([product.price*product.cart_products.get(cart=self).quantity for product in self.products.all()])
+        total = self.cart_products.aggregate(total=models.Sum(
+            models.F('product__price') * models.F('quantity'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ))['total']
+        return (total or Decimal(0)).quantize(Decimal('0.01'))
+
+
+class CartProductQuerySet(models.QuerySet):
+    """
+    QuerySet позиций корзин. Изменения выборки позиций сдвигают итоги
+    их корзин (items_count, total_price) на разницу одним UPDATE корзин,
+    без пересчета корзин целиком.
+    """
+
+    def _shift_carts(self, items, amount):
+        """
+        Сдвигает итоги корзин позиций выборки на суммы выражений items и amount
+        по позициям каждой корзины.
+        """
+        lines = self.filter(cart=models.OuterRef('pk')).order_by().values('cart')
+        return Cart.objects.filter(pk__in=self.values('cart_id')).update(
+            items_count=models.F('items_count') + models.Subquery(lines.annotate(delta=models.Sum(items)).values('delta')),
+            total_price=models.F('total_price') + models.Subquery(lines.annotate(delta=models.Sum(
+                amount, output_field=models.DecimalField(max_digits=12, decimal_places=2))).values('delta')),
+        )
+
+    def delete(self):
+        with transaction.atomic():
+            self._shift_carts(-models.F('quantity'), -models.F('price') * models.F('quantity'))
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def set_quantity(self, quantity):
+        """
+        Меняет количество у позиций выборки. Возвращает число измененных позиций.
+        """
+        with transaction.atomic():
+            self._shift_carts(quantity - models.F('quantity'), (quantity - models.F('quantity')) * models.F('price'))
+            return self.update(quantity=quantity, updated_at=timezone.now())
+
+    def reprice(self):
+        """
+        Переснимает цены позиций выборки по текущим ценам продуктов
+        и сдвигает стоимость их корзин на разницу. Вызывается из
+        Product.save() и после массового изменения цен, которое не вызывает
+        save() (например, при импорте). Возвращает число измененных позиций.
+        """
+        lines = self.exclude(price=models.F('product__price'))
+        with transaction.atomic():
+            lines._shift_carts(models.Value(0), (models.F('product__price') - models.F('price')) * models.F('quantity'))
+            return lines.update(price=models.Subquery(
+                Product.objects.filter(pk=models.OuterRef('product_id')).values('price')[:1]))
 
 
 # модель продукта в корзине
@@ -149,15 +427,55 @@ class CartProduct(models.Model):
     Поле cart - корзина, в которой находится продукт
     Поле product - продукт в корзине
     Поле quantity - количество продукта в корзине
+    Поле price - цена продукта, по которой позиция учтена в стоимости корзины
     Поле created_at - дата создания
     Поле updated_at - дата обновления
+
+    Сохранение и удаление позиции сдвигают итоги корзины на разницу.
+    Массовые изменения выполняются через CartProductQuerySet
+    или с явным Cart.objects.shift_totals().
     """
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='cart_products')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='cart_products')
     quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartProductQuerySet.as_manager()
+
+    class Meta:
+        # продукт входит в корзину одной позицией, количество которой меняется
+        unique_together = ('cart', 'product')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # сохраненное состояние, от которого считается сдвиг итогов корзины
+        instance._saved = (instance.__dict__.get('quantity', 0), instance.__dict__.get('price') or 0)
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Сохраняет позицию, запоминая цену продукта для новой позиции,
+        и сдвигает итоги корзины на разницу с сохраненным состоянием.
+        """
+        if self.price is None:
+            self.price = self.product.price
+        self.price = self._meta.get_field('price').to_python(self.price)
+        saved_quantity, saved_price = getattr(self, '_saved', (0, 0))
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Cart.objects.filter(pk=self.cart_id).shift_totals(
+                self.quantity - saved_quantity, self.price * self.quantity - saved_price * saved_quantity)
+        self._saved = (self.quantity, self.price)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            saved_quantity, saved_price = getattr(self, '_saved', (0, 0))
+            Cart.objects.filter(pk=self.cart_id).shift_totals(-saved_quantity, -saved_price * saved_quantity)
+            return super().delete(*args, **kwargs)
+
 
 # модель категории продуктов
 class Category(models.Model):
@@ -165,9 +483,11 @@ class Category(models.Model):
     Модель категории продуктов.
     Поле name - название категории
     Поле products - продукты в категории
+    Поле updated_at - дата обновления
     """
     name = models.CharField(max_length=255, unique=True, verbose_name="Название категории")
     products = models.ManyToManyField(Product, related_name='categories', blank=True, verbose_name="Продукты")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
     class Meta:
         verbose_name = "Категория"
@@ -181,3 +501,146 @@ class Category(models.Model):
         return self.name
     
 
+
+
+# предрасчитанные счетчики фасетов по параметрам
+class ParameterFacet(models.Model):
+    """
+    Модель счетчика фасета.
+    Поле category - категория, в пределах которой ведется подсчет
+    Поле name - название параметра
+    Поле value - значение параметра (пустая строка для параметров без значения)
+    Поле count - число продуктов категории с таким значением параметра
+
+    Счетчики обновляются инкрементально (см. Products/facets.py), поэтому
+    ответ с фасетами не требует группировки по всей таблице параметров.
+    """
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='facets', verbose_name="Категория")
+    name = models.CharField(max_length=255, verbose_name="Название параметра")
+    value = models.CharField(max_length=255, blank=True, default='', verbose_name="Значение параметра")
+    count = models.IntegerField(default=0, verbose_name="Количество продуктов")
+
+    class Meta:
+        verbose_name = "Фасет параметра"
+        verbose_name_plural = "Фасеты параметров"
+        unique_together = ('category', 'name', 'value')
+
+    def __str__(self):
+        return f"{self.category_id} / {self.name}: {self.value} ({self.count})"
+
+
+# задание на асинхронный импорт прайс-листа
+class ImportJob(models.Model):
+    """
+    Модель задания на импорт прайс-листа.
+    Поле user - пользователь, загрузивший файл (продавец по умолчанию)
+    Поле file - загруженный файл
+    Поле mode - режим импорта: update (создание и обновление) или replace
+    (файл - полный каталог продавца, отсутствующие продукты снимаются с продажи)
+    Поле dry_run - пробный импорт: отчет составляется, изменения откатываются
+    Поле status - состояние задания
+    Поле total, processed - количество товаров в файле и обработанных товаров
+    Поле imported_count, updated_count, unchanged_count, removed_count, deactivated_count, errors - отчет об импорте
+    (обновляется по ходу выполнения)
+    Поле timings - время этапов импорта в секундах и скорость (товаров в секунду)
+    Поле message - итоговое сообщение или причина ошибки
+    Поле import_token - метка импорта (см. CatalogImporter.token); повторный
+    запуск задания после ошибки выполняется с той же меткой
+
+    Файл обрабатывается задачей Celery run_import_job (см. Products/tasks.py).
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Ожидает обработки'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Завершено'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    UPDATE = 'update'
+    REPLACE = 'replace'
+    MODE_CHOICES = [
+        (UPDATE, 'Создание и обновление продуктов'),
+        (REPLACE, 'Замена каталога продавца'),
+    ]
+
+    user = models.ForeignKey(MarketUser, on_delete=models.CASCADE, related_name='import_jobs', verbose_name="Пользователь")
+    file = models.FileField(upload_to='imports/', verbose_name="Файл прайс-листа")
+    mode = models.CharField(max_length=16, choices=MODE_CHOICES, default=UPDATE, verbose_name="Режим импорта")
+    dry_run = models.BooleanField(default=False, verbose_name="Пробный импорт")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING, verbose_name="Состояние")
+    total = models.IntegerField(default=0, verbose_name="Количество товаров")
+    processed = models.IntegerField(default=0, verbose_name="Обработано товаров")
+    imported_count = models.IntegerField(default=0, verbose_name="Создано продуктов")
+    updated_count = models.IntegerField(default=0, verbose_name="Обновлено продуктов")
+    unchanged_count = models.IntegerField(default=0, verbose_name="Товаров без изменений")
+    removed_count = models.IntegerField(default=0, verbose_name="Товаров, отсутствующих в файле")
+    deactivated_count = models.IntegerField(default=0, verbose_name="Снято с продажи продуктов")
+    errors = models.JSONField(default=list, blank=True, encoder=DjangoJSONEncoder, verbose_name="Ошибки")
+    timings = models.JSONField(default=dict, blank=True, verbose_name="Время этапов")
+    message = models.TextField(blank=True, default='', verbose_name="Сообщение")
+    import_token = models.CharField(max_length=32, blank=True, default='', editable=False, verbose_name="Метка импорта")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    finished_at = models.DateTimeField(blank=True, null=True, verbose_name="Дата завершения")
+
+    class Meta:
+        verbose_name = "Задание импорта"
+        verbose_name_plural = "Задания импорта"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Импорт {self.id} ({self.status})"
+
+
+# товар прайс-листа, импортированный ранее
+class ImportedItem(models.Model):
+    """
+    Модель импортированного товара прайс-листа.
+    Поле seller - продавец
+    Поле external_id - id товара в прайс-листе продавца (goods[].id)
+    Поле product - продукт, созданный или обновленный по этому товару
+    Поле content_hash - хэш данных товара при последнем импорте
+    Поле import_token - метка импорта, в котором товар встречался последним
+
+    Товары с тем же хэшем при повторном импорте пропускаются без проверки и записи.
+    """
+    seller = models.ForeignKey(MarketUser, on_delete=models.CASCADE, related_name='imported_items', verbose_name="Продавец")
+    external_id = models.CharField(max_length=255, verbose_name="Id товара в прайс-листе")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='imported_items', verbose_name="Продукт")
+    content_hash = models.CharField(max_length=32, verbose_name="Хэш данных товара")
+    import_token = models.CharField(max_length=32, blank=True, default='', verbose_name="Метка импорта")
+
+    class Meta:
+        verbose_name = "Импортированный товар"
+        verbose_name_plural = "Импортированные товары"
+        unique_together = ('seller', 'external_id')
+
+    def __str__(self):
+        return f"{self.seller_id} / {self.external_id} -> {self.product_id}"
+
+
+class CategoryMapping(models.Model):
+    """
+    Модель соответствия категории прайс-листа продавца категории каталога.
+    Поле seller - продавец
+    Поле external_id - id категории в прайс-листе продавца (categories[].id)
+    Поле category - категория каталога
+
+    Сохраняется при первом импорте категории. При следующих импортах товары
+    с этим id категории попадают в ту же категорию каталога, даже если продавец
+    переименовал ее в прайс-листе, поэтому дубликаты категорий не создаются.
+    """
+    seller = models.ForeignKey(MarketUser, on_delete=models.CASCADE, related_name='category_mappings', verbose_name="Продавец")
+    external_id = models.CharField(max_length=255, verbose_name="Id категории в прайс-листе")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='mappings', verbose_name="Категория")
+
+    class Meta:
+        verbose_name = "Соответствие категории прайс-листа"
+        verbose_name_plural = "Соответствия категорий прайс-листов"
+        unique_together = ('seller', 'external_id')
+
+    def __str__(self):
+        return f"{self.seller_id} / {self.external_id} -> {self.category_id}"
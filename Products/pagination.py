@@ -0,0 +1,138 @@
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+# размер страницы каталога по умолчанию и максимально допустимый размер
+DEFAULT_PAGE_SIZE = getattr(settings, 'PRODUCTS_PAGE_SIZE', 50)
+MAX_PAGE_SIZE = getattr(settings, 'PRODUCTS_MAX_PAGE_SIZE', 500)
+
+# допустимые типы значений полей сортировки в курсоре
+FIELD_TYPES = {
+    'id': (int,),
+    'name': (str,),
+    'score': (int, float),
+}
+
+
+class InvalidCursor(ValueError):
+    """
+    Курсор не удалось разобрать: он поврежден или сформирован не сервером.
+    """
+
+
+def encode_cursor(position, reverse=False):
+    """
+    Кодирует позицию в выдаче (значения полей сортировки последней
+    записи страницы) и направление обхода в непрозрачную строку.
+    """
+    payload = json.dumps({'p': list(position), 'r': bool(reverse)}, ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size, types=None):
+    """
+    Декодирует курсор, сформированный encode_cursor.
+    types - кортежи допустимых типов для каждого значения позиции.
+
+    Возвращает кортеж (позиция, reverse).
+    Выбрасывает InvalidCursor, если курсор некорректен.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        position, reverse = payload['p'], payload['r']
+    except (ValueError, TypeError, KeyError, UnicodeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(position, list) or len(position) != size or not isinstance(reverse, bool):
+        raise InvalidCursor(cursor)
+    for value, allowed in zip(position, types or [(str, int, float)] * size):
+        # bool в JSON - отдельный тип, хотя в Python он наследует int
+        if isinstance(value, bool) or not isinstance(value, allowed):
+            raise InvalidCursor(cursor)
+    return position, reverse
+
+
+def clamp_page_size(page_size):
+    """
+    Приводит запрошенный размер страницы к допустимому диапазону.
+    """
+    if not page_size:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(page_size), MAX_PAGE_SIZE))
+
+
+class KeysetPaginator:
+    """
+    Курсорная (keyset) пагинация по набору полей сортировки.
+
+    Вместо OFFSET каждая страница выбирается условием
+    (name, id) > (последнее name, последний id), поэтому стоимость
+    любой страницы одинакова и определяется индексом по этим полям,
+    а вставка новых записей не приводит к пропускам и дублям.
+    Последнее поле набора должно быть уникальным (обычно id).
+    """
+
+    def __init__(self, fields=('name', 'id'), page_size=None):
+        self.fields = tuple(fields)
+        self.types = [FIELD_TYPES.get(field, (str, int, float)) for field in self.fields]
+        self.page_size = clamp_page_size(page_size)
+
+    def _position(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def _after(self, position, reverse):
+        """
+        Строит условие "строго после позиции" (или "строго до" при reverse)
+        для составного ключа сортировки.
+        """
+        lookup = 'lt' if reverse else 'gt'
+        # name >= x AND (name > x OR id > y): внешнее нестрогое сравнение по
+        # первому полю SQLite выполняет поиском диапазона по индексу (SEARCH),
+        # тогда как равносильное name > x OR (name = x AND id > y) - сканированием
+        fields, values = self.fields[::-1], position[::-1]
+        condition = Q(**{f'{fields[0]}__{lookup}': values[0]})
+        for field, value in zip(fields[1:], values[1:]):
+            condition = Q(**{f'{field}__{lookup}e': value}) & (Q(**{f'{field}__{lookup}': value}) | condition)
+        return condition
+
+    def fetch(self, queryset, position, reverse):
+        """
+        Выбирает не более page_size + 1 записей после позиции
+        (лишняя запись показывает, что за страницей есть продолжение).
+        """
+        ordering = [f'-{field}' if reverse else field for field in self.fields]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self._after(position, reverse))
+            except (ValueError, TypeError, ValidationError):
+                # значение позиции не приводится к типу поля сортировки
+                raise InvalidCursor(position)
+        return list(queryset[:self.page_size + 1])
+
+    def paginate(self, queryset, cursor=None):
+        """
+        Возвращает кортеж (записи страницы, курсор следующей страницы,
+        курсор предыдущей страницы). Отсутствующие курсоры равны None.
+        """
+        position, reverse = (None, False)
+        if cursor:
+            position, reverse = decode_cursor(cursor, len(self.fields), self.types)
+
+        rows = self.fetch(queryset, position, reverse)
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            rows.reverse()
+            next_cursor = encode_cursor(self._position(rows[-1])) if rows else None
+            previous_cursor = encode_cursor(self._position(rows[0]), reverse=True) if rows and has_more else None
+        else:
+            next_cursor = encode_cursor(self._position(rows[-1])) if rows and has_more else None
+            previous_cursor = encode_cursor(self._position(rows[0]), reverse=True) if rows and position is not None else None
+
+        return rows, next_cursor, previous_cursor
@@ -0,0 +1,323 @@
+"""
+Потоковое чтение прайс-листов разных форматов.
+
+Каждый формат читается своим классом с общим интерфейсом:
+
+- при создании файл читается один раз без построения товаров:
+  проверяется структура и подсчитывается число товаров (total);
+- categories - список категорий прайс-листа ({'id': ..., 'name': ...});
+- goods() - генератор товаров, которые читаются из файла по одному.
+
+Товар - словарь в формате YAML-прайс-листа (name, price, quantity,
+description, seller_id, category, parameters в виде словаря) или с
+названиями категорий в списке categories. Дальше товары приводятся
+к единому виду в CatalogImporter (см. Products/importer.py).
+
+Формат выбирается по расширению файла (FORMATS, reader_for).
+"""
+import codecs
+import csv
+import io
+import json
+
+import yaml
+from yaml.composer import Composer
+from yaml.constructor import SafeConstructor
+from yaml.events import (DocumentStartEvent, MappingStartEvent, MappingEndEvent,
+                         SequenceStartEvent, SequenceEndEvent)
+from yaml.resolver import Resolver
+
+# чтение XLSX требует необязательной зависимости openpyxl
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# C-реализация парсера libyaml, если PyYAML собран с ней
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+
+class PriceListError(ValueError):
+    """
+    Файл прайс-листа не удалось разобрать или он имеет неверную структуру.
+    """
+
+
+class _EventComposer(Composer, SafeConstructor, Resolver):
+    """
+    Строит объекты из потока событий YAML по одному узлу.
+
+    Загрузчик на libyaml не дает строить отдельные узлы документа,
+    поэтому события от парсера (C или Python) собираются в узлы
+    композитором PyYAML.
+    """
+
+    def __init__(self, events):
+        self._events = events
+        self._event = None
+        Composer.__init__(self)
+        SafeConstructor.__init__(self)
+        Resolver.__init__(self)
+
+    def peek_event(self):
+        if self._event is None:
+            self._event = next(self._events, None)
+        return self._event
+
+    def check_event(self, *choices):
+        event = self.peek_event()
+        if event is None:
+            return False
+        return not choices or isinstance(event, choices)
+
+    def get_event(self):
+        event = self.peek_event()
+        self._event = None
+        return event
+
+    def construct(self):
+        """
+        Строит объект из очередного узла.
+        """
+        return self.construct_document(self.compose_node(None, None))
+
+    def skip(self):
+        """
+        Пропускает очередной узел, не строя его.
+        """
+        depth = 0
+        while True:
+            event = self.get_event()
+            if isinstance(event, (MappingStartEvent, SequenceStartEvent)):
+                depth += 1
+            elif isinstance(event, (MappingEndEvent, SequenceEndEvent)):
+                depth -= 1
+            if depth == 0:
+                return
+
+
+class YamlPriceList:
+    """
+    Потоковое чтение YAML-файла прайс-листа (словарь с ключами
+    shop, categories и goods).
+
+    При первом чтении сохраняются верхнеуровневые ключи, кроме goods
+    (header). Метод goods() читает файл повторно и строит товары
+    по одному из потока событий YAML, поэтому категории могут
+    располагаться в файле и после списка goods.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.header = {}
+        self.total = 0
+        goods_found = False
+        try:
+            composer = self._composer()
+            for key in self._keys(composer):
+                if key == 'goods':
+                    goods_found = True
+                    self.total = sum(1 for _ in self._items(composer, composer.skip))
+                else:
+                    self.header[key] = composer.construct()
+        except yaml.YAMLError as e:
+            raise PriceListError(f"Ошибка парсинга YAML-файла: {e}")
+        if not goods_found:
+            raise PriceListError("Ожидаемый формат YAML-файла: словарь с ключом 'goods', содержащим список продуктов.")
+
+    @property
+    def categories(self):
+        return self.header.get('categories') or []
+
+    def goods(self):
+        """
+        Генератор товаров из списка goods.
+        """
+        try:
+            composer = self._composer()
+            for key in self._keys(composer):
+                if key == 'goods':
+                    yield from self._items(composer, composer.construct)
+                    return
+                composer.skip()
+        except yaml.YAMLError as e:
+            raise PriceListError(f"Ошибка парсинга YAML-файла: {e}")
+
+    def _composer(self):
+        self.stream.seek(0)
+        return _EventComposer(yaml.parse(self.stream, Loader=YamlLoader))
+
+    def _keys(self, composer):
+        """
+        Генератор ключей верхнеуровневого словаря. После каждого ключа
+        вызывающий код должен прочитать или пропустить его значение.
+        """
+        composer.get_event()
+        if not composer.check_event(DocumentStartEvent):
+            raise PriceListError("Ожидаемый формат YAML-файла: словарь с ключом 'goods', содержащим список продуктов.")
+        composer.get_event()
+        if not composer.check_event(MappingStartEvent):
+            raise PriceListError("Ожидаемый формат YAML-файла: словарь с ключом 'goods', содержащим список продуктов.")
+        composer.get_event()
+        while not composer.check_event(MappingEndEvent):
+            yield composer.construct()
+
+    def _items(self, composer, read):
+        if not composer.check_event(SequenceStartEvent):
+            raise PriceListError("Ключ 'goods' в YAML-файле должен содержать список продуктов.")
+        composer.get_event()
+        while not composer.check_event(SequenceEndEvent):
+            yield read()
+        composer.get_event()
+
+
+def _row_item(row):
+    """
+    Приводит строку табличного прайс-листа (CSV, XLSX) к товару:
+    пустые ячейки пропускаются, категории перечисляются через ';',
+    параметры записываются объектом JSON, как в выгрузке каталога.
+    """
+    item = {}
+    for column, value in row.items():
+        if isinstance(value, str):
+            value = value.strip()
+        if column is None or value is None or value == '':
+            continue
+        item[str(column).strip()] = value
+    if 'categories' in item:
+        item['categories'] = [name.strip() for name in str(item['categories']).split(';') if name.strip()]
+    if isinstance(item.get('parameters'), str):
+        try:
+            item['parameters'] = json.loads(item['parameters'])
+        except ValueError:
+            # ошибка попадет в отчет импорта как неверное значение parameters
+            pass
+    return item
+
+
+class CsvPriceList:
+    """
+    Потоковое чтение CSV-файла прайс-листа: первая строка - заголовок
+    с названиями полей товара (name обязательно), далее по товару в строке.
+    Колонки совпадают с выгрузкой каталога в CSV (Products/export.py),
+    лишние колонки (seller, is_available) игнорируются.
+    """
+    categories = []
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.total = sum(1 for _ in self._rows())
+
+    def goods(self):
+        """
+        Генератор товаров из строк файла.
+        """
+        for row in self._rows():
+            yield _row_item(row)
+
+    def _rows(self):
+        self.stream.seek(0)
+        text = io.TextIOWrapper(self.stream, encoding='utf-8-sig', newline='')
+        try:
+            reader = csv.reader(text)
+            header = next(reader, None)
+            if not header or 'name' not in [column.strip() for column in header]:
+                raise PriceListError("Ожидаемый формат CSV-файла: строка заголовка с колонкой 'name'.")
+            for values in reader:
+                if any(value.strip() for value in values):
+                    yield dict(zip(header, values))
+        except (csv.Error, UnicodeDecodeError) as e:
+            raise PriceListError(f"Ошибка чтения CSV-файла: {e}")
+        finally:
+            # файл закрывает вызывающий код
+            text.detach()
+
+
+class JsonLinesPriceList:
+    """
+    Потоковое чтение прайс-листа в формате JSON Lines: по объекту
+    товара в строке, как в выгрузке каталога в NDJSON (Products/export.py).
+    """
+    categories = []
+
+    def __init__(self, stream):
+        self.stream = stream
+        # строки проверяются при подсчете, чтобы ошибка в файле
+        # обнаружилась до начала импорта
+        self.total = sum(1 for _ in self.goods())
+
+    def goods(self):
+        """
+        Генератор товаров из строк файла.
+        """
+        self.stream.seek(0)
+        for number, line in enumerate(self.stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line.lstrip(codecs.BOM_UTF8) if number == 1 else line)
+            except ValueError as e:
+                raise PriceListError(f"Ошибка парсинга JSON в строке {number}: {e}")
+
+
+class XlsxPriceList:
+    """
+    Потоковое чтение XLSX-файла прайс-листа (первый лист, первая строка -
+    заголовок, как в CsvPriceList). Книга открывается в режиме только
+    для чтения, в котором openpyxl не загружает лист в память целиком.
+    """
+    categories = []
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.total = sum(1 for _ in self._rows())
+
+    def goods(self):
+        """
+        Генератор товаров из строк первого листа.
+        """
+        for row in self._rows():
+            yield _row_item(row)
+
+    def _rows(self):
+        self.stream.seek(0)
+        try:
+            workbook = openpyxl.load_workbook(self.stream, read_only=True, data_only=True)
+        except Exception as e:
+            raise PriceListError(f"Ошибка чтения XLSX-файла: {e}")
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None)
+            if not header or 'name' not in [str(column).strip() for column in header if column is not None]:
+                raise PriceListError("Ожидаемый формат XLSX-файла: строка заголовка с колонкой 'name'.")
+            for values in rows:
+                if any(value is not None and str(value).strip() for value in values):
+                    yield dict(zip(header, values))
+        finally:
+            workbook.close()
+
+
+# расширение файла: класс чтения
+FORMATS = {
+    '.yaml': YamlPriceList,
+    '.yml': YamlPriceList,
+    '.csv': CsvPriceList,
+    '.jsonl': JsonLinesPriceList,
+    '.ndjson': JsonLinesPriceList,
+}
+# без openpyxl XLSX-файлы отклоняются при загрузке как файлы неподдерживаемого формата
+if openpyxl is not None:
+    FORMATS['.xlsx'] = XlsxPriceList
+
+
+def reader_for(filename):
+    """
+    Возвращает класс чтения прайс-листа по расширению файла или None.
+    """
+    for extension, reader in FORMATS.items():
+        if filename.lower().endswith(extension):
+            return reader
+    return None
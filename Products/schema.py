@@ -19,9 +19,15 @@ products_list_schema = extend_schema_view(
         summary="Получить список продуктов или конкретный продукт",
         description="""
         Возвращает список всех продуктов, либо фильтрует по `id`, `name`, или `categories`.
-        Если ни один параметр не указан, возвращает все продукты.
+        Если ни один параметр не указан, возвращает все продукты постранично
+        (курсорная пагинация по `name`, `id`): для перехода между страницами
+        передайте значение `next` или `previous` из ответа в параметре `cursor`.
+        Если указан `q`, выполняет полнотекстовый поиск и возвращает результаты
+        по убыванию релевантности.
         Если указаны `id` или `name`, пытается найти один продукт.
         Если указаны `categories`, возвращает все продукты из указанных категорий.
+        Ответ содержит заголовки `ETag` и `Last-Modified`; при повторном запросе
+        с `If-None-Match` или `If-Modified-Since` неизменившиеся данные не передаются (ответ 304).
         """,
         parameters=[
             OpenApiParameter(
@@ -48,6 +54,61 @@ products_list_schema = extend_schema_view(
                 description="Список идентификаторов категорий через запятую (например, '1,5,10').",
                 examples=[OpenApiExample("Поиск по категориям", value=[1, 5, 10])]
             ),
+            OpenApiParameter(
+                name="q",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description="Полнотекстовый поиск по названию, описанию и параметрам продукта. "
+                            "Слова ищутся по началу (префиксу), результаты упорядочены по релевантности и "
+                            "разбиты на страницы так же, как полный список.",
+                examples=[OpenApiExample("Поиск по части названия", value="iphone xs")]
+            ),
+            OpenApiParameter(
+                name="param",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                many=True,
+                description="Фильтр по значению параметра в виде `Название=значение`. "
+                            "Можно передать несколько раз, тогда продукт должен подходить под все фильтры. "
+                            "Применяется к полному списку и к списку по категориям.",
+                examples=[OpenApiExample("Фильтр по цвету", value="Цвет=золотистый")]
+            ),
+            OpenApiParameter(
+                name="param_min",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                many=True,
+                description="Нижняя граница числового значения параметра в виде `Название=число` (включительно). "
+                            "Учитываются значения, начинающиеся с числа, например `6.5` или `512 ГБ`.",
+                examples=[OpenApiExample("Диагональ от 6.1", value="Диагональ (дюйм)=6.1")]
+            ),
+            OpenApiParameter(
+                name="param_max",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                many=True,
+                description="Верхняя граница числового значения параметра в виде `Название=число` (включительно).",
+                examples=[OpenApiExample("Диагональ до 6.7", value="Диагональ (дюйм)=6.7")]
+            ),
+            OpenApiParameter(
+                name="cursor",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description="Курсор страницы из полей `next`/`previous` предыдущего ответа.",
+            ),
+            OpenApiParameter(
+                name="page_size",
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description="Количество продуктов на странице (по умолчанию 50, не более 500).",
+                examples=[OpenApiExample("Размер страницы", value=100)]
+            ),
         ],
         responses={
             200: OpenApiResponse(
@@ -56,7 +117,8 @@ products_list_schema = extend_schema_view(
                 examples=[
                     OpenApiExample(
                         "Все продукты",
-                        value={"message": "Все продукты", "products": [{"id": 1, "name": "Тестовый продукт", "price": "100.00"}]},
+                        value={"message": "Все продукты", "products": [{"id": 1, "name": "Тестовый продукт", "price": "100.00"}],
+                               "next": "eyJwIjpbItCi0LXRgdGCIiwxXSwiciI6ZmFsc2V9", "previous": None},
                         response_only=True
                     ),
                     OpenApiExample(
@@ -68,9 +130,11 @@ products_list_schema = extend_schema_view(
             ),
             400: OpenApiResponse(
                 response={"message": "Ошибка валидации"},
-                description="Неверные параметры запроса.",
-                examples=[OpenApiExample("Неверные параметры", value={"message": "Неверные параметры запроса"})]
+                description="Неверные параметры запроса или курсор страницы.",
+                examples=[OpenApiExample("Неверные параметры", value={"message": "Неверные параметры запроса"}),
+                          OpenApiExample("Неверный курсор", value={"error": "Неверный курсор страницы."})]
             ),
+            304: OpenApiResponse(description="Данные не изменились с версии, указанной в If-None-Match / If-Modified-Since."),
             404: OpenApiResponse(
                 response={"message": "Продукт не найден"},
                 description="Продукт по указанным параметрам не найден.",
@@ -154,7 +218,7 @@ products_list_schema = extend_schema_view(
         tags=['Продукты'],
         summary="Удалить продукт",
         description="Удаляет продукт по `id` или `name`. Требуются права `Users.delete_product`.",
-        request=ProductSearchSerializer,
+        request=ProductDeleteSerializer,
         responses={
             200: OpenApiResponse(description="Продукт успешно удален.", examples=[OpenApiExample("Успешное удаление", value={"message": "Продукт успешно удален"})]),
             400: OpenApiResponse(description="Неверные параметры запроса.", examples=[OpenApiExample("Ошибка валидации", value={"id": ["Это поле обязательно."]})]),
@@ -343,7 +407,8 @@ categories_view_schema = extend_schema_view(
     get=extend_schema(
         tags=['Категории продуктов'],
         summary="Получить категории",
-        description="Получение списка всех категорий или конкретной категории по ID/названию",
+        description="Получение списка всех категорий или конкретной категории по ID/названию. "
+                    "Поддерживает условные запросы по заголовкам ETag и Last-Modified (ответ 304).",
         parameters=[
             OpenApiParameter(
                 name='id',
@@ -378,7 +443,8 @@ cart_view_schema = extend_schema_view(
     get=extend_schema(
         tags=['Корзина'],
         summary="Получить корзину",
-        description="Получение содержимого корзины текущего пользователя",
+        description="Получение содержимого корзины текущего пользователя: позиции "
+                    "с ценой и стоимостью (subtotal = price * quantity) и общая стоимость корзины",
         responses={
             200: inline_serializer(
                 name='CartResponse',
@@ -401,6 +467,7 @@ cart_view_schema = extend_schema_view(
                             "name": "Телефон",
                             "quantity": 1,
                             "price": "999.99",
+                            "subtotal": "999.99",
                             "id": 1,
                             "is_available": True,
                             "seller": "seller1"
@@ -454,7 +521,10 @@ cart_view_schema = extend_schema_view(
     post=extend_schema(
         tags=['Корзина'],
         summary="Оформить заказ",
-        description="Оформление заказа из содержимого корзины",
+        description="Оформление заказа из содержимого корзины. Остатки всех товаров списываются "
+                    "в одной транзакции только при наличии нужного количества: если товар закончился, "
+                    "заказ не создается, а ответ 406 указывает товар, которого не хватило "
+                    "(409 - если остатки изменились снова и заказ стоит повторить)",
         # Здесь нет параметров для тела запроса, так как заказ оформляется из содержимого корзины,
         # которая уже существует для пользователя. Если бы были дополнительные параметры для заказа,
         # их можно было бы добавить через 'request'.
@@ -484,17 +554,102 @@ cart_view_schema = extend_schema_view(
     ),
 )
 
+cart_summary_schema = extend_schema_view(
+    get=extend_schema(
+        tags=['Корзина'],
+        summary="Итоги корзины",
+        description="Количество единиц товара и стоимость корзины текущего пользователя "
+                    "для счетчика корзины. Читаются из одной строки корзины: итоги "
+                    "поддерживаются при каждом изменении корзины и изменении цен продуктов.",
+        responses={
+            200: inline_serializer(
+                name='CartSummaryResponse',
+                fields={
+                    'id': serializers.IntegerField(allow_null=True),
+                    'items_count': serializers.IntegerField(),
+                    'total_price': serializers.DecimalField(max_digits=12, decimal_places=2)
+                }
+            )
+        },
+        examples=[
+            OpenApiExample(
+                'Пример успешного ответа',
+                value={"id": 1, "items_count": 3, "total_price": "2999.97"},
+                status_codes=['200'],
+            ),
+        ]
+    ),
+)
+
+cart_batch_schema = extend_schema_view(
+    post=extend_schema(
+        tags=['Корзина'],
+        summary="Пакетное изменение корзины",
+        description="Добавление продуктов, изменение их количества (items) и удаление продуктов (remove) "
+                    "одним запросом. Наличие и доступность всех продуктов проверяются до изменения корзины: "
+                    "если хотя бы один продукт не найден или не прошел проверку, корзина не изменяется. "
+                    "Продукты из remove, которых нет в корзине, пропускаются. "
+                    "Ответ содержит новое содержимое корзины в формате GET Cart/.",
+        request=CartBatchSerializer,
+        responses={
+            200: inline_serializer(
+                name='CartBatchResponse',
+                fields={
+                    'message': serializers.CharField(),
+                    'id': serializers.IntegerField(),
+                    'Cart_products': serializers.ListField(),
+                    'Total_price': serializers.DecimalField(max_digits=10, decimal_places=2)
+                }
+            ),
+            400: OpenApiTypes.OBJECT,
+            404: OpenApiTypes.OBJECT,
+        },
+        examples=[
+            OpenApiExample(
+                'Пример запроса',
+                value={
+                    "items": [{"id": 1, "quantity": 2}, {"id": 3, "quantity": 1}],
+                    "remove": [2]
+                },
+                request_only=True,
+            ),
+            OpenApiExample(
+                'Недостаточно товара',
+                value={
+                    "message": "Корзина не изменена",
+                    "errors": [{"id": 3, "message": "Недостаточное количество товара"}]
+                },
+                status_codes=['400'],
+                response_only=True,
+            ),
+        ]
+    ),
+)
+
 product_import_schema = extend_schema_view(
     post=extend_schema(
         tags=['Продукты'],
-        summary="Импорт продуктов из YAML файла",
+        summary="Импорт продуктов из файла прайс-листа",
         description="""
-        Импортирует данные о продуктах из предоставленного YAML файла. 
-        YAML файл должен содержать верхнеуровневые ключи 'shop', 'categories' и 'goods'.
-        Продукты в 'goods' могут содержать 'category' (по ID из верхнеуровневых категорий)
-        и 'parameters' (как словарь ключ-значение).
+        Ставит в очередь импорт данных о продуктах из предоставленного файла. 
+        YAML файл (.yaml, .yml) должен содержать верхнеуровневые ключи 'shop', 'categories' и 'goods'.
+        Продукты в 'goods' могут содержать 'category' (по ID из верхнеуровневых категорий
+        или объект {'id': ..., 'name': ...}) и 'parameters' (как словарь ключ-значение).
+        ID категории запоминается для продавца: товары с этим ID и дальше попадают
+        в ту же категорию каталога, даже если категория переименована в файле.
+        CSV (.csv), JSON Lines (.jsonl, .ndjson) и XLSX (.xlsx) содержат по товару
+        в строке с полями выгрузки каталога: 'categories' - названия категорий
+        (в CSV и XLSX через ';'), 'parameters' - объект JSON.
         Если 'seller_id' не указан для продукта, используется текущий аутентифицированный пользователь.
         Существующие продукты (по имени и продавцу) будут обновлены.
+        В режиме replace продукты продавцов из файла, отсутствующие в нем, снимаются
+        с продажи после записи всех товаров файла; если задание завершилось
+        ошибкой, продукты с продажи не снимаются.
+        При dry_run=true импорт выполняется полностью (чтение, проверка, сравнение
+        и запись), но в конце откатывается: отчет задания показывает, сколько
+        продуктов было бы создано, обновлено и снято с продажи, и ошибки.
+        Файл обрабатывается асинхронно: ответ 202 содержит id задания,
+        прогресс и отчет которого возвращает GET Products/import/<job_id>/.
         """,
         request={
             "multipart/form-data": {
@@ -503,48 +658,131 @@ product_import_schema = extend_schema_view(
                     "file": {
                         "type": "string",
                         "format": "binary",
-                        "description": "Файл YAML с данными о продуктах."
+                        "description": "Файл прайс-листа (YAML, CSV, JSON Lines или XLSX)."
+                    },
+                    "mode": {
+                        "type": "string",
+                        "enum": ["update", "replace"],
+                        "default": "update",
+                        "description": "Режим импорта: update - создание и обновление продуктов, "
+                                       "replace - файл является полным каталогом продавца."
+                    },
+                    "dry_run": {
+                        "type": "boolean",
+                        "default": False,
+                        "description": "Пробный импорт: отчет составляется, изменения не сохраняются."
                     }
                 },
                 "required": ["file"],
             }
         },
         responses={
-            200: ProductImportSuccessSerializer,
-            207: ProductImportSuccessSerializer, # Multi-Status для частичного успеха/ошибок
+            202: OpenApiResponse(description="Файл принят на обработку."),
             400: ProductImportErrorSerializer,
-            500: ProductImportErrorSerializer,
+            403: OpenApiResponse(description="Недостаточно прав."),
         },
         examples=[
             OpenApiExample(
-                'Пример успешного ответа',
+                'Пример ответа',
                 value={
-                    "message": "Импорт продуктов завершен.",
-                    "imported_count": 2,
-                    "updated_count": 1,
-                    "errors": []
+                    "message": "Файл принят на обработку.",
+                    "job_id": 1,
+                    "status_url": "/api/Products/import/1/"
                 },
                 response_only=True,
-                status_codes=["200", "207"]
+                status_codes=["202"]
             ),
             OpenApiExample(
-                'Пример ответа с ошибками',
+                'Пример ошибки запроса',
+                value={"error": "Файл прайс-листа не был предоставлен."},
+                response_only=True,
+                status_codes=["400"]
+            ),
+        ]
+    )
+)
+
+import_job_schema = extend_schema_view(
+    get=extend_schema(
+        tags=['Продукты'],
+        summary="Состояние задания импорта",
+        description="""
+        Возвращает состояние задания импорта (pending, running, done, failed),
+        количество обработанных товаров из общего числа, счетчики созданных
+        и обновленных продуктов, товаров без изменений (пропускаются по хэшу
+        данных с прошлого импорта), товаров прошлого импорта, отсутствующих
+        в файле (removed_count, только в режиме replace, считается по завершении), и ошибки,
+        накопленные к моменту запроса.
+        timings - время этапов в секундах: parse (чтение файла), validate
+        (проверка товаров), diff (сравнение с каталогом), write (запись),
+        total (все задание) и скорость импорта items_per_second.
+        Для пробного импорта (dry_run) счетчики показывают изменения,
+        которые внес бы импорт; сами изменения не сохраняются.
+        После завершения задания эти поля содержат итоговый отчет.
+        """,
+        responses={
+            200: ImportJobSerializer,
+            403: OpenApiResponse(description="Недостаточно прав."),
+            404: OpenApiResponse(description="Задание импорта не найдено."),
+        },
+        examples=[
+            OpenApiExample(
+                'Пример ответа',
                 value={
-                    "message": "Импорт продуктов завершен.",
-                    "imported_count": 1,
-                    "updated_count": 0,
+                    "id": 1,
+                    "status": "running",
+                    "mode": "update",
+                    "dry_run": False,
+                    "total": 5000,
+                    "processed": 2000,
+                    "imported_count": 15,
+                    "updated_count": 40,
+                    "unchanged_count": 1925,
+                    "removed_count": 0,
+                    "deactivated_count": 0,
                     "errors": [
-                        {"item": {"name": "Невалидный продукт"}, "error": {"name": ["Это поле обязательно."]}}
-                    ]
+                        {"item": {"name": "Невалидный продукт"}, "error": {"price": ["Обязательное поле."]}}
+                    ],
+                    "timings": {"parse": 0.41, "validate": 1.2, "diff": 0.35, "write": 0.9,
+                                "total": 2.9, "items_per_second": 689.7},
+                    "message": "",
+                    "created_at": "2025-01-01T12:00:00Z",
+                    "finished_at": None
                 },
                 response_only=True,
-                status_codes=["207"]
+                status_codes=["200"]
             ),
+        ]
+    ),
+    post=extend_schema(
+        tags=['Продукты'],
+        summary="Повторный запуск задания импорта",
+        description="""
+        Повторно запускает задание импорта в состоянии failed.
+        Порции товаров, записанные до ошибки, сохранены; в режиме replace
+        продукты, отсутствующие в файле, снимаются с продажи только после
+        записи всех порций, поэтому после ошибки они остаются в продаже.
+        Повторный запуск выполняется с меткой прерванного импорта: записанные
+        товары пропускаются по хэшу данных (unchanged_count), а в режиме
+        replace по завершении снимаются с продажи отсутствующие в файле продукты.
+        """,
+        request=None,
+        responses={
+            202: OpenApiResponse(description="Задание запущено повторно."),
+            403: OpenApiResponse(description="Недостаточно прав."),
+            404: OpenApiResponse(description="Задание импорта не найдено."),
+            409: OpenApiResponse(description="Задание не завершилось ошибкой."),
+        },
+        examples=[
             OpenApiExample(
-                'Пример ошибки запроса',
-                value={"error": "Файл YAML не был предоставлен."},
+                'Пример ответа',
+                value={
+                    "message": "Задание импорта запущено повторно.",
+                    "job_id": 1,
+                    "status_url": "/api/Products/import/1/"
+                },
                 response_only=True,
-                status_codes=["400"]
+                status_codes=["202"]
             ),
         ]
     )
@@ -552,4 +790,88 @@ product_import_schema = extend_schema_view(
 
 
 
-__all__ = ['products_list_schema', 'categories_view_schema', 'cart_view_schema', 'products_change_schema', 'product_import_schema']
\ No newline at end of file
+product_facets_schema = extend_schema_view(
+    get=extend_schema(
+        tags=['Продукты'],
+        summary="Получить фасеты категории",
+        description="""
+        Возвращает для указанных категорий список параметров, их значений и число продуктов
+        с каждым значением. Счетчики поддерживаются инкрементально при импорте и изменении
+        параметров, поэтому запрос не пересчитывает их по всей таблице параметров.
+        Для нескольких категорий счетчики суммируются.
+        """,
+        parameters=[
+            OpenApiParameter(
+                name="categories",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=True,
+                description="Список идентификаторов категорий через запятую (например, '1,5').",
+                examples=[OpenApiExample("Фасеты категории", value="1")]
+            ),
+        ],
+        responses={
+            200: OpenApiResponse(
+                description="Фасеты категории.",
+                examples=[
+                    OpenApiExample(
+                        "Фасеты категории",
+                        value={
+                            "message": "Фасеты категории",
+                            "facets": [
+                                {"name": "Цвет", "values": [{"value": "золотистый", "count": 3}, {"value": "черный", "count": 1}]},
+                                {"name": "Встроенная память (Гб)", "values": [{"value": "512", "count": 2}]}
+                            ]
+                        },
+                        response_only=True
+                    )
+                ]
+            ),
+            400: OpenApiResponse(description="Не переданы или неверно указаны категории."),
+        }
+    )
+)
+
+
+product_export_schema = extend_schema_view(
+    get=extend_schema(
+        tags=['Продукты'],
+        summary="Выгрузить весь каталог",
+        description="""
+        Потоковая выгрузка всех продуктов с продавцом, параметрами и категориями.
+        В формате `ndjson` каждая строка - объект JSON одного продукта, в формате `csv`
+        первая строка - заголовок, категории перечислены через `; `, параметры записаны объектом JSON.
+        Ответ отдается по мере чтения каталога, поэтому подходит для каталогов любого размера.
+        """,
+        parameters=[
+            OpenApiParameter(
+                name="output",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                enum=['ndjson', 'csv'],
+                description="Формат выгрузки (по умолчанию ndjson).",
+            ),
+        ],
+        responses={
+            (200, 'application/x-ndjson'): OpenApiResponse(
+                response=OpenApiTypes.STR,
+                description="Продукты каталога, по одному на строку.",
+                examples=[
+                    OpenApiExample(
+                        "Строка выгрузки",
+                        value='{"id": 1, "name": "Смартфон", "price": "110000.00", "description": "", "quantity": 14, '
+                              '"is_available": true, "seller": "seller", "categories": ["Смартфоны"], '
+                              '"parameters": {"Цвет": "золотистый"}}',
+                        response_only=True
+                    )
+                ]
+            ),
+            (200, 'text/csv'): OpenApiResponse(response=OpenApiTypes.STR, description="Продукты каталога в CSV."),
+            400: OpenApiResponse(description="Неизвестный формат выгрузки."),
+        }
+    )
+)
+
+__all__ = ['products_list_schema', 'categories_view_schema', 'cart_view_schema', 'cart_batch_schema', 'cart_summary_schema', 'products_change_schema', 'product_import_schema',
+           'import_job_schema', 'product_facets_schema', 'product_export_schema']
@@ -0,0 +1,139 @@
+"""
+Полнотекстовый поиск по каталогу на основе SQLite FTS5.
+
+Виртуальная таблица products_fts (создается миграцией) хранит по одной
+строке на продукт с rowid = id продукта и колонками name, description и
+parameters (названия и значения всех параметров продукта через пробел).
+Индекс обновляется сигналами при сохранении/удалении продуктов и
+параметров, а массовые операции (импорт, queryset.update) вызывают
+index_products/remove_products явно.
+"""
+import re
+from collections import namedtuple
+
+from django.db import connection
+
+from .models import Product, Parameters, ParameterName
+from .pagination import KeysetPaginator
+from . import cache as catalog_cache
+
+
+FTS_TABLE = 'products_fts'
+
+# веса колонок для bm25: совпадение в названии важнее, чем в описании
+BM25_WEIGHTS = (10.0, 1.0, 3.0)
+
+# ограничение на число параметров в одном SQL-запросе
+CHUNK_SIZE = 500
+
+SearchHit = namedtuple('SearchHit', ['score', 'id'])
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def build_match_query(text):
+    """
+    Превращает пользовательский запрос в выражение FTS5 MATCH.
+
+    Каждое слово ищется как префикс ("iphon" найдет "iPhone"),
+    все слова должны встретиться в продукте. Спецсимволы синтаксиса
+    FTS5 отбрасываются, поэтому запрос пользователя не может сломать SQL.
+    """
+    tokens = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def remove_products(product_ids):
+    """
+    Удаляет продукты из полнотекстового индекса.
+    """
+    with connection.cursor() as cursor:
+        for chunk in _chunks(product_ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk)
+    # результаты поиска в кэше каталога больше не актуальны
+    catalog_cache.touch(catalog_cache.SEARCH)
+
+
+def index_products(product_ids):
+    """
+    Переиндексирует продукты: строка индекса собирается заново из
+    текущих данных продукта и его параметров одним INSERT ... SELECT.
+    Отсутствующие в БД продукты просто удаляются из индекса.
+    """
+    product_table = connection.ops.quote_name(Product._meta.db_table)
+    parameters_table = connection.ops.quote_name(Parameters._meta.db_table)
+    names_table = connection.ops.quote_name(ParameterName._meta.db_table)
+    remove_products(product_ids)
+    with connection.cursor() as cursor:
+        for chunk in _chunks(product_ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                f"""
+                INSERT INTO {FTS_TABLE} (rowid, name, description, parameters)
+                SELECT p.id, p.name, COALESCE(p.description, ''),
+                       COALESCE((SELECT group_concat(n.name || ' ' || COALESCE(pr.value, ''), ' ')
+                                 FROM {parameters_table} pr JOIN {names_table} n ON n.id = pr.parameter_name_id
+                                 WHERE pr.product_id = p.id), '')
+                FROM {product_table} p
+                WHERE p.id IN ({placeholders})
+                """,
+                chunk,
+            )
+    catalog_cache.touch(catalog_cache.SEARCH)
+
+
+class SearchPaginator(KeysetPaginator):
+    """
+    Курсорная пагинация результатов поиска по (релевантность bm25, id).
+
+    bm25 в SQLite возвращает тем меньшее число, чем выше релевантность,
+    поэтому сортировка по возрастанию выдает лучшие совпадения первыми.
+    """
+
+    def __init__(self, page_size=None):
+        super().__init__(fields=('score', 'id'), page_size=page_size)
+
+    def fetch(self, match, position, reverse):
+        direction = 'DESC' if reverse else 'ASC'
+        weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+        params = [match]
+        condition = ''
+        if position is not None:
+            op = '<' if reverse else '>'
+            condition = f'WHERE score {op} %s OR (score = %s AND id {op} %s)'
+            params += [position[0], position[0], position[1]]
+        params.append(self.page_size + 1)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT score, id FROM (
+                    SELECT bm25({FTS_TABLE}, {weights}) AS score, rowid AS id
+                    FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s
+                )
+                {condition}
+                ORDER BY score {direction}, id {direction}
+                LIMIT %s
+                """,
+                params,
+            )
+            return [SearchHit(*row) for row in cursor.fetchall()]
+
+
+def search_products(text, cursor=None, page_size=None):
+    """
+    Ищет продукты по названию, описанию и параметрам.
+
+    Возвращает кортеж (список id продуктов в порядке релевантности,
+    курсор следующей страницы, курсор предыдущей страницы).
+    Выбрасывает InvalidCursor при некорректном курсоре.
+    """
+    match = build_match_query(text)
+    if not match:
+        return [], None, None
+    hits, next_cursor, previous_cursor = SearchPaginator(page_size=page_size).paginate(match, cursor)
+    return [hit.id for hit in hits], next_cursor, previous_cursor
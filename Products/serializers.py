@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from .models import Product, Category, Cart, CartProduct, Parameters
+from .models import Product, Category, Cart, CartProduct, Parameters, ImportJob, parse_numeric_value
 from Users.models import MarketUser
 
 
@@ -9,10 +9,18 @@ class ParameterSerializer(serializers.ModelSerializer):
     Сериализатор для модели Parameters.
     Используется для обработки вложенных параметров продукта.
     """
+    # название хранится в справочнике ParameterName, в API передается строкой
+    name = serializers.CharField(max_length=255)
+
     class Meta:
         model = Parameters
         fields = ['name', 'value']
 
+    def validate(self, data):
+        # сохраняем разобранное числовое значение и единицу измерения вместе с параметром
+        data['numeric_value'], data['unit'] = parse_numeric_value(data.get('value'), data.get('name'))
+        return data
+
 # сериализаторы для продуктов
 class ProductSerializer(serializers.ModelSerializer):
     """
@@ -139,6 +147,46 @@ class ProductSearchSerializer(serializers.Serializer):
         required=False,
         allow_null=True
     )
+    # строка полнотекстового поиска по названию, описанию и параметрам
+    q = serializers.CharField(required=False, allow_blank=False)
+    # курсор и размер страницы для постраничного просмотра каталога
+    cursor = serializers.CharField(required=False, allow_blank=False)
+    page_size = serializers.IntegerField(required=False, min_value=1)
+    # фильтры по значениям параметров в виде "Название=значение", можно передать несколько
+    param = serializers.ListField(child=serializers.CharField(), required=False)
+    # фильтры по диапазону числовых значений параметров в виде "Название=число"
+    param_min = serializers.ListField(child=serializers.CharField(), required=False)
+    param_max = serializers.ListField(child=serializers.CharField(), required=False)
+
+    def validate_param(self, value):
+        """
+        Разбирает фильтры по параметрам в список пар (название, значение).
+        """
+        predicates = []
+        for predicate in value:
+            name, separator, param_value = predicate.partition('=')
+            if not separator or not name.strip():
+                raise ValidationError(f"Фильтр '{predicate}' должен иметь вид 'Название=значение'.")
+            predicates.append((name.strip(), param_value.strip()))
+        return predicates
+
+    def _validate_range(self, value):
+        """
+        Разбирает фильтры по диапазону в список пар (название, граница).
+        """
+        predicates = []
+        for name, bound in self.validate_param(value):
+            number, _ = parse_numeric_value(bound)
+            if number is None:
+                raise ValidationError(f"Граница диапазона для параметра '{name}' должна быть числом.")
+            predicates.append((name, number))
+        return predicates
+
+    def validate_param_min(self, value):
+        return self._validate_range(value)
+
+    def validate_param_max(self, value):
+        return self._validate_range(value)
 
     def validate(self, data):
         # Получаем все ключи из исходных данных
@@ -166,6 +214,23 @@ class ProductSearchSerializer(serializers.Serializer):
         return attrs
     
 
+class ProductFacetsSerializer(serializers.Serializer):
+    categories = serializers.CharField(
+        required=True,
+        help_text="Список идентификаторов категорий через запятую."
+    )
+
+
+class ProductExportSerializer(serializers.Serializer):
+    # параметр называется output, так как format зарезервирован DRF
+    output = serializers.ChoiceField(
+        choices=['ndjson', 'csv'],
+        required=False,
+        default='ndjson',
+        help_text="Формат выгрузки: ndjson или csv."
+    )
+
+
 class ProductAddToCartSerializer(serializers.Serializer):
     id = serializers.IntegerField(required=True, allow_null=False)
     quantity = serializers.IntegerField(required=True, allow_null=False)
@@ -267,6 +332,56 @@ class CategoryUpdateSerializer(CategorySerializer):
     name = serializers.CharField(required=False, allow_null=True)
 
 
+class CartBatchItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField(help_text="ID продукта.")
+    quantity = serializers.IntegerField(min_value=1, help_text="Количество продукта в корзине.")
+
+
+class CartBatchSerializer(serializers.Serializer):
+    """
+    Сериализатор пакетного изменения корзины: добавление или изменение
+    количества продуктов (items) и удаление продуктов (remove).
+    """
+    items = CartBatchItemSerializer(many=True, required=False, default=list,
+                                    help_text="Продукты, которые нужно добавить или количество которых нужно изменить.")
+    remove = serializers.ListField(child=serializers.IntegerField(), required=False, default=list,
+                                   help_text="ID продуктов, которые нужно удалить из корзины.")
+
+    def validate(self, data):
+        ids = [item['id'] for item in data['items']]
+        if not ids and not data['remove']:
+            raise ValidationError("Не переданы изменения корзины.")
+        if len(set(ids)) != len(ids):
+            raise ValidationError("Продукт указан в items несколько раз.")
+        if set(ids) & set(data['remove']):
+            raise ValidationError("Продукт не может одновременно добавляться и удаляться из корзины.")
+        return data
+
+
+class ProductDeleteSerializer(serializers.Serializer):
+    """
+    Сериализатор поиска удаляемого продукта: только id или name,
+    параметры просмотра каталога (курсор, поиск, фильтры) не принимаются.
+    """
+    id = serializers.IntegerField(required=False, allow_null=True)
+    name = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, data):
+        # Получаем все ключи из исходных данных
+        received_keys = set(self.initial_data.keys())
+        # Получаем ключи, объявленные в сериализаторе
+        allowed_keys = set(self.fields.keys())
+        # Находим неизвестные ключи
+        unknown_keys = received_keys - allowed_keys
+        # Проверяем наличие неизвестных ключей
+        if unknown_keys:
+            raise ValidationError(
+                f"Недопустимые поля: {', '.join(unknown_keys)}. "
+                f"Допустимые поля: {', '.join(allowed_keys)}."
+            )
+        return super().validate(data)
+
+
 class CartProductSearchSerializer(serializers.Serializer):
     id = serializers.IntegerField(required=True, allow_null=False)
 
@@ -304,6 +419,18 @@ class DeleteParametersSerializer(serializers.Serializer):
 
 class ProductImportSerializer(serializers.Serializer):
     file = serializers.FileField(required=True)
+    mode = serializers.ChoiceField(
+        choices=['update', 'replace'],
+        required=False,
+        default='update',
+        help_text="Режим импорта: update - создание и обновление продуктов, "
+                  "replace - файл является полным каталогом продавца."
+    )
+    dry_run = serializers.BooleanField(
+        required=False,
+        default=False,
+        help_text="Пробный импорт: отчет составляется, изменения не сохраняются."
+    )
 
 class ProductImportErrorSerializer(serializers.Serializer):
     message = serializers.CharField(required=True)
@@ -315,6 +442,16 @@ class ProductImportSuccessSerializer(serializers.Serializer):
     imported_count = serializers.IntegerField(required=True)
     updated_count = serializers.IntegerField(required=True)
 
+class ImportJobSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор состояния задания импорта: прогресс и отчет.
+    """
+    class Meta:
+        model = ImportJob
+        fields = ['id', 'status', 'mode', 'dry_run', 'total', 'processed', 'imported_count', 'updated_count',
+                  'unchanged_count', 'removed_count', 'deactivated_count', 'errors', 'timings', 'message',
+                  'created_at', 'finished_at']
+
 class ProductImageSerializer(serializers.Serializer):
     """
     Сериализатор для загрузки изображения продукта.
@@ -343,6 +480,8 @@ class ProductImageGetSerializer(serializers.Serializer):
 __all__ = [
     'ProductSerializer',
     'ProductSearchSerializer',
+    'ProductFacetsSerializer',
+    'ProductExportSerializer',
     'ProductAddToCartSerializer',
     'ProductUpdateSerializer',
     'CategorySerializer',
@@ -352,6 +491,9 @@ __all__ = [
     'ProductAddSerializer',
     'ProductsListSerializer',
     'CartProductSearchSerializer',
+    'ProductDeleteSerializer',
+    'CartBatchItemSerializer',
+    'CartBatchSerializer',
     'ProductChangeAvailabilitySerializer',
     'CreateParametersSerializer',
     'UpdateParametersSerializer',
@@ -361,6 +503,7 @@ __all__ = [
     'ProductImportSerializer',
     'ProductImportErrorSerializer',
     'ProductImportSuccessSerializer',
+    'ImportJobSerializer',
     'AddProductImportSerializer',
     'ProductImageSerializer',
     'ProductImageDeleteSerializer',
@@ -0,0 +1,63 @@
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Product, Parameters, Category, CartProduct
+from . import search
+from . import cache as catalog_cache
+
+
+# поддерживаем полнотекстовый индекс в актуальном состоянии
+# при изменении продукта или его параметров через ORM
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, **kwargs):
+    search.index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+    catalog_cache.touch_products([instance.pk], catalog_cache.LISTING)
+
+
+# каскадное удаление позиций корзин не меняет итоги корзин,
+# поэтому позиции удаляются заранее вместе со сдвигом итогов
+@receiver(pre_delete, sender=Product)
+def remove_deleted_product_from_carts(sender, instance, **kwargs):
+    CartProduct.objects.filter(product=instance).delete()
+
+
+@receiver(post_save, sender=Parameters)
+@receiver(post_delete, sender=Parameters)
+def reindex_parameter_product(sender, instance, **kwargs):
+    if instance.product_id:
+        search.index_products([instance.product_id])
+        Product.objects.filter(pk=instance.product_id).touch(catalog_cache.PARAMETERS)
+
+
+# изменение состава категории затрагивает
+# списки по этой категории и сами продукты (в них выводятся категории)
+@receiver(m2m_changed, sender=Category.products.through)
+def touch_category_products(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        # изменение со стороны продукта: product.categories.add(...)
+        products = Product.objects.filter(pk=instance.pk)
+        category_ids = pk_set if pk_set is not None else instance.categories.values_list('id', flat=True)
+    else:
+        # изменение со стороны категории: category.products.add(...)
+        category_ids = [instance.pk]
+        products = Product.objects.filter(pk__in=pk_set) if pk_set is not None else instance.products.all()
+    catalog_cache.touch_categories(category_ids)
+    products.touch()
+
+
+@receiver(post_save, sender=Category)
+def touch_saved_category(sender, instance, **kwargs):
+    catalog_cache.touch_categories([instance.pk], catalog_cache.CATEGORIES)
+
+
+@receiver(pre_delete, sender=Category)
+def touch_deleted_category(sender, instance, **kwargs):
+    catalog_cache.touch_categories([instance.pk], catalog_cache.CATEGORIES)
+    instance.products.touch()
@@ -23,4 +23,66 @@ def process_product_image(product_image_id):
     except ProductImage.DoesNotExist:
         print(f"Изображение продукта с ID {product_image_id} не найдено.")
     except Exception as e:
-        print(f"Ошибка при обработке изображения продукта ID {product_image_id}: {e}")
\ No newline at end of file
+        print(f"Ошибка при обработке изображения продукта ID {product_image_id}: {e}")
+
+@shared_task
+def run_import_job(import_job_id):
+    """
+    Асинхронная задача импорта загруженного прайс-листа.
+    По ходу выполнения сохраняет в задании прогресс и промежуточный отчет.
+    """
+    from django.utils import timezone
+    from .models import ImportJob
+    from .importer import CatalogImporter
+    from .pricelists import PriceListError, reader_for
+
+    try:
+        job = ImportJob.objects.select_related('user').get(id=import_job_id)
+    except ImportJob.DoesNotExist:
+        print(f"Задание импорта с ID {import_job_id} не найдено.")
+        return
+
+    jobs = ImportJob.objects.filter(id=job.id)
+
+    def progress_fields(importer):
+        return dict(total=importer.total, processed=importer.processed,
+                    imported_count=importer.imported_count, updated_count=importer.updated_count,
+                    unchanged_count=importer.unchanged_count, removed_count=importer.removed_count,
+                    deactivated_count=importer.deactivated_count,
+                    errors=importer.errors, timings=importer.timings_report())
+
+    def save_progress(importer):
+        # вызывается между порциями, вне их транзакций (в том числе при пробном
+        # импорте), поэтому прогресс сразу виден веб-процессу через БД
+        jobs.update(**progress_fields(importer))
+
+    try:
+        # повторный запуск задания после ошибки продолжает импорт с его меткой
+        importer = CatalogImporter(user=job.user, progress=save_progress, replace=job.mode == ImportJob.REPLACE,
+                                   token=job.import_token or None, dry_run=job.dry_run)
+        jobs.update(status=ImportJob.RUNNING, import_token=importer.token)
+        with job.file.open('rb') as stream:
+            # файл читается потоково, товары импортируются порциями
+            with importer.stage('parse'):
+                price_list = reader_for(job.file.name)(stream)
+            jobs.update(total=price_list.total)
+            importer.run(price_list.categories, price_list.goods(), total=price_list.total)
+    except PriceListError as e:
+        jobs.update(status=ImportJob.FAILED, message=str(e), finished_at=timezone.now())
+        return
+    except Exception as e:
+        # транзакция текущей порции откатывается, записанные ранее порции сохраняются
+        jobs.update(status=ImportJob.FAILED, message=f"Неизвестная ошибка при импорте: {e}", finished_at=timezone.now())
+        return
+
+    message = "Пробный импорт завершен, изменения не сохранены." if job.dry_run else "Импорт продуктов завершен."
+    jobs.update(status=ImportJob.DONE, message=message, finished_at=timezone.now(), **progress_fields(importer))
+
+@shared_task
+def persist_cart(user_id):
+    """
+    Асинхронная задача отложенной записи корзины из кэша в БД (см. Products/carts.py).
+    """
+    from .carts import CacheCartStore
+
+    CacheCartStore().flush(user_id)
@@ -4,8 +4,13 @@ from . import views
 urlpatterns = [
     path('Products/', views.ProductsView.as_view(), name='Products'),
     path('Products/Change/', views.ProductsChangeView.as_view(), name='ChangeProducts'),
+    path('Products/facets/', views.ProductFacetsView.as_view(), name='ProductFacets'),
+    path('Products/export/', views.ProductExportView.as_view(), name='ProductExport'),
     path('Categories/', views.CategoriesView.as_view(), name='Categories'),
     path('Cart/', views.CartView.as_view(), name='Cart'),
+    path('Cart/batch/', views.CartBatchView.as_view(), name='CartBatch'),
+    path('Cart/summary/', views.CartSummaryView.as_view(), name='CartSummary'),
     path('Products/import/', views.ProductImportView.as_view(), name='import_products'),
+    path('Products/import/<int:job_id>/', views.ImportJobView.as_view(), name='import_job'),
     path('Products/image/', views.ProductImageView.as_view(), name='products_image'),
 ] 
@@ -7,16 +7,116 @@ from Orders.models import Order, OrderProduct
 from Users.models import MarketUser
 from Users.serializers import UserSerializer, ViewUsernameSerializer
 from .serializers import *
-from .models import Product, Category, Cart, CartProduct, Parameters, ProductImage
+from .models import (Product, Category, Cart, CartProduct, Parameters, ParameterName, ProductImage, ImportJob,
+                     parse_numeric_value)
 from rest_framework import status, serializers
 from django.core.mail import send_mail
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.db import transaction
+from django.db.models import Case, F, Value, When
 import os
+from decimal import Decimal
 from .schema import *
-import yaml
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from easy_thumbnails.files import get_thumbnailer # Импорт get_thumbnailer
-from .tasks import process_product_image # Импорт задач Celery
+from .tasks import process_product_image, run_import_job # Импорт задач Celery
+from .pagination import KeysetPaginator, InvalidCursor
+from . import search, facets, export, pricelists, carts
+from . import cache as catalog_cache
+from Market import conditional
+
+def parse_category_ids(categories_param):
+    """
+    Разбирает параметр categories: один ID '1' или несколько '1,2,3'.
+    Выбрасывает ValueError, если среди значений есть не числа.
+    """
+    return [int(cat_id) for cat_id in categories_param.split(',')]
+
+
+def cached_response(request, data, keys, before, headers):
+    """
+    Сохраняет данные ответа и его заголовки ETag/Last-Modified
+    в кэше каталога вместе с версиями зависимостей ответа.
+    before - версии, прочитанные catalog_cache.snapshot() до выборки данных.
+    """
+    catalog_cache.store(request, data, keys, before, headers)
+    return Response(data, status=status.HTTP_200_OK, headers={**headers, 'X-Cache': 'MISS'})
+
+
+def cache_hit_response(request):
+    """
+    Отдает ответ из кэша каталога (или 304, если клиент уже имеет
+    актуальную версию), если ни одна из зависимостей ответа не менялась.
+    Возвращает None при промахе.
+    """
+    cached = catalog_cache.lookup(request)
+    if cached is None:
+        return None
+    data, headers = cached
+    return conditional.not_modified(request, headers) or Response(
+        data, status=status.HTTP_200_OK, headers={**headers, 'X-Cache': 'HIT'})
+
+
+def cart_contents(user_id):
+    """
+    Содержимое корзины пользователя: id корзины, позиции и общая стоимость.
+    """
+    # позиции корзины вместе с продуктами и продавцами читаются одним запросом,
+    # стоимость позиций и корзины считается в том же проходе
+    cart_id, lines = carts.get_store().lines(user_id)
+    cart_products = []
+    total_price = Decimal('0.00')
+    for product, quantity in lines:
+        subtotal = product.price * quantity
+        total_price += subtotal
+        cart_products.append({
+            'name': product.name,
+            'quantity': quantity,
+            'price': product.price,
+            'subtotal': subtotal,
+            'id': product.id,
+            'is_available': product.is_available,
+            'seller': product.seller.username if product.seller else None
+        })
+    return {'id': cart_id, 'Cart_products': cart_products, 'Total_price': total_price}
+
+
+def ordered_quantities(lines):
+    """
+    Количество каждого продукта в позициях корзины: {id продукта: количество}.
+    """
+    ordered = {}
+    for line in lines:
+        ordered[line.product_id] = ordered.get(line.product_id, 0) + line.quantity
+    return ordered
+
+
+def checkout_problem(lines, stock):
+    """
+    Ответ 406 для первой позиции корзины, которую нельзя заказать: сначала
+    проверяется количество товара (по всем позициям продукта), затем
+    его доступность.
+    stock - словарь {id продукта: (остаток, доступность)}.
+    Возвращает None, если заказать можно все позиции.
+    """
+    ordered = ordered_quantities(lines)
+    for line in lines:
+        if stock.get(line.product_id, (0, False))[0] < ordered[line.product_id]:
+            return Response({'message': 'Недостаточное количество товара',
+                             'id': line.product_id,
+                             'name': line.product.name},
+                            status=status.HTTP_406_NOT_ACCEPTABLE)
+    for line in lines:
+        if not stock.get(line.product_id, (0, False))[1]:
+            return Response({'message': 'Товар недоступен для заказа',
+                             'id': line.product_id,
+                             'name': line.product.name},
+                            status=status.HTTP_406_NOT_ACCEPTABLE)
+    return None
+
 
 # Документация для ProductsView
 @products_list_schema
@@ -31,6 +131,11 @@ class ProductsView(APIView):
         id (int): идентификатор продукта
         name (str): название продукта
         categories (list): список идентификаторов категорий
+        q (str): строка полнотекстового поиска (результаты упорядочены по релевантности)
+        param (list): фильтры по параметрам вида 'Название=значение' для списка продуктов
+        param_min, param_max (list): границы диапазона числовых параметров вида 'Название=число'
+        cursor (str): курсор страницы из полей next/previous предыдущего ответа
+        page_size (int): размер страницы полного списка продуктов
 
         Возвращает:
         Response: объект ответа с сообщением об успешном поиске
@@ -42,32 +147,83 @@ class ProductsView(APIView):
 
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        
-        # если не переданы данные, выводим список всех продуктов
-        if not any([key in serializer.validated_data for key in ['id', 'name', 'categories']]):
-            products = Product.objects.all()
 
-            return Response({'message': 'Все продукты',
+        # отдаем ответ из кэша каталога, если ни одна из его зависимостей не менялась
+        cached = cache_hit_response(request)
+        if cached is not None:
+            return cached
+        # версии зависимостей читаются до выборки данных
+        before = catalog_cache.snapshot()
+        # ответы с фильтрами по параметрам зависят еще и от значений параметров
+        filter_scopes = [catalog_cache.PARAMETERS] if any(
+            key in serializer.validated_data for key in ('param', 'param_min', 'param_max')) else []
+
+        # если передана строка поиска, ищем по полнотекстовому индексу
+        if 'q' in serializer.validated_data:
+            try:
+                product_ids, next_cursor, previous_cursor = search.search_products(
+                    serializer.validated_data['q'],
+                    cursor=serializer.validated_data.get('cursor'),
+                    page_size=serializer.validated_data.get('page_size'),
+                )
+            except InvalidCursor:
+                return Response({"error": "Неверный курсор страницы."}, status=status.HTTP_400_BAD_REQUEST)
+            # порядок выдачи зависит не только от найденных продуктов, поэтому входит в ETag
+            headers = conditional.validators(request, Product.objects.filter(id__in=product_ids), product_ids)
+            not_modified = conditional.not_modified(request, headers)
+            if not_modified:
+                return not_modified
+            # сохраняем порядок по релевантности
+            found = Product.objects.for_catalog().in_bulk(product_ids)
+            products = [found[product_id] for product_id in product_ids if product_id in found]
+            return cached_response(request, {'message': 'Результаты поиска',
+                                             'products': ProductsListSerializer(products, many=True).data,
+                                             'next': next_cursor,
+                                             'previous': previous_cursor,
+                                             }, catalog_cache.dependencies([catalog_cache.SEARCH], product_ids), before, headers)
+
+        # если не переданы данные, выводим список всех продуктов постранично
+        if not any([key in serializer.validated_data for key in ['id', 'name', 'categories']]):
+            queryset = Product.objects.with_parameters(serializer.validated_data.get('param', [])).with_parameter_ranges(
+                serializer.validated_data.get('param_min', []),
+                serializer.validated_data.get('param_max', []),
+            )
+            # если у клиента актуальная версия списка, отвечаем 304 до выборки страницы
+            headers = conditional.validators(request, queryset)
+            not_modified = conditional.not_modified(request, headers)
+            if not_modified:
+                return not_modified
 
-                             'products': ProductsListSerializer(products, many=True).data
-                             }, status=status.HTTP_200_OK)
+            paginator = KeysetPaginator(fields=('name', 'id'), page_size=serializer.validated_data.get('page_size'))
+            try:
+                products, next_cursor, previous_cursor = paginator.paginate(
+                    queryset.for_catalog(),
+                    serializer.validated_data.get('cursor')
+                )
+            except InvalidCursor:
+                return Response({"error": "Неверный курсор страницы."}, status=status.HTTP_400_BAD_REQUEST)
+
+            return cached_response(request, {'message': 'Все продукты',
+                                             'products': ProductsListSerializer(products, many=True).data,
+                                             'next': next_cursor,
+                                             'previous': previous_cursor,
+                                             }, catalog_cache.dependencies(
+                                                 [catalog_cache.LISTING] + filter_scopes,
+                                                 [product.id for product in products]), before, headers)
         
         # если передан список категорий, выводим список продуктов в этих категориях
         if 'categories' in serializer.validated_data:
-            queryset = Product.objects.prefetch_related('categories').all()
+            queryset = Product.objects.for_catalog()
+            category_ids = []
 
             # Получаем параметр 'categories' из URL
             categories_param = request.query_params.get('categories')
 
             if categories_param:
-                # Параметр может быть как одним ID '1', так и несколькими '1,2,3'.
-                # Разбиваем строку по запятым, чтобы получить список строк с ID.
-                category_ids_str = categories_param.split(',')
-
                 try:
-                    # Преобразуем список строк с ID в список целых чисел.
-                    # Это именно тот список, который ожидает фильтр '__in'.
-                    category_ids = [int(cat_id) for cat_id in category_ids_str]
+                    # Параметр может быть как одним ID '1', так и несколькими '1,2,3'.
+                    # Преобразуем его в список целых чисел, который ожидает фильтр '__in'.
+                    category_ids = parse_category_ids(categories_param)
                 except (ValueError, TypeError):
                     # Если преобразование не удалось, значит, входные данные некорректны (например, "abc")
                     return Response(
@@ -79,21 +235,46 @@ class ProductsView(APIView):
                 # вызов .distinct() важен, чтобы избежать дублирования продуктов,
                 # если один продукт принадлежит к нескольким запрошенным категориям.
                 queryset = queryset.filter(categories__id__in=category_ids).distinct()
+                # к версиям, прочитанным до выборки, добавляются версии категорий
+                before = catalog_cache.snapshot(category_ids)
+
+            # фильтруем по значениям параметров, если они переданы
+            queryset = queryset.with_parameters(serializer.validated_data.get('param', [])).with_parameter_ranges(
+                serializer.validated_data.get('param_min', []),
+                serializer.validated_data.get('param_max', []),
+            )
+
+            # если у клиента актуальная версия списка, отвечаем 304 до сериализации
+            headers = conditional.validators(request, queryset)
+            not_modified = conditional.not_modified(request, headers)
+            if not_modified:
+                return not_modified
 
             # Сериализуем итоговый queryset и возвращаем ответ
-            serializer = ProductSerializer(queryset, many=True)
-            return Response(serializer.data)
+            products = list(queryset)
+            serializer = ProductSerializer(products, many=True)
+            # без фильтра по категориям список зависит от состава всего каталога
+            scopes = filter_scopes if category_ids else [catalog_cache.LISTING] + filter_scopes
+            return cached_response(request, serializer.data, catalog_cache.dependencies(
+                scopes, [product.id for product in products], category_ids), before, headers)
         
         # если категория не передана ищем продукт по id или названию
-        products = Product.objects.filter(**serializer.validated_data)
-        if not products.exists():
+        lookup = {key: value for key, value in serializer.validated_data.items() if key in ('id', 'name')}
+        products = Product.objects.for_catalog().filter(**lookup)
+        product = products.first()
+        if product is None:
             return Response({'message': 'Продукт не найден'}, status=status.HTTP_404_NOT_FOUND)
-        
+
+        # если у клиента актуальная версия, отвечаем 304 до сериализации
+        headers = conditional.validators(request, products)
+        not_modified = conditional.not_modified(request, headers)
+        if not_modified:
+            return not_modified
+
         # если продукт найден, возвращаем его
-        product = products.first()
-        return Response({'message': 'Продукт найден',
-                         'product': ProductSerializer(product).data
-                         }, status=status.HTTP_200_OK)
+        return cached_response(request, {'message': 'Продукт найден',
+                                         'product': ProductSerializer(product).data
+                                         }, catalog_cache.dependencies([catalog_cache.LISTING], [product.id]), before, headers)
     # вьюшка для создания продукта
     def post(self, request, perm='Users.add_product'):
         """
@@ -184,9 +365,11 @@ class ProductsView(APIView):
         update_data = {k: v for k, v in serializer.validated_data.items() if k in allowed_fields}
         for key, value in update_data.items():
             setattr(product, key, value)
-            
+        if 'is_available' in update_data:
+            product.delisted_by_import = False
+
         product.save()
-        # если изменена цена, то уведомляем админов
+        # если изменена цена, то уведомляем админов (корзины пересчитывает Product.save)
         if 'price' in update_data:
             for user in MarketUser.objects.filter(user_type='Admin'):
                 user.email_user('Цена продукта изменена', f"Цена продукта {product.name} была изменена на {product.price}",
@@ -210,7 +393,7 @@ class ProductsView(APIView):
             продукта, если такие права есть, или сообщение
             об ошибке, если таких прав нет.
         """
-        serializer = ProductSearchSerializer(data=request.data)
+        serializer = ProductDeleteSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         # Получаем текущего пользователя из сессии
@@ -228,7 +411,9 @@ class ProductsView(APIView):
         # если продукт не найден, возвращаем ошибку
         if not products.exists():
             return Response({'message': 'Продукт не найден'}, status=status.HTTP_404_NOT_FOUND)
-        product = Product.objects.filter(**serializer.validated_data).delete()
+        # вместе с продуктом удаляются его параметры, уменьшаем счетчики фасетов
+        with facets.track_facets(products.values_list('id', flat=True)):
+            product = Product.objects.filter(**serializer.validated_data).delete()
         return Response({"message":"Продукт успешно удален"}, status=status.HTTP_200_OK)
     
     # вьюшка для добавления продукта в корзину
@@ -269,28 +454,15 @@ class ProductsView(APIView):
         # проверяем доступность продукта
         if not product.is_available:
             return Response({'message': 'Продукт недоступен для заказа'}, status=status.HTTP_400_BAD_REQUEST)
-        # получаем текущего пользователя
-        user = MarketUser.objects.get(id=request.session.get('user_id'))
-        
-        # Получаем активную корзину пользователя (или создаем новую)
-        cart, created = Cart.objects.get_or_create(user=user)
-
-        # Создаем или обновляем CartProduct
-        cart_product, created = CartProduct.objects.get_or_create(
-        product=product,
-        cart=cart,
-        defaults={'quantity': serializer.validated_data['quantity']}
-        )
-
-        if not created:
-            cart_product.quantity = serializer.validated_data['quantity']
-            cart_product.save()
+        # добавляем продукт в корзину текущего пользователя или меняем его количество
+        cart_id = carts.get_store().set_quantity(request.session.get('user_id'), product.id,
+                                                 serializer.validated_data['quantity'])
 
         return Response({
             'message': 'Продукт добавлен в корзину',
-            'cart_id': cart.id,
+            'cart_id': cart_id,
             'product_id': product.id,
-            'quantity': cart_product.quantity
+            'quantity': serializer.validated_data['quantity']
         }, status=status.HTTP_200_OK)
 
 
@@ -309,12 +481,18 @@ class ProductsChangeView(APIView):
         # если id продукта не передан, то меняем is_available всех продуктов продавца
         if 'id' not in serializer.validated_data:
             print('id нет в данных, меняем is_available всех продуктов продавца')
-            Product.objects.filter(seller=MarketUser.objects.get(id=request.session.get('user_id'))).update(is_available=request.data['is_available'])
+            products = Product.objects.filter(seller=MarketUser.objects.get(id=request.session.get('user_id')))
+            product_ids = list(products.values_list('id', flat=True))
+            # update() не вызывает save(), поэтому updated_at и версии в кэше каталога обновляем явно
+            # доступность задана продавцом, импорт больше не должен ее менять
+            products.update(is_available=request.data['is_available'], delisted_by_import=False, updated_at=timezone.now())
+            catalog_cache.touch_products(product_ids)
             return Response({'message': 'Доступность продуктов успешно изменена'}, status=status.HTTP_200_OK)
         # если id продукта передан, то меняем is_available конкретного продукта
         print('id есть в данных, меняем is_available конкретного продукта')
         product = Product.objects.get(id=request.data['id'])
         product.is_available = request.data['is_available']
+        product.delisted_by_import = False
         product.save()
         return Response({'message': 'Доступность продукта успешно изменена'}, status=status.HTTP_200_OK)
 
@@ -339,13 +517,14 @@ class ProductsChangeView(APIView):
         print('все проверки прошли, добавляем параметры конкретного продукта')
         print(serializer.validated_data)
         # если id продукта передан, то добавляем параметры конкретного продукта
-        Product.objects.get(id=serializer.validated_data['product_id']).parameters.add(
-            Parameters.objects.create(
-                product=Product.objects.get(id=serializer.validated_data['product_id']),
-                name=serializer.validated_data['name'],
-                value=serializer.validated_data.get('value')
+        with facets.track_facets([serializer.validated_data['product_id']]):
+            Product.objects.get(id=serializer.validated_data['product_id']).parameters.add(
+                Parameters.objects.create(
+                    product=Product.objects.get(id=serializer.validated_data['product_id']),
+                    name=serializer.validated_data['name'],
+                    value=serializer.validated_data.get('value')
+                )
             )
-        )
         return Response({'message': 'Параметры продукта успешно добавлены'}, status=status.HTTP_200_OK)
 
         #вьюшка для удаления параметров товара
@@ -358,7 +537,11 @@ class ProductsChangeView(APIView):
             return Response({'message': 'Недостаточно прав'}, status=status.HTTP_403_FORBIDDEN)
         # если id параметра не передан, то удаляем все параметры продукта
         if 'parameters_id' not in serializer.validated_data:
-            Product.objects.get(id=serializer.validated_data['product_id']).parameters.clear()
+            with facets.track_facets([serializer.validated_data['product_id']]):
+                Product.objects.get(id=serializer.validated_data['product_id']).parameters.clear()
+            # clear() выполняется одним UPDATE без сигналов, обновляем поисковый индекс и кэш каталога явно
+            search.index_products([serializer.validated_data['product_id']])
+            Product.objects.filter(id=serializer.validated_data['product_id']).touch(catalog_cache.PARAMETERS)
             return Response({'message': 'Параметры продукта успешно удалены'}, status=status.HTTP_200_OK)   
         # проверяем, что продукт относится к продавцу
         if serializer.validated_data['product_id'] not in Product.objects.filter(seller=MarketUser.objects.get(id=request.session.get('user_id'))).values_list('id', flat=True):
@@ -369,7 +552,8 @@ class ProductsChangeView(APIView):
         except Parameters.DoesNotExist:
             return Response({'message': 'Такого параметра не существует'}, status=status.HTTP_404_NOT_FOUND)
         # параметры существуют, удаляем    
-        Product.objects.get(id=serializer.validated_data['product_id']).parameters.get(id=serializer.validated_data['parameters_id']).delete()
+        with facets.track_facets([serializer.validated_data['product_id']]):
+            Product.objects.get(id=serializer.validated_data['product_id']).parameters.get(id=serializer.validated_data['parameters_id']).delete()
         return Response({'message': 'Параметры продукта успешно удалены'}, status=status.HTTP_200_OK)
 
     # вьюшка для изменения параметров товара
@@ -397,23 +581,92 @@ class ProductsChangeView(APIView):
             Parameters.objects.get(id=serializer.validated_data['parameters_id'])
         except Parameters.DoesNotExist:
             return Response({'message': 'Такого параметра не существует'}, status=status.HTTP_404_NOT_FOUND)
-        param =Product.objects.get(id=serializer.validated_data['product_id']).parameters.all()
-        print(param.all())
-        param.update(
-            name=serializer.validated_data['name'],
-            value=serializer.validated_data['value']
+        # изменяем только указанный параметр этого продукта
+        param = Product.objects.get(id=serializer.validated_data['product_id']).parameters.filter(
+            id=serializer.validated_data['parameters_id']
         )
+        with facets.track_facets([serializer.validated_data['product_id']]):
+            numeric_value, unit = parse_numeric_value(serializer.validated_data['value'], serializer.validated_data['name'])
+            param.update(
+                parameter_name=ParameterName.objects.get_or_create(name=serializer.validated_data['name'])[0],
+                value=serializer.validated_data['value'],
+                numeric_value=numeric_value,
+                unit=unit,
+            )
+        # update() выполняется без сигналов, обновляем поисковый индекс и кэш каталога явно
+        search.index_products([serializer.validated_data['product_id']])
+        Product.objects.filter(id=serializer.validated_data['product_id']).touch(catalog_cache.PARAMETERS)
         return Response({'message': 'Параметры продукта успешно изменены'}, status=status.HTTP_200_OK)
 
     # вьюшка для импорта товаров из xml файла продавца
 
+
+# вьюшка для получения фасетов (значений параметров и числа продуктов) категории
+@product_facets_schema
+class ProductFacetsView(APIView):
+    def get(self, request):
+        """
+        GET-запрос на получение фасетов категории.
+
+        Параметры:
+        categories (str): идентификаторы категорий через запятую
+
+        Возвращает:
+        Response: объект ответа со списком параметров категории, их значений
+            и числа продуктов с каждым значением. Счетчики читаются из
+            предрасчитанной таблицы ParameterFacet.
+        """
+        serializer = ProductFacetsSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            category_ids = parse_category_ids(serializer.validated_data['categories'])
+        except (ValueError, TypeError):
+            return Response(
+                {"error": "Неверный формат ID категории. Пожалуйста, укажите ID в виде чисел, разделенных запятыми."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({'message': 'Фасеты категории',
+                         'facets': facets.facet_counts(category_ids)
+                         }, status=status.HTTP_200_OK)
+
+
+# вьюшка для потоковой выгрузки всего каталога
+@product_export_schema
+class ProductExportView(APIView):
+    def get(self, request):
+        """
+        GET-запрос на выгрузку всего каталога.
+
+        Параметры:
+        output (str): формат выгрузки, ndjson (по умолчанию) или csv
+
+        Возвращает:
+        StreamingHttpResponse: продукты с продавцом, параметрами и категориями,
+            по одной строке на продукт. Строки формируются по мере чтения
+            каталога порциями, весь каталог в памяти не собирается.
+        """
+        serializer = ProductExportSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        lines, content_type, extension = export.FORMATS[serializer.validated_data['output']]
+        response = StreamingHttpResponse(lines(), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="catalog.{extension}"'
+        return response
+
+
 @product_import_schema
 class ProductImportView(APIView):
     """
-    API-эндпоинт для импорта продуктов из файла YAML.
+    API-эндпоинт для импорта продуктов из файла прайс-листа.
 
     Ожидает POST-запрос с файлом YAML, содержащим информацию о магазине,
-    категориях и товарах, как в shop1.yaml.
+    категориях и товарах, как в shop1.yaml. Также принимаются CSV, JSON Lines
+    и XLSX с колонками выгрузки каталога (см. Products/pricelists.py).
+
+    Файл сохраняется в задании ImportJob и обрабатывается задачей Celery
+    run_import_job; ответ содержит id задания, состояние которого
+    возвращает ImportJobView.
 
     Пример YAML-файла (с учетом новой структуры, продавца, параметров и КАТЕГОРИЙ):
     shop: Связной
@@ -449,7 +702,8 @@ class ProductImportView(APIView):
 
     def post(self, request, perm='Users.add_product'):
         """
-        Обрабатывает POST-запрос для импорта продуктов.
+        Обрабатывает POST-запрос для импорта продуктов:
+        ставит файл в очередь на импорт и возвращает id задания.
         """
         # Проверяем, имеет ли пользователь право на импорт продуктов
         if not MarketUser.AccessCheck(self, request, perm):
@@ -457,157 +711,80 @@ class ProductImportView(APIView):
         # Проверяем, был ли загружен файл
         if 'file' not in request.FILES:
             return Response(
-                {"error": "Файл YAML не был предоставлен. Пожалуйста, загрузите файл с именем 'file'."},
+                {"error": "Файл прайс-листа не был предоставлен. Пожалуйста, загрузите файл с именем 'file'."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        yaml_file = request.FILES['file']
+        price_list_file = request.FILES['file']
 
-        # Проверяем расширение файла, чтобы убедиться, что это YAML
-        if not yaml_file.name.endswith(('.yaml', '.yml')):
+        # Проверяем расширение файла: формат должен поддерживаться импортом
+        if pricelists.reader_for(price_list_file.name) is None:
             return Response(
-                {"error": "Неверный тип файла. Пожалуйста, загрузите файл .yaml или .yml."},
+                {"error": "Неверный тип файла. Пожалуйста, загрузите файл " + ", ".join(pricelists.FORMATS) + "."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            # Читаем содержимое файла
-            file_content = yaml_file.read().decode('utf-8')
-            # Загружаем данные из YAML
-            full_data = yaml.safe_load(file_content)
-        except yaml.YAMLError as e:
-            return Response(
-                {"error": f"Ошибка парсинга YAML-файла: {e}"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        except Exception as e:
-            return Response(
-                {"error": f"Неизвестная ошибка при чтении файла: {e}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        serializer = ProductImportSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        if not isinstance(full_data, dict) or 'goods' not in full_data:
-            return Response(
-                {"error": "Ожидаемый формат YAML-файла: словарь с ключом 'goods', содержащим список продуктов."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        # Получаем текущего аутентифицированного пользователя
+        current_user = MarketUser.objects.get(id=request.session.get('user_id'))
 
-        products_data = full_data.get('goods', [])
-        categories_data = full_data.get('categories', [])
+        # сохраняем файл и передаем импорт задаче Celery
+        job = ImportJob.objects.create(user=current_user, file=price_list_file, mode=serializer.validated_data['mode'],
+                                       dry_run=serializer.validated_data['dry_run'])
+        run_import_job.delay(job.id)
 
-        if not isinstance(products_data, list):
-            return Response(
-                {"error": "Ключ 'goods' в YAML-файле должен содержать список продуктов."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Создаем карту ID категорий к их названиям
-        category_id_to_name_map = {cat['id']: cat['name'] for cat in categories_data if 'id' in cat and 'name' in cat}
+        return Response(
+            {"message": "Файл принят на обработку.", "job_id": job.id,
+             "status_url": reverse('import_job', args=[job.id])},
+            status=status.HTTP_202_ACCEPTED
+        )
 
-        imported_products_count = 0
-        updated_products_count = 0
-        errors = []
 
-        # Получаем текущего аутентифицированного пользователя
-        current_user = MarketUser.objects.get(id=request.session.get('user_id')) if MarketUser.AccessCheck(self, request, 'Users.add_product') else None
-        
-        # Обрабатываем каждый продукт в списке
-        for item_data_raw in products_data:
-            # Создаем копию для модификации без изменения исходных данных
-            item_data = item_data_raw.copy()
-
-            if not isinstance(item_data, dict):
-                errors.append({"item": item_data_raw, "error": "Элемент списка 'goods' должен быть словарем."})
-                continue
-
-            # Определяем продавца для этого продукта
-            seller_to_use = None
-            if 'seller_id' in item_data: # Если seller_id указан в YAML
-                try:
-                    seller_to_use = MarketUser.objects.get(pk=item_data['seller_id'])
-                except MarketUser.DoesNotExist:
-                    errors.append({"item": item_data_raw, "error": f"Продавец с ID {item_data['seller_id']} не найден."})
-                    continue
-            elif current_user: # Если seller_id не указан, используем текущего аутентифицированного пользователя
-                seller_to_use = current_user
-            else:
-                errors.append({"item": item_data_raw, "error": "Продавец не указан в YAML и пользователь не аутентифицирован."})
-                continue
-
-            # Добавляем seller_id в данные для сериализатора
-            item_data['seller_id'] = seller_to_use.pk
-
-            # Преобразование параметров: из словаря в список {'name': ..., 'value': ...}
-            transformed_parameters = []
-            if 'parameters' in item_data and isinstance(item_data['parameters'], dict):
-                for param_name, param_value in item_data['parameters'].items():
-                    transformed_parameters.append({'name': param_name, 'value': str(param_value)})
-            item_data['parameters'] = transformed_parameters
-
-            # Преобразование категорий: из ID в список названий
-            transformed_categories = []
-            if 'category' in item_data:
-                category_id = item_data['category']
-                category_name = category_id_to_name_map.get(category_id)
-                if category_name:
-                    transformed_categories.append(category_name)
-                else:
-                    errors.append({"item": item_data_raw, "error": f"Категория с ID {category_id} не найдена в верхнеуровневом списке категорий."})
-                    # Продолжаем, чтобы не прерывать импорт из-за одной отсутствующей категории
-            item_data['categories'] = transformed_categories
-            
-            # Удаляем поля, которые не соответствуют модели Product напрямую
-            # (id, model, price_rrc, category) - они были обработаны или не нужны
-            item_data.pop('id', None)
-            item_data.pop('model', None)
-            item_data.pop('price_rrc', None)
-            item_data.pop('category', None) # Удаляем исходный ID категории
-
-
-            # Попытка найти существующий продукт по 'name' и 'seller'
-            existing_product = None
-            if 'name' in item_data:
-                try:
-                    existing_product = Product.objects.get(name=item_data['name'], seller=seller_to_use)
-                except Product.DoesNotExist:
-                    pass
-                except Product.MultipleObjectsReturned:
-                    # Этого не должно произойти, если unique_together=('name', 'seller') установлено
-                    errors.append({"item": item_data_raw, "error": f"Найдено несколько продуктов с именем '{item_data['name']}' для продавца '{seller_to_use.username}'."})
-                    continue
-            else:
-                errors.append({"item": item_data_raw, "error": "Отсутствует обязательное поле 'name' для продукта."})
-                continue
-
-            if existing_product:
-                # Если продукт существует, обновляем его
-                serializer = AddProductImportSerializer(existing_product, data=item_data, partial=True)
-                if serializer.is_valid():
-                    serializer.save()
-                    updated_products_count += 1
-                else:
-                    errors.append({"item": item_data_raw, "error": serializer.errors})
-            else:
-                # Если продукт не существует, создаем новый
-                serializer = AddProductImportSerializer(data=item_data)
-                if serializer.is_valid():
-                    serializer.save()
-                    imported_products_count += 1
-                else:
-                    errors.append({"item": item_data_raw, "error": serializer.errors})
+@import_job_schema
+class ImportJobView(APIView):
+    """
+    API-эндпоинт для получения состояния задания импорта и его повторного запуска.
+    """
+    def get(self, request, job_id, perm='Users.add_product'):
+        """
+        Возвращает прогресс задания импорта и отчет о нем.
+        """
+        if not MarketUser.AccessCheck(self, request, perm):
+            return Response({'message': 'Недостаточно прав'}, status=status.HTTP_403_FORBIDDEN)
+        # задание доступно только загрузившему файл пользователю
+        job = ImportJob.objects.filter(id=job_id, user_id=request.session.get('user_id')).first()
+        if job is None:
+            return Response({'message': 'Задание импорта не найдено'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_200_OK)
 
-        response_data = {
-            "message": "Импорт продуктов завершен.",
-            "imported_count": imported_products_count,
-            "updated_count": updated_products_count,
-            "errors": errors,
-        }
+    def post(self, request, job_id, perm='Users.add_product'):
+        """
+        Повторно запускает задание импорта, завершившееся ошибкой.
 
-        if errors:
-            # Возвращаем 207 Multi-Status, если были ошибки, но некоторые продукты были обработаны
-            return Response(response_data, status=status.HTTP_207_MULTI_STATUS)
-        else:
-            return Response(response_data, status=status.HTTP_200_OK)
+        Порции, записанные до ошибки, сохранены, а снятие с продажи в режиме
+        замены выполняется только после записи всех порций. Повторный запуск
+        выполняется с меткой прерванного импорта, записанные товары пропускаются
+        по хэшу данных, и импорт завершается так же, как без ошибки.
+        """
+        if not MarketUser.AccessCheck(self, request, perm):
+            return Response({'message': 'Недостаточно прав'}, status=status.HTTP_403_FORBIDDEN)
+        job = ImportJob.objects.filter(id=job_id, user_id=request.session.get('user_id')).first()
+        if job is None:
+            return Response({'message': 'Задание импорта не найдено'}, status=status.HTTP_404_NOT_FOUND)
+        # задание запускается повторно один раз, даже при одновременных запросах
+        if not ImportJob.objects.filter(id=job.id, status=ImportJob.FAILED).update(
+                status=ImportJob.PENDING, message='', finished_at=None):
+            return Response({'message': 'Повторно запустить можно только задание, завершившееся ошибкой'},
+                            status=status.HTTP_409_CONFLICT)
+        run_import_job.delay(job.id)
+        return Response(
+            {"message": "Задание импорта запущено повторно.", "job_id": job.id,
+             "status_url": reverse('import_job', args=[job.id])},
+            status=status.HTTP_202_ACCEPTED
+        )
 
 # Документация для CategoriesView
 @categories_view_schema
@@ -691,7 +868,11 @@ class CategoriesView(APIView):
         if Category.objects.filter(name=serializer.validated_data['name']).exists():
             return Response({'message': 'Категория с таким названием уже существует'}, status=status.HTTP_400_BAD_REQUEST)
         # изменяем категорию
-        category = Category.objects.filter(id=serializer.validated_data['id']).update(**serializer.validated_data)
+        category = Category.objects.filter(id=serializer.validated_data['id']).update(
+            updated_at=timezone.now(), **serializer.validated_data)
+        # update() не вызывает сигналов: название категории выводится в продуктах и в списке категорий
+        catalog_cache.touch_categories([serializer.validated_data['id']], catalog_cache.CATEGORIES)
+        Product.objects.filter(categories__id=serializer.validated_data['id']).touch()
         return Response(
             {"message": "Категория успешно изменена"}, status=status.HTTP_200_OK)
     # вьюшка для порлучения списка категорий либо категории по id или названию
@@ -713,18 +894,34 @@ class CategoriesView(APIView):
         # проверяем имеет ли пользователь право на получение категории
         if not MarketUser.AccessCheck(self, request, perm):
             return Response({'message': 'Недостаточно прав'}, status=status.HTTP_403_FORBIDDEN)
+        # отдаем ответ из кэша каталога, если категории не менялись
+        cached = cache_hit_response(request)
+        if cached is not None:
+            return cached
+        # версии зависимостей читаются до выборки данных
+        before = catalog_cache.snapshot()
         # проверяем переданы ли id и name
         if 'id' not in serializer.validated_data.keys() and 'name' not in serializer.validated_data.keys():
+            headers = conditional.validators(request, Category.objects.all())
+            not_modified = conditional.not_modified(request, headers)
+            if not_modified:
+                return not_modified
             # возвращаем все категории
-            return Response({'message': 'Категории успешно получены', 'categories': CategorySerializer(Category.objects.all(), many=True).data}, status=status.HTTP_200_OK)
+            return cached_response(request, {'message': 'Категории успешно получены', 'categories': CategorySerializer(Category.objects.all(), many=True).data},
+                                   catalog_cache.dependencies([catalog_cache.CATEGORIES]), before, headers)
         # ищем категорию по id или названию
         categories = Category.objects.filter(**serializer.validated_data)
         # если категория не найдена, возвращаем ошибку
         if not categories.exists():
             return Response({'message': 'Категория не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        headers = conditional.validators(request, categories)
+        not_modified = conditional.not_modified(request, headers)
+        if not_modified:
+            return not_modified
         # если категория найдена, возвращаем ее
         category = categories.first()
-        return Response({'message': 'Категория найдена', 'id': category.id, 'name': category.name}, status=status.HTTP_200_OK)
+        return cached_response(request, {'message': 'Категория найдена', 'id': category.id, 'name': category.name},
+                               catalog_cache.dependencies([catalog_cache.CATEGORIES]), before, headers)
 
 # Документация для CartView
 @cart_view_schema
@@ -746,29 +943,9 @@ class CartView(APIView):
         # проверяем имеет ли пользователь право на получение корзины
         if not MarketUser.AccessCheck(self, request, perm):
             return Response({'message': 'Недостаточно прав'}, status=status.HTTP_403_FORBIDDEN)
-        # получаем текущего пользователя
-        user = MarketUser.objects.get(id=request.session.get('user_id'))
-        # Получаем активную корзину пользователя (или создаем новую)
-        cart, created = Cart.objects.get_or_create(user=user)
-        # Получаем стоимость корзины
-        total_price = int(cart.TotalPrice())
         # возвращаем корзину
-        return Response({
-            'message': 'Корзина успешно получена',
-            'id': cart.id,
-            'Cart_products': [
-                {
-                    'name': product.name,
-                    'quantity': product.cart_products.get(cart=cart).quantity,
-                    'price': product.price,
-                    'id': product.id,
-                    'is_available': product.is_available,
-                    'seller': product.seller.username
-                }
-                for product in cart.products.all()
-            ],
-            'Total_price': total_price
-        }, status=status.HTTP_200_OK)
+        return Response({'message': 'Корзина успешно получена', **cart_contents(request.session.get('user_id'))},
+                        status=status.HTTP_200_OK)
     # вьюшка для удаления продукта из корзины
     def delete(self, request, perm='Users.delete_product_from_cart'):
         """
@@ -785,12 +962,8 @@ class CartView(APIView):
         # если товар не найдена, возвращаем ошибку
         if not products.exists():
             return Response({'message': 'Товар не найдена'}, status=status.HTTP_404_NOT_FOUND)
-        # ищем корзину текущего пользователя
-        user = MarketUser.objects.get(id=request.session.get('user_id'))
-        cart, created = Cart.objects.get_or_create(user=user)
-        # если товар есть в корзине, то удаляем его из корзины
-        if products.first() in cart.products.all():
-            cart_product = CartProduct.objects.filter(cart=cart, product=products.first()).delete()
+        # если товар есть в корзине текущего пользователя, то удаляем его из корзины
+        if carts.get_store().remove(request.session.get('user_id'), products.first().id):
             return Response({"message": "Товар успешно удален из корзины"}, status=status.HTTP_200_OK)
         # если товара нет в корзине, то возвращаем ошибку
         return Response({"message": "Товар не находится в корзине"}, status=status.HTTP_400_BAD_REQUEST)
@@ -819,18 +992,14 @@ class CartView(APIView):
         # если товар не найдена, возвращаем ошибку
         if products is None:
             return Response({'message': 'Товар не найден'}, status=status.HTTP_404_NOT_FOUND)
-        # ищем корзину текущего пользователя
-        user = MarketUser.objects.get(id=request.session.get('user_id'))
-        cart, created = Cart.objects.get_or_create(user=user)
         # проверяем достаточное количество товара в наличии у продавца
         if products.quantity < serializer.validated_data['quantity']:
             return Response({'message': 'Недостаточное количество товара'}, status=status.HTTP_400_BAD_REQUEST)
         # проверяем доступность продукта
         if not products.is_available:
             return Response({'message': 'Товар недоступен для заказа'}, status=status.HTTP_400_BAD_REQUEST)
-        # если товар есть в корзине, то обновляем количество товара в корзине
-        if products in cart.products.all():
-            cart_product = CartProduct.objects.filter(cart=cart, product=products).update(quantity=serializer.validated_data['quantity'])
+        # если товар есть в корзине текущего пользователя, то обновляем количество товара в корзине
+        if carts.get_store().update_quantity(request.session.get('user_id'), products.id, serializer.validated_data['quantity']):
             return Response({"message": "Товар успешно обновлен в корзине"}, status=status.HTTP_200_OK)
         # если товара нет в корзине, то возвращаем ошибку
         return Response({"message": "Товар не находится в корзине"}, status=status.HTTP_400_BAD_REQUEST)
@@ -853,51 +1022,73 @@ class CartView(APIView):
             return Response({'message': 'Недостаточно прав'}, status=status.HTTP_403_FORBIDDEN)
         # получаем текущего пользователя
         user = MarketUser.objects.get(id=request.session.get('user_id'))
-        # Получаем активную корзину пользователя (или создаем новую)
-        cart, created = Cart.objects.get_or_create(user=user)
-        # проверяем, есть ли в корщине товары
-        if not cart.cart_products.exists():
-             return Response({'message': 'В корзине нет товаров'}, status=status.HTTP_406_NOT_ACCEPTABLE)
-        # проверяем, есть ли у покупателя контакты
-        if not user.contacts.exists():
-            return Response({'message': 'Необходимо добавить контактную информацию для оформления заказа'}, status=status.HTTP_406_NOT_ACCEPTABLE)
-        # проверяем достаточное количество товара в наличии у продавца
-        for product in cart.cart_products.all():
-            if product.product.quantity < product.quantity:
-                return Response({'message': 'Недостаточное количество товара',
-                                 'id': product.product.id,
-                                 'name': product.product.name},
-                                  status=status.HTTP_406_NOT_ACCEPTABLE)
-        # проверяем доступность продукта
-        for product in cart.cart_products.all():
-            if not product.product.is_available:
-                return Response({'message': 'Товар недоступен для заказа',
-                                 'id': product.product.id,
-                                 'name': product.product.name},
-                                  status=status.HTTP_406_NOT_ACCEPTABLE)
-        # Создаем заказ
-        order = Order.objects.create(
-            user=user,
-            total_price=cart.TotalPrice()
-        )
-        # добавляем товары из корзины в заказ
-        for product in cart.cart_products.all():
-            order_product = OrderProduct.objects.create(
-                order=order,
-                product=product.product,
-                quantity=product.quantity,
-                seller=product.product.seller,
-                buyer=product.cart.user,
-                status='new'
-            )
-            order.order_products.add(order_product)
-            # уменьшаем количество товара в БД
-            product.product.quantity -= product.quantity
-            product.product.save()
-            # удаляем товар из корзины
-            cart_product = CartProduct.objects.filter(cart=cart, product=product.product).delete()
-        # очищаем корзину
-        cart.products.all().delete()
+        # корзина, которая хранится в кэше, записывается в БД до проверок заказа;
+        # до конца оформления ее не изменяют другие запросы и задача persist_cart
+        with carts.get_store().checkout(user.id):
+            # Получаем активную корзину пользователя (или создаем новую)
+            cart, created = Cart.objects.get_or_create(user=user)
+            # позиции корзины вместе с продуктами читаются одним запросом
+            lines = list(cart.cart_products.select_related('product').order_by('id'))
+            # проверяем, есть ли в корщине товары
+            if not lines:
+                 return Response({'message': 'В корзине нет товаров'}, status=status.HTTP_406_NOT_ACCEPTABLE)
+            # проверяем, есть ли у покупателя контакты
+            if not user.contacts.exists():
+                return Response({'message': 'Необходимо добавить контактную информацию для оформления заказа'}, status=status.HTTP_406_NOT_ACCEPTABLE)
+            # проверяем наличие и доступность товаров по прочитанным позициям
+            problem = checkout_problem(lines, {line.product_id: (line.product.quantity, line.product.is_available)
+                                               for line in lines})
+            if problem:
+                return problem
+            ordered = ordered_quantities(lines)
+            product_ids = list(ordered)
+            with transaction.atomic():
+                # позиции удаляются первым запросом транзакции, поэтому SQLite ждет
+                # блокировку на запись, а не завершается ошибкой при ее повышении после чтения.
+                # Удаляются только прочитанные позиции с прежним количеством: если
+                # параллельный запрос (например, повторная отправка формы) уже оформил
+                # или изменил корзину, удалится меньше позиций, и заказ будет отменен
+                line_quantity = Case(*[When(pk=line.id, then=Value(line.quantity)) for line in lines])
+                deleted, _ = CartProduct.objects.filter(id__in=[line.id for line in lines], quantity=line_quantity).delete()
+                cart_changed = deleted != len(lines)
+                decremented = 0
+                if not cart_changed:
+                    # остатки уменьшаются одним условным UPDATE ... WHERE quantity >= n:
+                    # если параллельный заказ успел забрать товар, условие не выполнится
+                    # хотя бы для одной строки, и заказ будет отменен целиком
+                    ordered_quantity = Case(*[When(pk=product_id, then=Value(count)) for product_id, count in ordered.items()])
+                    decremented = Product.objects.filter(pk__in=product_ids, is_available=True, quantity__gte=ordered_quantity).update(
+                        quantity=F('quantity') - ordered_quantity, updated_at=timezone.now())
+                if decremented == len(product_ids):
+                    Product.objects.filter(pk__in=product_ids, quantity=0).update(is_available=False)
+                    # Создаем заказ
+                    order = Order.objects.create(
+                        user=user,
+                        total_price=sum(line.product.price * line.quantity for line in lines)
+                    )
+                    # добавляем товары из корзины в заказ
+                    OrderProduct.objects.bulk_create([OrderProduct(
+                        order=order,
+                        product=line.product,
+                        quantity=line.quantity,
+                        seller_id=line.product.seller_id,
+                        buyer=user,
+                        status='new'
+                    ) for line in lines])
+                else:
+                    transaction.set_rollback(True)
+            # корзину уже оформил или изменил параллельный запрос
+            if cart_changed:
+                return Response({'message': 'Корзина изменилась, повторите оформление заказа'},
+                                status=status.HTTP_409_CONFLICT)
+            # товар забрал параллельный заказ - сообщаем, какой позиции не хватило
+            if decremented != len(product_ids):
+                stock = {product_id: (quantity, is_available) for product_id, quantity, is_available in
+                         Product.objects.filter(pk__in=product_ids).values_list('id', 'quantity', 'is_available')}
+                # остатки могли снова измениться после отката - заказ все равно не оформлен
+                return checkout_problem(lines, stock) or Response(
+                    {'message': 'Остатки товаров изменились, повторите оформление заказа'}, status=status.HTTP_409_CONFLICT)
+        catalog_cache.touch_products(product_ids)
         # отправляем email
         send_mail(
             subject='Новый заказ',
@@ -909,9 +1100,68 @@ class CartView(APIView):
         return Response({"message": "Заказ успешно оформлен",
                          "id": order.id,
                          "total_price": order.total_price,
-                         "order_products": [order_product.product.name for order_product in order.order_products.all()]
+                         "order_products": [line.product.name for line in lines]
                          }, status=status.HTTP_201_CREATED)
 
+@cart_summary_schema
+class CartSummaryView(APIView):
+    """
+    Итоги корзины покупателя для счетчика корзины в шапке сайта.
+    """
+
+    def get(self, request, perm='Users.view_cart'):
+        """
+        Возвращает количество единиц товара и стоимость корзины,
+        которые читаются из одной строки корзины без выборки позиций.
+        """
+        if not MarketUser.AccessCheck(self, request, perm):
+            return Response({'message': 'Недостаточно прав'}, status=status.HTTP_403_FORBIDDEN)
+        return Response(carts.get_store().summary(request.session.get('user_id')), status=status.HTTP_200_OK)
+
+
+@cart_batch_schema
+class CartBatchView(APIView):
+    """
+    Пакетное изменение корзины покупателя.
+    """
+
+    def post(self, request, perm='Users.add_to_cart'):
+        """
+        Добавляет продукты в корзину, меняет их количество и удаляет продукты
+        из корзины одним запросом.
+
+        Наличие и доступность всех продуктов проверяются одной выборкой
+        до изменения корзины: если хотя бы один продукт не прошел проверку,
+        корзина не изменяется. Изменения применяются в одной транзакции.
+
+        Возвращает:
+        Response: новое содержимое корзины, 404 со списком id, если часть
+            продуктов не найдена, или 400 с ошибками по каждому продукту.
+        """
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # проверяем имеет ли пользователь право на добавление товаров в корзину
+        if not MarketUser.AccessCheck(self, request, perm):
+            return Response({'message': 'Недостаточно прав'}, status=status.HTTP_403_FORBIDDEN)
+        upserts = {item['id']: item['quantity'] for item in serializer.validated_data['items']}
+        products = Product.objects.in_bulk(list(upserts))
+        missing = [product_id for product_id in upserts if product_id not in products]
+        if missing:
+            return Response({'message': 'Продукты не найдены', 'ids': missing}, status=status.HTTP_404_NOT_FOUND)
+        errors = []
+        for product_id, quantity in upserts.items():
+            product = products[product_id]
+            if product.quantity < quantity:
+                errors.append({'id': product_id, 'message': 'Недостаточное количество товара'})
+            elif not product.is_available:
+                errors.append({'id': product_id, 'message': 'Товар недоступен для заказа'})
+        if errors:
+            return Response({'message': 'Корзина не изменена', 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        user_id = request.session.get('user_id')
+        carts.get_store().apply(user_id, upserts, serializer.validated_data['remove'],
+                                {product_id: product.price for product_id, product in products.items()})
+        return Response({'message': 'Корзина обновлена', **cart_contents(user_id)}, status=status.HTTP_200_OK)
+
 # Вьюшка для работы с изображениями продуктов
 class ProductImageView(APIView):
     """
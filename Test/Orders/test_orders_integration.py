@@ -1,9 +1,15 @@
+import threading
+from decimal import Decimal
+
 import pytest
+from django.contrib.sessions.models import Session
+from django.db import connections
 from django.urls import reverse
 from rest_framework import status
+from rest_framework.test import APIClient
 from Orders.models import Order, OrderProduct
-from Products.models import Product
-from Users.models import MarketUser
+from Products.models import Product, Cart, CartProduct
+from Users.models import MarketUser, UserGroup, Contact
 
 @pytest.mark.django_db
 class TestOrderWorkflow:
@@ -60,4 +66,68 @@ class TestOrderWorkflow:
 
         # 7. Verify order is completed
         order_product.refresh_from_db()
-        assert order_product.status == 'Completed'
\ No newline at end of file
+        assert order_product.status == 'Completed'
+
+
+# параллельные оформления заказа не должны продавать больше остатка.
+# Потоки работают через свои соединения с БД и не видят данных внутри
+# транзакции теста, поэтому данные создаются с фиксацией и удаляются вручную
+class TestConcurrentCheckout:
+    BUYERS = 8
+    STOCK = 5
+    ORDERED = 2
+
+    def _checkout(self, client, barrier, results):
+        try:
+            barrier.wait()
+            results.append(client.post(reverse('Cart')).status_code)
+        finally:
+            connections.close_all()
+
+    def test_concurrent_checkouts_do_not_oversell(self, django_db_setup, django_db_blocker):
+        with django_db_blocker.unblock():
+            seller = MarketUser.objects.create_user(username='stress_seller', password='testpass123',
+                                                    email='stress_seller@example.com', user_type='Seller')
+            product = Product.objects.create(name='Stress product', price=Decimal('10.00'), quantity=self.STOCK,
+                                             seller=seller)
+            buyers, clients, sessions = [], [], []
+            try:
+                buyer_group = UserGroup.objects.get(name='Buyer')
+                for i in range(self.BUYERS):
+                    buyer = MarketUser.objects.create_user(username=f'stress_buyer_{i}', password='testpass123',
+                                                           email=f'stress_buyer_{i}@example.com', user_type='Buyer')
+                    buyers.append(buyer)
+                    buyer_group.user_set.add(buyer)
+                    Contact.objects.create(user=buyer, city='City', street='Street', phone='1234567890')
+                    CartProduct.objects.create(cart=Cart.objects.create(user=buyer), product=product,
+                                               quantity=self.ORDERED)
+                    client = APIClient()
+                    client.force_authenticate(user=buyer)
+                    session = client.session
+                    session['user_id'] = buyer.id
+                    session.save()
+                    sessions.append(session.session_key)
+                    clients.append(client)
+
+                barrier = threading.Barrier(self.BUYERS)
+                results = []
+                threads = [threading.Thread(target=self._checkout, args=(client, barrier, results)) for client in clients]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+                sold = self.STOCK // self.ORDERED
+                assert sorted(results) == [status.HTTP_201_CREATED] * sold + [status.HTTP_406_NOT_ACCEPTABLE] * (self.BUYERS - sold)
+                product.refresh_from_db()
+                assert product.quantity == self.STOCK - sold * self.ORDERED
+                assert OrderProduct.objects.filter(product=product).count() == sold
+                # корзины покупателей без заказа не изменились
+                assert CartProduct.objects.filter(product=product).count() == self.BUYERS - sold
+            finally:
+                Cart.objects.filter(user__in=buyers).delete()
+                Order.objects.filter(user__in=buyers).delete()
+                product.delete()
+                Session.objects.filter(session_key__in=sessions).delete()
+                for user in buyers + [seller]:
+                    user.delete()
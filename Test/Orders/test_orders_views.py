@@ -58,6 +58,21 @@ class TestOrderView:
         assert response.status_code == status.HTTP_404_NOT_FOUND
         assert response.data['message'] == 'Заказ не найден'
 
+    def test_conditional_get_orders(self, authenticated_buyer_client, authenticated_seller_client):
+        response = authenticated_buyer_client.get(self.url)
+        etag = response['ETag']
+        assert response.has_header('Last-Modified')
+
+        response = authenticated_buyer_client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response['ETag'] == etag
+
+        # изменение статуса заказа меняет ETag
+        authenticated_seller_client.put(self.url, {'id': self.order_product.id, 'status': 'Shipped'})
+        response = authenticated_buyer_client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'] != etag
+
     def test_update_order_status(self, authenticated_seller_client):
         data = {'id': self.order_product.id, 'status': 'Shipped'}
         response = authenticated_seller_client.put(self.url, data)
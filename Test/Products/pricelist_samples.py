@@ -0,0 +1,36 @@
+"""
+Прайс-листы, общие для тестов импорта.
+"""
+
+PRICE_LIST = """
+shop: Связной
+categories:
+  - id: 224
+    name: Смартфоны
+  - id: 5
+    name: Телевизоры
+goods:
+  - id: 4216292
+    category: 224
+    model: apple/iphone/xs-max
+    name: Смартфон Apple iPhone XS Max 512GB (золотистый)
+    price: 110000
+    quantity: 14
+    parameters:
+      "Диагональ (дюйм)": 6.5
+      "Разрешение (пикс)": 2688x1242
+      "Цвет": золотистый
+  - id: 1234572
+    category: 5
+    name: Samsung QLED Q90R
+    price: 2500
+    quantity: 0
+    parameters:
+      "Smart TV": true
+"""
+
+CSV_PRICE_LIST = """id,name,price,quantity,categories,parameters,seller
+1,Смартфон,110000,14,Смартфоны; Новинки,"{""Цвет"": ""черный"", ""Память (Гб)"": 128}",seller_user
+2,"Телевизор
+65 дюймов",2500,4,,,
+"""
@@ -0,0 +1,71 @@
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+from Products import importer
+from Products.models import Product, ImportedItem
+from pricelist_samples import PRICE_LIST, CSV_PRICE_LIST
+
+
+# тестируем management-команду import_products
+@pytest.mark.django_db
+class TestImportProductsCommand:
+    @pytest.fixture(autouse=True)
+    def setup(self, seller_user, tmp_path):
+        self.seller = seller_user
+        self.directory = tmp_path / 'prices'
+        self.directory.mkdir()
+        (self.directory / 'a.yaml').write_text(PRICE_LIST, encoding='utf-8')
+        (self.directory / 'b.csv').write_text(CSV_PRICE_LIST, encoding='utf-8')
+        (self.directory / 'readme.txt').write_text('не прайс-лист', encoding='utf-8')
+        self.checkpoint = tmp_path / 'checkpoint.json'
+
+    def _call(self):
+        out = io.StringIO()
+        call_command('import_products', str(self.directory), '--seller', self.seller.username,
+                     '--checkpoint', str(self.checkpoint), stdout=out)
+        return out.getvalue()
+
+    def test_imports_directory(self):
+        output = self._call()
+        assert Product.objects.filter(seller=self.seller).count() == 4
+        # id категорий YAML-файла заменяются названиями из этого же файла
+        phone = Product.objects.get(name='Смартфон Apple iPhone XS Max 512GB (золотистый)')
+        assert [c.name for c in phone.categories.all()] == ['Смартфоны']
+        assert 'товаров/с' in output
+        assert 'readme.txt' not in output
+        assert not self.checkpoint.exists()
+
+    def test_resumes_from_checkpoint(self, monkeypatch):
+        monkeypatch.setattr(importer, 'BATCH_SIZE', 1)
+        original = importer.CatalogImporter._import_batch
+        calls = []
+
+        def interrupted(self, *args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return original(self, *args)
+
+        monkeypatch.setattr(importer.CatalogImporter, '_import_batch', interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            self._call()
+        assert json.loads(self.checkpoint.read_text(encoding='utf-8'))['processed'] == 1
+        assert Product.objects.filter(seller=self.seller).count() == 1
+
+        monkeypatch.setattr(importer.CatalogImporter, '_import_batch', original)
+        output = self._call()
+        assert 'Продолжаем после 1' in output
+        assert Product.objects.filter(seller=self.seller).count() == 4
+        # товар первой порции не считается отсутствующим в файле
+        assert ImportedItem.objects.filter(seller=self.seller).count() == 4
+
+    def test_dry_run(self):
+        out = io.StringIO()
+        call_command('import_products', str(self.directory), '--seller', self.seller.username,
+                     '--checkpoint', str(self.checkpoint), '--dry-run', stdout=out)
+        assert 'Пробный импорт завершен, изменения не сохранены: создано 4' in out.getvalue()
+        assert 'Время, с: чтение' in out.getvalue()
+        assert not Product.objects.filter(seller=self.seller).exists()
+        assert not self.checkpoint.exists()
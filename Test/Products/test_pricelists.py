@@ -0,0 +1,123 @@
+import io
+import json
+
+import pytest
+import yaml
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from rest_framework import status
+from Products import export
+from Products import pricelists
+from Products.models import Product, Parameters, ImportJob
+from Products.pricelists import YamlPriceList, CsvPriceList, PriceListError
+from Products.tasks import run_import_job
+from pricelist_samples import PRICE_LIST, CSV_PRICE_LIST
+
+
+# тестируем потоковое чтение YAML-файла прайс-листа
+class TestYamlPriceList:
+    def test_reads_goods_one_by_one(self):
+        price_list = YamlPriceList(io.BytesIO(PRICE_LIST.encode('utf-8')))
+        assert price_list.total == 2
+        assert price_list.categories == [{'id': 224, 'name': 'Смартфоны'}, {'id': 5, 'name': 'Телевизоры'}]
+        assert list(price_list.goods()) == yaml.safe_load(PRICE_LIST)['goods']
+
+    def test_categories_after_goods(self):
+        content = "goods:\n  - name: Товар\n    category: 1\ncategories:\n  - id: 1\n    name: Разное\n"
+        price_list = YamlPriceList(io.BytesIO(content.encode('utf-8')))
+        assert price_list.categories == [{'id': 1, 'name': 'Разное'}]
+        assert list(price_list.goods()) == [{'name': 'Товар', 'category': 1}]
+
+    def test_file_is_not_read_entirely(self):
+        content = ("goods:\n" + "".join(f"  - name: Продукт {index}\n    price: 10\n" for index in range(20000))).encode('utf-8')
+        stream = io.BytesIO(content)
+        goods = YamlPriceList(stream).goods()
+        assert next(goods) == {'name': 'Продукт 0', 'price': 10}
+        assert stream.tell() < len(content) // 2
+
+    @pytest.mark.parametrize('content, error', [
+        ('goods: [', 'Ошибка парсинга YAML-файла'),
+        ('- name: Товар', "Ожидаемый формат YAML-файла"),
+        ('shop: Магазин', "Ожидаемый формат YAML-файла"),
+        ('goods: 5', "Ключ 'goods' в YAML-файле должен содержать список продуктов."),
+    ])
+    def test_invalid_structure(self, content, error):
+        with pytest.raises(PriceListError, match=error):
+            YamlPriceList(io.BytesIO(content.encode('utf-8')))
+
+
+# тестируем импорт прайс-листов в форматах CSV, JSON Lines и XLSX
+@pytest.mark.django_db
+class TestPriceListFormats:
+    @pytest.fixture(autouse=True)
+    def setup(self, seller_user, settings, tmp_path, monkeypatch):
+        self.url = reverse('import_products')
+        self.seller = seller_user
+        settings.MEDIA_ROOT = str(tmp_path)
+        monkeypatch.setattr(run_import_job, 'delay', run_import_job)
+
+    def _upload(self, client, content, name):
+        response = client.post(self.url, {'file': SimpleUploadedFile(name, content)}, format='multipart')
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        return client.get(response.data['status_url'])
+
+    def test_csv_reader(self):
+        price_list = CsvPriceList(io.BytesIO(CSV_PRICE_LIST.encode('utf-8-sig')))
+        assert price_list.total == 2
+        goods = list(price_list.goods())
+        assert goods[0]['categories'] == ['Смартфоны', 'Новинки']
+        assert goods[0]['parameters'] == {'Цвет': 'черный', 'Память (Гб)': 128}
+        # пустые ячейки не передаются, перевод строки в кавычках сохраняется
+        assert goods[1] == {'id': '2', 'name': 'Телевизор\n65 дюймов', 'price': '2500', 'quantity': '4'}
+
+    def test_import_csv(self, authenticated_seller_client):
+        response = self._upload(authenticated_seller_client, CSV_PRICE_LIST.encode('utf-8'), 'price.csv')
+        assert (response.data['status'], response.data['imported_count']) == (ImportJob.DONE, 2)
+        phone = Product.objects.get(name='Смартфон', seller=self.seller)
+        assert phone.price == 110000
+        assert sorted(c.name for c in phone.categories.all()) == ['Новинки', 'Смартфоны']
+        assert phone.parameters.get(parameter_name__name='Память (Гб)').numeric_value == 128
+
+    def test_import_exported_ndjson(self, authenticated_seller_client, product, category):
+        product.categories.add(category)
+        Parameters.objects.create(product=product, name='Цвет', value='черный')
+        row = next(row for row in export.export_rows() if row['id'] == product.id)
+        row['price'] = '90.00'
+        response = self._upload(authenticated_seller_client, json.dumps(row, ensure_ascii=False).encode('utf-8'), 'catalog.jsonl')
+        assert (response.data['status'], response.data['updated_count'], response.data['errors']) == (ImportJob.DONE, 1, [])
+        product.refresh_from_db()
+        assert product.price == 90
+        assert [c.name for c in product.categories.all()] == [category.name]
+        assert {p.name: p.value for p in product.parameters.all()} == {'Цвет': 'черный'}
+
+    def test_invalid_json_line_fails_job(self, authenticated_seller_client):
+        response = self._upload(authenticated_seller_client, b'{"name": "A", "price": 1}\n{"name": \n', 'price.jsonl')
+        assert response.data['status'] == ImportJob.FAILED
+        assert response.data['message'].startswith('Ошибка парсинга JSON в строке 2')
+
+    def test_import_xlsx(self, authenticated_seller_client):
+        import openpyxl
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(['name', 'price', 'quantity', 'categories'])
+        sheet.append(['Ноутбук', 500, 3, 'Ноутбуки'])
+        stream = io.BytesIO()
+        workbook.save(stream)
+        response = self._upload(authenticated_seller_client, stream.getvalue(), 'price.xlsx')
+        assert (response.data['status'], response.data['imported_count']) == (ImportJob.DONE, 1)
+        assert Product.objects.get(name='Ноутбук').categories.get().name == 'Ноутбуки'
+
+    def test_xlsx_is_rejected_without_openpyxl(self, authenticated_seller_client, monkeypatch):
+        monkeypatch.delitem(pricelists.FORMATS, '.xlsx')
+        response = authenticated_seller_client.post(
+            self.url, {'file': SimpleUploadedFile('price.xlsx', b'PK')}, format='multipart')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert ImportJob.objects.count() == 0
+
+    def test_unsupported_extension(self, authenticated_seller_client):
+        response = authenticated_seller_client.post(
+            self.url, {'file': SimpleUploadedFile('price.txt', b'name')}, format='multipart')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+# тестируем кэш ответов каталога с версионированными ключами
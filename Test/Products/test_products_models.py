@@ -1,6 +1,10 @@
 
+from decimal import Decimal
+
 import pytest
-from django.db import IntegrityError
+from cachalot.api import cachalot_disabled
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 from Products.models import Product, Category, Cart, CartProduct
 
 @pytest.mark.django_db
@@ -46,7 +50,79 @@ class TestCartModel:
         CartProduct.objects.create(cart=cart, product=product, quantity=2)
         assert cart.TotalPrice() == product.price * 2
 
+    def test_cart_total_price_is_exact(self, cart, seller_user):
+        cheap = Product.objects.create(name="Cheap", price=Decimal('19.99'), quantity=10, seller=seller_user)
+        cent = Product.objects.create(name="Cent", price=Decimal('0.01'), quantity=10, seller=seller_user)
+        CartProduct.objects.create(cart=cart, product=cheap, quantity=3)
+        CartProduct.objects.create(cart=cart, product=cent, quantity=1)
+        assert cart.TotalPrice() == Decimal('59.98')
+        assert isinstance(cart.TotalPrice(), Decimal)
+
+    @pytest.mark.parametrize('lines', [1, 500])
+    def test_cart_total_price_is_one_query(self, cart, seller_user, lines):
+        products = Product.objects.bulk_create(
+            [Product(name=f"Product {i}", price=Decimal('10.50'), quantity=10, seller=seller_user) for i in range(lines)])
+        CartProduct.objects.bulk_create([CartProduct(cart=cart, product=product, quantity=2, price=product.price)
+                                         for product in products])
+        with cachalot_disabled(), CaptureQueriesContext(connection) as context:
+            total = cart.TotalPrice()
+        assert total == Decimal('21.00') * lines
+        assert len([query for query in context.captured_queries if query['sql'].startswith('SELECT')]) == 1
+
+    def test_cart_totals_follow_lines(self, cart, seller_user):
+        cheap = Product.objects.create(name="Cheap", price=Decimal('19.99'), quantity=10, seller=seller_user)
+        cent = Product.objects.create(name="Cent", price=Decimal('0.01'), quantity=10, seller=seller_user)
+        line = CartProduct.objects.create(cart=cart, product=cheap, quantity=3)
+        CartProduct.objects.create(cart=cart, product=cent, quantity=1)
+        line.quantity = 2
+        line.save()
+        CartProduct.objects.filter(cart=cart, product=cent).set_quantity(5)
+        cart.refresh_from_db()
+        assert (cart.items_count, cart.total_price) == (7, Decimal('40.03'))
+
+        CartProduct.objects.filter(product=cheap).delete()
+        cart.refresh_from_db()
+        assert (cart.items_count, cart.total_price) == (5, Decimal('0.05'))
+        cent.delete()
+        cart.refresh_from_db()
+        assert (cart.items_count, cart.total_price) == (0, Decimal('0.00'))
+
+    def test_reprice_moves_cart_total(self, cart, buyer_user, seller_user):
+        product = Product.objects.create(name="Phone", price=Decimal('10.00'), quantity=10, seller=seller_user)
+        other_cart = Cart.objects.create(user=seller_user)
+        CartProduct.objects.create(cart=cart, product=product, quantity=2)
+        CartProduct.objects.create(cart=other_cart, product=product, quantity=1)
+        Product.objects.filter(pk=product.pk).update(price=Decimal('12.50'))
+        with cachalot_disabled(), CaptureQueriesContext(connection) as context:
+            assert CartProduct.objects.filter(product=product).reprice() == 2
+        assert len([query for query in context.captured_queries if query['sql'].startswith('UPDATE')]) == 2
+        cart.refresh_from_db()
+        other_cart.refresh_from_db()
+        assert cart.total_price == Decimal('25.00') == cart.TotalPrice()
+        assert other_cart.total_price == Decimal('12.50')
+        assert CartProduct.objects.filter(product=product).reprice() == 0
+
+    def test_price_change_on_save_reprices_carts(self, cart, seller_user):
+        product = Product.objects.create(name="Phone", price=Decimal('10.00'), quantity=10, seller=seller_user)
+        CartProduct.objects.create(cart=cart, product=product, quantity=2)
+        product = Product.objects.get(pk=product.pk)
+        product.price = Decimal('12.50')
+        product.save()
+        cart.refresh_from_db()
+        assert cart.total_price == Decimal('25.00') == cart.TotalPrice()
+        assert CartProduct.objects.get(cart=cart).price == Decimal('12.50')
+        # сохранение без изменения цены корзины не пересчитывает
+        with cachalot_disabled(), CaptureQueriesContext(connection) as context:
+            product.quantity = 5
+            product.save()
+        assert not [query for query in context.captured_queries if 'Products_cartproduct' in query['sql']]
+
     def test_unique_cart_per_user(self, buyer_user):
         Cart.objects.create(user=buyer_user)
         with pytest.raises(IntegrityError):
-            Cart.objects.create(user=buyer_user)
\ No newline at end of file
+            Cart.objects.create(user=buyer_user)
+
+    def test_unique_product_per_cart(self, cart, product):
+        CartProduct.objects.create(cart=cart, product=product, quantity=1)
+        with pytest.raises(IntegrityError):
+            CartProduct.objects.create(cart=cart, product=product, quantity=2)
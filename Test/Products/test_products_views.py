@@ -2,8 +2,28 @@
 import pytest
 from django.urls import reverse
 from rest_framework import status
-from Products.models import Product, Category, CartProduct, Cart, Parameters
-from Users.models import MarketUser, Contact
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from Products.models import (Product, Category, CartProduct, Cart, Parameters, ParameterName, ImportJob, ImportedItem,
+                             CategoryMapping)
+from Users.models import MarketUser, UserGroup, Contact
+from Orders.models import Order
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from Products import cache as catalog_cache
+from Products import export
+from Products import importer
+from Products import views
+from Products import carts
+from Products.pagination import KeysetPaginator, encode_cursor
+from pricelist_samples import PRICE_LIST
+from Products.tasks import run_import_job, persist_cart
+from django.core.files.uploadedfile import SimpleUploadedFile
+from cachalot.api import cachalot_disabled
+import csv
+import io
+import json
+import threading
+from decimal import Decimal
 
 @pytest.mark.django_db
 class TestProductsView:
@@ -67,6 +87,12 @@ class TestProductsView:
         assert not Product.objects.filter(id=self.product.id).exists()
 
     # тестируем изменение продавцом доступности товаров
+    def test_delete_product_rejects_catalog_parameters(self, authenticated_seller_client):
+        for data in ({"cursor": "x"}, {"q": "test"}, {"page_size": 2}):
+            response = authenticated_seller_client.delete(self.url, data, format='json')
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert Product.objects.filter(id=self.product.id).exists()
+
     def test_update_product_availability(self, authenticated_seller_client):
         self.seller_product_2 = Product.objects.create(
             name="Product 2",
@@ -115,6 +141,888 @@ class TestProductsView:
         assert response.status_code == status.HTTP_403_FORBIDDEN
         assert response.data['message'] == 'Недостаточно прав'
 
+# тестируем курсорную пагинацию полного списка продуктов
+@pytest.mark.django_db
+class TestProductsPagination:
+    @pytest.fixture(autouse=True)
+    def setup(self, seller_user):
+        self.url = reverse('Products')
+        self.seller = seller_user
+        for name in ['Продукт A', 'Продукт B', 'Продукт C', 'Продукт D', 'Продукт E']:
+            Product.objects.create(name=name, price=10, quantity=1, seller=seller_user)
+
+    def _names(self, response):
+        return [item['name'] for item in response.data['products']]
+
+    def test_walk_pages_forward_and_back(self, api_client):
+        first = api_client.get(self.url, {'page_size': 2})
+        assert first.status_code == status.HTTP_200_OK
+        assert self._names(first) == ['Продукт A', 'Продукт B']
+        assert first.data['previous'] is None
+
+        second = api_client.get(self.url, {'page_size': 2, 'cursor': first.data['next']})
+        assert self._names(second) == ['Продукт C', 'Продукт D']
+
+        third = api_client.get(self.url, {'page_size': 2, 'cursor': second.data['next']})
+        assert self._names(third) == ['Продукт E']
+        assert third.data['next'] is None
+
+        back = api_client.get(self.url, {'page_size': 2, 'cursor': third.data['previous']})
+        assert self._names(back) == ['Продукт C', 'Продукт D']
+        back = api_client.get(self.url, {'page_size': 2, 'cursor': back.data['previous']})
+        assert self._names(back) == ['Продукт A', 'Продукт B']
+        assert back.data['previous'] is None
+
+    def test_same_name_products_ordered_by_id(self, api_client, another_seller_user):
+        twin = Product.objects.create(name='Продукт B', price=10, quantity=1, seller=another_seller_user)
+        first = api_client.get(self.url, {'page_size': 2})
+        second = api_client.get(self.url, {'page_size': 2, 'cursor': first.data['next']})
+        assert [item['id'] for item in second.data['products']][0] == twin.id
+
+    def test_insert_before_cursor_does_not_shift_pages(self, api_client):
+        first = api_client.get(self.url, {'page_size': 2})
+        Product.objects.create(name='Продукт 0', price=10, quantity=1, seller=self.seller)
+        second = api_client.get(self.url, {'page_size': 2, 'cursor': first.data['next']})
+        assert self._names(second) == ['Продукт C', 'Продукт D']
+
+    def test_invalid_cursor(self, api_client):
+        response = api_client.get(self.url, {'cursor': 'not-a-cursor'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    @pytest.mark.parametrize('position', [['x', 'abc'], ['x', None], [1, 2], ['x', True], ['x', 1.5]])
+    def test_forged_cursor(self, api_client, position):
+        response = api_client.get(self.url, {'cursor': encode_cursor(position)})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    @pytest.mark.parametrize('reverse', [False, True])
+    def test_page_is_index_search(self, reverse):
+        # глубина страницы не влияет на стоимость: SQLite ищет по индексу, а не сканирует таблицу
+        paginator = KeysetPaginator()
+        ordering = ['-name', '-id'] if reverse else ['name', 'id']
+        plan = Product.objects.order_by(*ordering).filter(paginator._after(['Продукт C', 3], reverse)).explain()
+        assert 'SEARCH' in plan and 'product_name_id_idx' in plan
+        assert 'SCAN' not in plan
+
+
+# тестируем полнотекстовый поиск по каталогу
+@pytest.mark.django_db
+class TestProductsSearch:
+    @pytest.fixture(autouse=True)
+    def setup(self, seller_user):
+        self.url = reverse('Products')
+        self.phone = Product.objects.create(
+            name='Смартфон Apple iPhone XS Max 512GB', price=110000, quantity=14,
+            description='Флагманский смартфон', seller=seller_user
+        )
+        Parameters.objects.create(product=self.phone, name='Цвет', value='золотистый')
+        self.tv = Product.objects.create(
+            name='Samsung QLED Q90R 65', price=2500, quantity=4,
+            description='Телевизор, совместимый со смартфоном', seller=seller_user
+        )
+
+    def _ids(self, response):
+        return [item['id'] for item in response.data['products']]
+
+    def test_search_by_partial_name(self, api_client):
+        response = api_client.get(self.url, {'q': 'iphon xs'})
+        assert response.status_code == status.HTTP_200_OK
+        assert self._ids(response) == [self.phone.id]
+
+    def test_search_by_parameter_value(self, api_client):
+        response = api_client.get(self.url, {'q': 'золотист'})
+        assert self._ids(response) == [self.phone.id]
+
+    def test_name_match_ranked_above_description_match(self, api_client):
+        response = api_client.get(self.url, {'q': 'смартфон'})
+        assert self._ids(response) == [self.phone.id, self.tv.id]
+
+    def test_search_is_paginated(self, api_client):
+        first = api_client.get(self.url, {'q': 'смартфон', 'page_size': 1})
+        assert self._ids(first) == [self.phone.id]
+        second = api_client.get(self.url, {'q': 'смартфон', 'page_size': 1, 'cursor': first.data['next']})
+        assert self._ids(second) == [self.tv.id]
+        assert second.data['next'] is None
+
+    def test_index_follows_updates_and_deletes(self, api_client):
+        self.tv.name = 'Samsung Neo QLED'
+        self.tv.save()
+        assert self._ids(api_client.get(self.url, {'q': 'neo'})) == [self.tv.id]
+        self.tv.delete()
+        assert self._ids(api_client.get(self.url, {'q': 'neo'})) == []
+
+    def test_syntax_characters_are_ignored(self, api_client):
+        response = api_client.get(self.url, {'q': '"iphone* (-'})
+        assert response.status_code == status.HTTP_200_OK
+        assert self._ids(response) == [self.phone.id]
+
+
+# тестируем фильтрацию по параметрам и фасеты категории
+@pytest.mark.django_db
+class TestProductsFacets:
+    @pytest.fixture(autouse=True)
+    def setup(self, product, category, seller_user):
+        self.url = reverse('Products')
+        self.facets_url = reverse('ProductFacets')
+        self.change_url = reverse('ChangeProducts')
+        self.category = category
+        self.product = product
+        self.product.categories.add(category)
+        self.other = Product.objects.create(name='Other Product', price=10, quantity=1, seller=seller_user)
+        self.other.categories.add(category)
+
+    def _add_parameter(self, client, product, name, value):
+        response = client.post(self.change_url, {'product_id': product.id, 'name': name, 'value': value})
+        assert response.status_code == status.HTTP_200_OK
+
+    def _facets(self, client):
+        response = client.get(self.facets_url, {'categories': str(self.category.id)})
+        assert response.status_code == status.HTTP_200_OK
+        return {facet['name']: {item['value']: item['count'] for item in facet['values']}
+                for facet in response.data['facets']}
+
+    def test_filter_by_several_parameters(self, authenticated_seller_client):
+        self._add_parameter(authenticated_seller_client, self.product, 'Цвет', 'золотистый')
+        self._add_parameter(authenticated_seller_client, self.product, 'Встроенная память', '512')
+        self._add_parameter(authenticated_seller_client, self.other, 'Цвет', 'золотистый')
+        self._add_parameter(authenticated_seller_client, self.other, 'Встроенная память', '256')
+
+        response = authenticated_seller_client.get(self.url, {'param': ['Цвет=золотистый', 'Встроенная память=512']})
+        assert [item['id'] for item in response.data['products']] == [self.product.id]
+
+        response = authenticated_seller_client.get(self.url, {'categories': str(self.category.id), 'param': 'Цвет=золотистый'})
+        assert {item['name'] for item in response.data} == {'Test Product', 'Other Product'}
+
+    def test_invalid_parameter_filter(self, api_client):
+        response = api_client.get(self.url, {'param': 'Цвет'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_filter_by_numeric_range(self, authenticated_seller_client):
+        self._add_parameter(authenticated_seller_client, self.product, 'Диагональ (дюйм)', '6.5')
+        self._add_parameter(authenticated_seller_client, self.other, 'Диагональ (дюйм)', '5.8')
+        assert self.product.parameters.get().numeric_value == 6.5
+        assert self.product.parameters.get().unit == 'дюйм'
+
+        response = authenticated_seller_client.get(self.url, {'param_min': 'Диагональ (дюйм)=6.1',
+                                                             'param_max': 'Диагональ (дюйм)=6.7'})
+        assert [item['id'] for item in response.data['products']] == [self.product.id]
+
+        # изменение значения через patch пересчитывает числовое значение
+        param = self.other.parameters.get()
+        authenticated_seller_client.patch(self.change_url, {
+            'product_id': self.other.id, 'parameters_id': param.id, 'name': 'Диагональ (дюйм)', 'value': '6,7'
+        })
+        response = authenticated_seller_client.get(self.url, {'categories': str(self.category.id),
+                                                             'param_min': 'Диагональ (дюйм)=6.6'})
+        assert [item['name'] for item in response.data] == ['Other Product']
+
+    def test_invalid_range_filter(self, api_client):
+        response = api_client.get(self.url, {'param_min': 'Диагональ=много'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_facets_follow_parameter_crud(self, authenticated_seller_client):
+        self._add_parameter(authenticated_seller_client, self.product, 'Цвет', 'золотистый')
+        self._add_parameter(authenticated_seller_client, self.other, 'Цвет', 'золотистый')
+        assert self._facets(authenticated_seller_client) == {'Цвет': {'золотистый': 2}}
+
+        param = self.other.parameters.get(parameter_name__name='Цвет')
+        authenticated_seller_client.patch(self.change_url, {
+            'product_id': self.other.id, 'parameters_id': param.id, 'name': 'Цвет', 'value': 'черный'
+        })
+        assert self._facets(authenticated_seller_client) == {'Цвет': {'золотистый': 1, 'черный': 1}}
+
+        authenticated_seller_client.delete(self.change_url, {'product_id': self.other.id, 'parameters_id': param.id})
+        assert self._facets(authenticated_seller_client) == {'Цвет': {'золотистый': 1}}
+
+    def test_facets_require_categories(self, api_client):
+        response = api_client.get(self.facets_url)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+# тестируем потоковую выгрузку каталога
+@pytest.mark.django_db
+class TestProductsExport:
+    @pytest.fixture(autouse=True)
+    def setup(self, product, category, seller_user):
+        self.url = reverse('ProductExport')
+        product.categories.add(category)
+        Parameters.objects.create(product=product, name='Цвет', value='черный')
+        self.seller = seller_user
+
+    def _content(self, response):
+        assert response.status_code == status.HTTP_200_OK
+        assert response.streaming
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_export_ndjson(self, api_client):
+        response = api_client.get(self.url)
+        assert response['Content-Type'].startswith('application/x-ndjson')
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        assert rows == [{
+            'id': rows[0]['id'], 'name': 'Test Product', 'price': '100.00', 'description': 'Test Description',
+            'quantity': 10, 'is_available': True, 'seller': self.seller.username,
+            'categories': ['Test Category'], 'parameters': {'Цвет': 'черный'},
+        }]
+
+    def test_export_csv(self, api_client):
+        response = api_client.get(self.url, {'output': 'csv'})
+        assert response['Content-Type'].startswith('text/csv')
+        rows = list(csv.DictReader(io.StringIO(self._content(response))))
+        assert len(rows) == 1
+        assert rows[0]['categories'] == 'Test Category'
+        assert json.loads(rows[0]['parameters']) == {'Цвет': 'черный'}
+
+    def test_unknown_format(self, api_client):
+        assert api_client.get(self.url, {'output': 'xml'}).status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_catalog_is_read_in_chunks(self, api_client, monkeypatch):
+        monkeypatch.setattr(export, 'CHUNK_SIZE', 2)
+        for index in range(4):
+            Product.objects.create(name=f'Продукт {index}', price=1, quantity=1, seller=self.seller)
+        response = api_client.get(self.url)
+        with CaptureQueriesContext(connection) as context:
+            lines = self._content(response).splitlines()
+        assert len(lines) == 5
+        # продукты читаются курсором, а продавец, параметры и категории - на каждую порцию из двух продуктов
+        prefetches = [query for query in context.captured_queries
+                      if query['sql'].startswith('SELECT') and 'FROM "Products_parameters"' in query['sql']]
+        assert len(prefetches) == 3
+
+
+# тестируем пакетный импорт прайс-листа
+@pytest.mark.django_db
+class TestProductImport:
+    @pytest.fixture(autouse=True)
+    def setup(self, seller_user, settings, tmp_path, monkeypatch):
+        self.url = reverse('import_products')
+        self.seller = seller_user
+        settings.MEDIA_ROOT = str(tmp_path)
+        # задача выполняется синхронно вместо отправки в очередь Celery
+        self.queued = []
+        monkeypatch.setattr(run_import_job, 'delay', lambda job_id: self.queued.append(job_id) or run_import_job(job_id))
+
+    def _upload(self, client, content, name='price.yaml', **data):
+        """
+        Загружает файл и возвращает ответ эндпоинта состояния задания.
+        """
+        response = client.post(self.url, {'file': SimpleUploadedFile(name, content.encode('utf-8')), **data},
+                               format='multipart')
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        return client.get(response.data['status_url'])
+
+    def test_import_creates_products(self, authenticated_seller_client):
+        response = self._upload(authenticated_seller_client, PRICE_LIST)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['status'] == ImportJob.DONE
+        assert (response.data['processed'], response.data['total']) == (2, 2)
+        assert (response.data['imported_count'], response.data['updated_count']) == (2, 0)
+
+        phone = Product.objects.get(name='Смартфон Apple iPhone XS Max 512GB (золотистый)')
+        assert phone.seller == self.seller
+        assert phone.price == 110000
+        assert {p.name: p.value for p in phone.parameters.all()}['Диагональ (дюйм)'] == '6.5'
+        assert phone.parameters.get(parameter_name__name='Диагональ (дюйм)').numeric_value == 6.5
+        assert [c.name for c in phone.categories.all()] == ['Смартфоны']
+        assert Product.objects.get(name='Samsung QLED Q90R').is_available is False
+
+        # новые продукты попадают в поисковый индекс и фасеты
+        response = authenticated_seller_client.get(reverse('Products'), {'q': 'iphone'})
+        assert [item['id'] for item in response.data['products']] == [phone.id]
+        category = Category.objects.get(name='Смартфоны')
+        response = authenticated_seller_client.get(reverse('ProductFacets'), {'categories': str(category.id)})
+        assert {facet['name'] for facet in response.data['facets']} == {'Диагональ (дюйм)', 'Разрешение (пикс)', 'Цвет'}
+
+    def test_reimport_updates_in_place(self, authenticated_seller_client):
+        self._upload(authenticated_seller_client, PRICE_LIST)
+        phone = Product.objects.get(name='Смартфон Apple iPhone XS Max 512GB (золотистый)')
+        kept = phone.parameters.get(parameter_name__name='Разрешение (пикс)')
+
+        changed = (PRICE_LIST.replace('price: 110000', 'price: 99000')
+                   .replace('"Цвет": золотистый', '"Память (Гб)": 512')
+                   .replace('category: 224', 'category: 5'))
+        response = self._upload(authenticated_seller_client, changed)
+        # телевизор в прайс-листе не изменился и пропускается
+        assert (response.data['imported_count'], response.data['updated_count'], response.data['unchanged_count']) == (0, 1, 1)
+        assert Product.objects.filter(seller=self.seller).count() == 2
+
+        phone.refresh_from_db()
+        assert phone.price == 99000
+        assert set(phone.parameters.values_list('parameter_name__name', flat=True)) == {'Диагональ (дюйм)', 'Разрешение (пикс)', 'Память (Гб)'}
+        # неизмененный параметр не пересоздается
+        assert phone.parameters.get(parameter_name__name='Разрешение (пикс)').id == kept.id
+        assert [c.name for c in phone.categories.all()] == ['Телевизоры']
+
+    def test_item_errors_do_not_stop_import(self, authenticated_seller_client):
+        content = PRICE_LIST + """
+  - id: 1
+    price: 10
+  - id: 2
+    name: Без цены
+  - id: 3
+    name: Чужая категория
+    category: 999
+    price: 5
+    quantity: 1
+"""
+        response = self._upload(authenticated_seller_client, content)
+        assert response.data['status'] == ImportJob.DONE
+        assert response.data['imported_count'] == 3
+        assert len(response.data['errors']) == 3
+        assert Product.objects.get(name='Чужая категория').categories.count() == 0
+
+    def test_import_query_count_does_not_depend_on_size(self, authenticated_seller_client):
+        def count_queries(size):
+            goods = ''.join(f"""
+  - name: Продукт {size}-{index}
+    category: 224
+    price: 10
+    quantity: 1
+    parameters:
+      Цвет: черный
+      Вес: {index} кг
+""" for index in range(size))
+            content = "categories:\n  - id: 224\n    name: Смартфоны\ngoods:" + goods
+            # cachalot отдает повторные запросы из кэша и искажает подсчет
+            with cachalot_disabled(), CaptureQueriesContext(connection) as context:
+                response = self._upload(authenticated_seller_client, content)
+            assert response.data['imported_count'] == size
+            # запросы профилировщика silk (в том числе EXPLAIN) и точки сохранения к подсчету не относятся
+            return len([query for query in context.captured_queries
+                        if 'silk_' not in query['sql'] and not query['sql'].startswith(('EXPLAIN', 'SAVEPOINT', 'RELEASE'))])
+
+        # первый импорт создает категорию, сравниваем последующие
+        count_queries(1)
+        assert count_queries(3) == count_queries(30)
+
+    def test_upload_is_queued(self, authenticated_seller_client, monkeypatch):
+        monkeypatch.setattr(run_import_job, 'delay', self.queued.append)
+        response = authenticated_seller_client.post(
+            self.url, {'file': SimpleUploadedFile('price.yaml', PRICE_LIST.encode('utf-8'))}, format='multipart')
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert self.queued == [response.data['job_id']]
+        # до выполнения задачи продукты не создаются
+        assert not Product.objects.filter(seller=self.seller).exists()
+        job = authenticated_seller_client.get(response.data['status_url']).data
+        assert (job['status'], job['processed']) == (ImportJob.PENDING, 0)
+
+    def test_progress_is_saved_during_import(self, authenticated_seller_client, monkeypatch):
+        monkeypatch.setattr(importer, 'BATCH_SIZE', 1)
+        snapshots = []
+        original_init = importer.CatalogImporter.__init__
+
+        def init(self, user=None, progress=None, **kwargs):
+            def track(instance):
+                progress(instance)
+                snapshots.append(ImportJob.objects.values_list('status', 'processed', 'total').get())
+            original_init(self, user=user, progress=track, **kwargs)
+
+        monkeypatch.setattr(importer.CatalogImporter, '__init__', init)
+        response = self._upload(authenticated_seller_client, PRICE_LIST)
+        assert response.data['status'] == ImportJob.DONE
+        assert snapshots[0] == (ImportJob.RUNNING, 1, 2)
+        assert snapshots[-1] == (ImportJob.RUNNING, 2, 2)
+
+    def test_invalid_file_fails_job(self, authenticated_seller_client):
+        response = self._upload(authenticated_seller_client, 'goods: not a list')
+        assert response.data['status'] == ImportJob.FAILED
+        assert response.data['message'] == "Ключ 'goods' в YAML-файле должен содержать список продуктов."
+
+    def test_job_is_visible_only_to_owner(self, authenticated_seller_client, another_seller_user):
+        job = ImportJob.objects.create(user=another_seller_user, file='imports/price.yaml')
+        response = authenticated_seller_client.get(reverse('import_job', args=[job.id]))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_import_in_batches(self, authenticated_seller_client, monkeypatch):
+        monkeypatch.setattr(importer, 'BATCH_SIZE', 1)
+        # товар повторяется в следующей порции и обновляет созданный продукт
+        content = PRICE_LIST + """
+  - category: 5
+    name: Samsung QLED Q90R
+    price: 2400
+"""
+        response = self._upload(authenticated_seller_client, content)
+        assert (response.data['processed'], response.data['total']) == (3, 3)
+        assert (response.data['imported_count'], response.data['updated_count']) == (2, 1)
+        tv = Product.objects.get(name='Samsung QLED Q90R')
+        assert tv.price == 2400
+        assert [c.name for c in tv.categories.all()] == ['Телевизоры']
+
+    def test_unchanged_items_are_skipped(self, authenticated_seller_client):
+        self._upload(authenticated_seller_client, PRICE_LIST)
+        before = dict(Product.objects.filter(seller=self.seller).values_list('name', 'updated_at'))
+        response = self._upload(authenticated_seller_client, PRICE_LIST)
+        assert (response.data['imported_count'], response.data['updated_count'],
+                response.data['unchanged_count'], response.data['removed_count']) == (0, 0, 2, 0)
+        assert dict(Product.objects.filter(seller=self.seller).values_list('name', 'updated_at')) == before
+
+    def test_removed_items_are_reported_once(self, authenticated_seller_client):
+        self._upload(authenticated_seller_client, PRICE_LIST)
+        without_tv = PRICE_LIST[:PRICE_LIST.index('  - id: 1234572')]
+        response = self._upload(authenticated_seller_client, without_tv, mode='replace')
+        assert (response.data['unchanged_count'], response.data['removed_count']) == (1, 1)
+        # продукт не удаляется, а повторно отсутствующий товар не считается снова
+        assert Product.objects.filter(name='Samsung QLED Q90R').exists()
+        response = self._upload(authenticated_seller_client, without_tv, mode='replace')
+        assert (response.data['unchanged_count'], response.data['removed_count']) == (1, 0)
+
+    def test_partial_update_keeps_missing_items(self, authenticated_seller_client):
+        self._upload(authenticated_seller_client, PRICE_LIST)
+        without_tv = PRICE_LIST[:PRICE_LIST.index('  - id: 1234572')]
+        # файл режима обновления может содержать часть каталога: остальные товары не отсутствуют
+        response = self._upload(authenticated_seller_client, without_tv)
+        assert (response.data['unchanged_count'], response.data['removed_count']) == (1, 0)
+        assert ImportedItem.objects.filter(seller=self.seller).count() == 2
+        response = self._upload(authenticated_seller_client, PRICE_LIST)
+        assert response.data['unchanged_count'] == 2
+
+    def test_validation_in_process_pool(self, authenticated_seller_client, monkeypatch):
+        monkeypatch.setattr(importer, 'WORKERS', 2)
+        content = PRICE_LIST + """
+  - name: Без цены
+  - category: 5
+    name: Samsung QLED Q90R
+    price: 2400
+"""
+        response = self._upload(authenticated_seller_client, content)
+        assert (response.data['imported_count'], response.data['updated_count']) == (2, 1)
+        assert [list(error['error']) for error in response.data['errors']] == [['price']]
+        assert Product.objects.get(name='Samsung QLED Q90R').price == 2400
+        assert Parameters.objects.get(parameter_name__name='Диагональ (дюйм)', product__seller=self.seller).numeric_value == 6.5
+
+    def test_validation_falls_back_without_process_pool(self, authenticated_seller_client, monkeypatch):
+        from concurrent.futures.process import BrokenProcessPool
+
+        class BrokenPool:
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def map(self, *args):
+                raise BrokenProcessPool('fork недоступен')
+
+            def shutdown(self, **kwargs):
+                pass
+
+        monkeypatch.setattr(importer, 'WORKERS', 2)
+        monkeypatch.setattr(importer, 'ProcessPoolExecutor', BrokenPool)
+        response = self._upload(authenticated_seller_client, PRICE_LIST)
+        assert (response.data['status'], response.data['imported_count']) == (ImportJob.DONE, 2)
+
+    def test_validation_in_daemonic_process(self, monkeypatch):
+        import multiprocessing
+        monkeypatch.setattr(importer, 'WORKERS', 2)
+        context = multiprocessing.get_context('fork')
+        receiver, sender = context.Pipe(duplex=False)
+
+        # рабочий процесс Celery с пулом prefork - демонический и не может запускать дочерние процессы
+        def validate():
+            try:
+                catalog_importer = importer.CatalogImporter()
+                catalog_importer._start_pool()
+                results = catalog_importer._validate_all([({'name': 'Товар', 'price': 10}, False),
+                                                          ({'name': 'Без цены'}, False)])
+                sender.send((catalog_importer._pool is None, [valid for valid, _ in results]))
+            except Exception as e:
+                sender.send(repr(e))
+
+        process = context.Process(target=validate, daemon=True)
+        process.start()
+        process.join(30)
+        assert receiver.recv() == (True, [True, False])
+
+    def test_replace_mode_deactivates_missing_products(self, authenticated_seller_client, another_seller_user):
+        self._upload(authenticated_seller_client, PRICE_LIST)
+        manual = Product.objects.create(name='Добавлен вручную', price=1, quantity=5, seller=self.seller)
+        foreign = Product.objects.create(name='Чужой', price=1, quantity=5, seller=another_seller_user)
+        without_tv = PRICE_LIST[:PRICE_LIST.index('  - id: 1234572')]
+
+        response = authenticated_seller_client.post(
+            self.url, {'file': SimpleUploadedFile('price.yaml', without_tv.encode('utf-8')), 'mode': 'replace'},
+            format='multipart')
+        job = authenticated_seller_client.get(response.data['status_url']).data
+        assert (job['status'], job['mode'], job['unchanged_count'], job['deactivated_count']) == (
+            ImportJob.DONE, 'replace', 1, 1)
+        available = dict(Product.objects.filter(id__in=[manual.id, foreign.id]).values_list('name', 'is_available'))
+        assert available == {'Добавлен вручную': False, 'Чужой': True}
+        assert Product.objects.get(name='Смартфон Apple iPhone XS Max 512GB (золотистый)').is_available is True
+
+        # товар снова появился в прайс-листе - продукт возвращается в продажу
+        manual_line = "\n  - name: Добавлен вручную\n    price: 1\n    quantity: 5\n"
+        authenticated_seller_client.post(
+            self.url, {'file': SimpleUploadedFile('price.yaml', (without_tv + manual_line).encode('utf-8')), 'mode': 'replace'},
+            format='multipart')
+        manual.refresh_from_db()
+        assert (manual.is_available, manual.delisted_by_import) == (True, False)
+
+    def test_replace_mode_keeps_products_delisted_by_seller(self, authenticated_seller_client):
+        self._upload(authenticated_seller_client, PRICE_LIST)
+        phone = Product.objects.get(name='Смартфон Apple iPhone XS Max 512GB (золотистый)')
+        # продавец снял товар с продажи - импорт не должен возвращать его обратно
+        authenticated_seller_client.put(reverse('ChangeProducts'), {'id': phone.id, 'is_available': False})
+        self._upload(authenticated_seller_client, PRICE_LIST, mode='replace')
+        phone.refresh_from_db()
+        assert phone.is_available is False
+
+    def test_failed_replace_import_is_retried(self, authenticated_seller_client, monkeypatch):
+        self._upload(authenticated_seller_client, PRICE_LIST)
+        manual = Product.objects.create(name='Добавлен вручную', price=1, quantity=5, seller=self.seller)
+        monkeypatch.setattr(importer, 'BATCH_SIZE', 1)
+        forget_removed = importer.CatalogImporter._forget_removed
+        monkeypatch.setattr(importer.CatalogImporter, '_forget_removed', lambda self: 1 / 0)
+        changed = PRICE_LIST.replace('price: 110000', 'price: 99000')
+        response = self._upload(authenticated_seller_client, changed, mode='replace')
+        assert response.data['status'] == ImportJob.FAILED
+        # записанные порции сохраняются, а снятие с продажи откатывается
+        assert Product.objects.get(name='Смартфон Apple iPhone XS Max 512GB (золотистый)').price == 99000
+        manual.refresh_from_db()
+        assert manual.is_available is True
+
+        # повторный запуск с той же меткой пропускает записанные товары и снимает отсутствующие с продажи
+        job = ImportJob.objects.get(id=response.data['id'])
+        monkeypatch.setattr(importer.CatalogImporter, '_forget_removed', forget_removed)
+        retry = authenticated_seller_client.post(reverse('import_job', args=[job.id]))
+        assert retry.status_code == status.HTTP_202_ACCEPTED
+        response = authenticated_seller_client.get(retry.data['status_url'])
+        assert (response.data['status'], response.data['unchanged_count'], response.data['deactivated_count']) == (
+            ImportJob.DONE, 2, 1)
+        assert ImportJob.objects.get(id=job.id).import_token == job.import_token
+        manual.refresh_from_db()
+        assert manual.is_available is False
+        # завершенное задание повторно не запускается
+        assert authenticated_seller_client.post(retry.data['status_url']).status_code == status.HTTP_409_CONFLICT
+
+    def test_unknown_mode_is_rejected(self, authenticated_seller_client):
+        response = authenticated_seller_client.post(
+            self.url, {'file': SimpleUploadedFile('price.yaml', PRICE_LIST.encode('utf-8')), 'mode': 'merge'},
+            format='multipart')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'mode' in response.data
+
+    def test_renamed_category_keeps_mapping(self, authenticated_seller_client, another_seller_user):
+        self._upload(authenticated_seller_client, PRICE_LIST)
+        smartphones = Category.objects.get(name='Смартфоны')
+        assert CategoryMapping.objects.get(seller=self.seller, external_id='224').category == smartphones
+
+        # продавец переименовал категорию и изменил товар - продукт остается в той же категории
+        renamed = PRICE_LIST.replace('name: Смартфоны', 'name: Телефоны').replace('price: 110000', 'price: 99000')
+        job = self._upload(authenticated_seller_client, renamed).data
+        assert (job['updated_count'], job['errors']) == (1, [])
+        phone = Product.objects.get(name='Смартфон Apple iPhone XS Max 512GB (золотистый)')
+        assert [c.name for c in phone.categories.all()] == ['Смартфоны']
+        assert not Category.objects.filter(name='Телефоны').exists()
+        assert CategoryMapping.objects.filter(seller=self.seller).count() == 2
+
+    def test_parameter_names_are_shared(self, authenticated_seller_client):
+        self._upload(authenticated_seller_client, PRICE_LIST)
+        tv = Product.objects.get(name='Samsung QLED Q90R')
+        Parameters.objects.create(product=tv, name='Цвет', value='черный')
+        assert ParameterName.objects.filter(name='Цвет').count() == 1
+        assert Parameters.objects.filter(parameter_name__name='Цвет').count() == 2
+        # в API название по-прежнему передается строкой
+        response = authenticated_seller_client.get(reverse('Products'), {'id': tv.id})
+        assert response.data['product']['parameters'] == [{'name': 'Smart TV', 'value': 'True'},
+                                                              {'name': 'Цвет', 'value': 'черный'}]
+
+    def test_dry_run_reports_changes_without_saving(self, authenticated_seller_client):
+        self._upload(authenticated_seller_client, PRICE_LIST)
+        manual = Product.objects.create(name='Добавлен вручную', price=1, quantity=5, seller=self.seller)
+        changed = PRICE_LIST.replace('price: 110000', 'price: 99000').replace('name: Телевизоры', 'name: ТВ')
+        changed += "\n  - name: Новый продукт\n    price: 5\n    quantity: 1\n"
+        response = authenticated_seller_client.post(
+            self.url, {'file': SimpleUploadedFile('price.yaml', changed.encode('utf-8')), 'mode': 'replace',
+                       'dry_run': 'true'},
+            format='multipart')
+        job = authenticated_seller_client.get(response.data['status_url']).data
+        assert (job['status'], job['dry_run']) == (ImportJob.DONE, True)
+        assert (job['imported_count'], job['updated_count'], job['unchanged_count'], job['deactivated_count']) == (1, 2, 0, 1)
+        assert set(job['timings']) == {'parse', 'validate', 'diff', 'write', 'total', 'items_per_second'}
+
+        # ни одно изменение не сохранено
+        assert Product.objects.get(name='Смартфон Apple iPhone XS Max 512GB (золотистый)').price == 110000
+        assert not Product.objects.filter(name='Новый продукт').exists()
+        assert not Category.objects.filter(name='ТВ').exists()
+        manual.refresh_from_db()
+        assert manual.is_available is True
+        # хэши прошлого импорта не изменились: повторный импорт того же файла их использует
+        job = self._upload(authenticated_seller_client, PRICE_LIST).data
+        assert (job['unchanged_count'], job['timings']['items_per_second'] > 0) == (2, True)
+
+    def test_dry_run_batches_are_rolled_back_separately(self, authenticated_seller_client, monkeypatch):
+        self._upload(authenticated_seller_client, PRICE_LIST)
+        Product.objects.create(name='Добавлен вручную', price=1, quantity=5, seller=self.seller)
+        without_tv = PRICE_LIST[:PRICE_LIST.index('  - id: 1234572')]
+        # продукт, созданный в откатанной порции, в следующей порции обновляется
+        content = without_tv + "\n  - name: Новый продукт\n    price: 5\n    quantity: 1\n  - name: Новый продукт\n    quantity: 2\n"
+        monkeypatch.setattr(importer, 'BATCH_SIZE', 1)
+        fields = ('imported_count', 'updated_count', 'unchanged_count', 'removed_count', 'deactivated_count', 'errors')
+
+        def upload(**data):
+            response = authenticated_seller_client.post(
+                self.url, {'file': SimpleUploadedFile('price.yaml', content.encode('utf-8')), 'mode': 'replace', **data},
+                format='multipart')
+            job = authenticated_seller_client.get(response.data['status_url']).data
+            return tuple(job[field] for field in fields)
+
+        dry_run = upload(dry_run='true')
+        assert dry_run == (1, 1, 1, 1, 1, [])
+        assert not Product.objects.filter(name='Новый продукт').exists()
+        assert Product.objects.get(name='Добавлен вручную').is_available is True
+        assert ImportedItem.objects.filter(seller=self.seller).count() == 2
+        # отчет пробного импорта совпадает с отчетом импорта
+        assert upload() == dry_run
+        assert Product.objects.get(name='Новый продукт').quantity == 2
+
+
+class TestImportProgressFromAnotherConnection:
+    """
+    Прогресс пробного импорта проверяется запросом из другого потока
+    (и другого соединения с БД) на уже зафиксированных данных, без транзакции теста.
+    """
+    def _job_state(self, seller, job, states):
+        try:
+            request = APIRequestFactory().get(reverse('import_job', args=[job.id]))
+            force_authenticate(request, user=seller)
+            request.session = {'user_id': seller.id}
+            response = views.ImportJobView.as_view()(request, job_id=job.id)
+            states.append((response.data['status'], response.data['processed'], response.data['imported_count']))
+            # между порциями пробный импорт не держит блокировку SQLite на запись
+            connections['default'].cursor().execute('PRAGMA busy_timeout = 100')
+            MarketUser.objects.filter(pk=seller.pk).update(first_name='Продавец')
+        finally:
+            connections.close_all()
+
+    def test_dry_run_progress_is_visible(self, django_db_setup, django_db_blocker, monkeypatch):
+        monkeypatch.setattr(importer, 'BATCH_SIZE', 1)
+        states = []
+        original_init = importer.CatalogImporter.__init__
+
+        with django_db_blocker.unblock():
+            seller = MarketUser.objects.create_user(username='progress_seller', password='testpass123',
+                                                    email='progress_seller@example.com', user_type='Seller')
+            job = None
+            try:
+                UserGroup.objects.get(name='Seller').user_set.add(seller)
+                job = ImportJob.objects.create(user=seller, dry_run=True,
+                                               file=SimpleUploadedFile('price.yaml', PRICE_LIST.encode('utf-8')))
+
+                def init(self, user=None, progress=None, **kwargs):
+                    def track(instance):
+                        progress(instance)
+                        # импорт еще выполняется
+                        thread = threading.Thread(target=TestImportProgressFromAnotherConnection._job_state,
+                                                  args=(None, seller, job, states))
+                        thread.start()
+                        thread.join()
+                    original_init(self, user=user, progress=track, **kwargs)
+
+                monkeypatch.setattr(importer.CatalogImporter, '__init__', init)
+                run_import_job(job.id)
+                assert states == [(ImportJob.RUNNING, 1, 1), (ImportJob.RUNNING, 2, 2)]
+                assert MarketUser.objects.get(pk=seller.pk).first_name == 'Продавец'
+                job.refresh_from_db()
+                assert (job.status, job.processed, job.imported_count) == (ImportJob.DONE, 2, 2)
+                assert not Product.objects.filter(seller=seller).exists()
+            finally:
+                if job is not None:
+                    job.file.delete(save=False)
+                    job.delete()
+                seller.delete()
+
+@pytest.mark.django_db
+class TestCatalogCache:
+    @pytest.fixture(autouse=True)
+    def setup(self, product, seller_user, another_seller_user):
+        self.url = reverse('Products')
+        self.categories_url = reverse('Categories')
+        self.phones = Category.objects.create(name='Телефоны')
+        self.laptops = Category.objects.create(name='Ноутбуки')
+        self.product = product
+        self.product.categories.add(self.phones)
+        self.laptop = Product.objects.create(name='Laptop', price=500, quantity=3, seller=another_seller_user)
+        self.laptop.categories.add(self.laptops)
+
+    def test_repeated_request_is_served_from_cache(self, api_client):
+        first = api_client.get(self.url)
+        second = api_client.get(self.url)
+        assert first['X-Cache'] == 'MISS'
+        assert second['X-Cache'] == 'HIT'
+        assert second.data == first.data
+
+    def test_change_during_fetch_is_not_cached(self, api_client, monkeypatch):
+        fetch = KeysetPaginator.fetch
+
+        # изменение продукта фиксируется между выборкой страницы и сохранением ответа
+        def fetch_then_change(paginator, *args):
+            rows = fetch(paginator, *args)
+            Product.objects.filter(pk=self.product.pk).update(quantity=5)
+            catalog_cache.touch_products([self.product.pk])
+            return rows
+
+        monkeypatch.setattr(KeysetPaginator, 'fetch', fetch_then_change)
+        api_client.get(self.url)
+        monkeypatch.setattr(KeysetPaginator, 'fetch', fetch)
+        response = api_client.get(self.url)
+        assert response['X-Cache'] == 'MISS'
+        assert next(item for item in response.data['products'] if item['id'] == self.product.id)['quantity'] == 5
+
+    def test_scope_change_during_fetch_invalidates_response(self, api_client, monkeypatch):
+        fetch = KeysetPaginator.fetch
+
+        def fetch_then_touch(paginator, *args):
+            rows = fetch(paginator, *args)
+            catalog_cache.touch(catalog_cache.LISTING)
+            return rows
+
+        monkeypatch.setattr(KeysetPaginator, 'fetch', fetch_then_touch)
+        api_client.get(self.url)
+        monkeypatch.setattr(KeysetPaginator, 'fetch', fetch)
+        # ответ сохранен с версией списка, прочитанной до выборки, и уже устарел
+        assert api_client.get(self.url)['X-Cache'] == 'MISS'
+        assert api_client.get(self.url)['X-Cache'] == 'HIT'
+
+    def test_product_save_invalidates_only_dependent_pages(self, api_client):
+        api_client.get(self.url, {'categories': str(self.phones.id)})
+        api_client.get(self.url, {'categories': str(self.laptops.id)})
+
+        self.product.quantity = 5
+        self.product.save()
+
+        response = api_client.get(self.url, {'categories': str(self.phones.id)})
+        assert response['X-Cache'] == 'MISS'
+        assert response.data[0]['quantity'] == 5
+        assert api_client.get(self.url, {'categories': str(self.laptops.id)})['X-Cache'] == 'HIT'
+
+    def test_category_membership_change_invalidates_category_page(self, api_client):
+        api_client.get(self.url, {'categories': str(self.laptops.id)})
+        self.product.categories.add(self.laptops)
+        response = api_client.get(self.url, {'categories': str(self.laptops.id)})
+        assert response['X-Cache'] == 'MISS'
+        assert {item['name'] for item in response.data} == {'Test Product', 'Laptop'}
+
+    def test_bulk_availability_update_invalidates_pages(self, api_client, authenticated_seller_client):
+        api_client.get(self.url, {'categories': str(self.phones.id)})
+        authenticated_seller_client.put(reverse('ChangeProducts'), {'is_available': False})
+        response = api_client.get(self.url, {'categories': str(self.phones.id)})
+        assert response['X-Cache'] == 'MISS'
+        assert response.data[0]['is_available'] is False
+
+    def test_new_product_invalidates_full_listing(self, api_client, seller_user):
+        api_client.get(self.url)
+        Product.objects.create(name='Another', price=1, quantity=1, seller=seller_user)
+        response = api_client.get(self.url)
+        assert response['X-Cache'] == 'MISS'
+        assert len(response.data['products']) == 3
+
+    def test_categories_list_cache(self, authenticated_admin_client):
+        authenticated_admin_client.get(self.categories_url)
+        assert authenticated_admin_client.get(self.categories_url)['X-Cache'] == 'HIT'
+        authenticated_admin_client.put(self.categories_url, {'id': self.phones.id, 'name': 'Смартфоны'})
+        response = authenticated_admin_client.get(self.categories_url)
+        assert response['X-Cache'] == 'MISS'
+        assert 'Смартфоны' in {category['name'] for category in response.data['categories']}
+
+    def test_hit_and_miss_counters(self, api_client):
+        before = catalog_cache.stats()
+        api_client.get(self.url)
+        api_client.get(self.url)
+        after = catalog_cache.stats()
+        assert after['hits'] - before['hits'] == 1
+        assert after['misses'] - before['misses'] == 1
+
+
+# тестируем условные GET-запросы (ETag / Last-Modified) к каталогу
+@pytest.mark.django_db
+class TestConditionalGet:
+    @pytest.fixture(autouse=True)
+    def setup(self, product, category):
+        self.url = reverse('Products')
+        self.product = product
+        self.category = category
+        self.product.categories.add(category)
+
+    @pytest.mark.parametrize('params', [{}, {'categories': 'category'}, {'id': 'product'}])
+    def test_not_modified_until_product_changes(self, api_client, params):
+        params = {key: getattr(self, value).id for key, value in params.items()}
+        response = api_client.get(self.url, params)
+        etag = response['ETag']
+
+        response = api_client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert not response.content
+
+        self.product.price = 150
+        self.product.save()
+        response = api_client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response['ETag'] != etag
+
+    def test_if_modified_since(self, api_client):
+        last_modified = api_client.get(self.url)['Last-Modified']
+        response = api_client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_parameter_change_updates_etag(self, api_client):
+        etag = api_client.get(self.url)['ETag']
+        Parameters.objects.create(product=self.product, name='Цвет', value='черный')
+        response = api_client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_etag_depends_on_query(self, api_client):
+        etag = api_client.get(self.url)['ETag']
+        response = api_client.get(self.url, {'page_size': 1}, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_conditional_get_categories(self, authenticated_admin_client):
+        url = reverse('Categories')
+        etag = authenticated_admin_client.get(url)['ETag']
+        assert authenticated_admin_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_304_NOT_MODIFIED
+        authenticated_admin_client.put(url, {'id': self.category.id, 'name': 'Новая категория'})
+        assert authenticated_admin_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_200_OK
+
+
+# тестируем, что число запросов при чтении каталога не зависит от размера выдачи
+@pytest.mark.django_db
+class TestProductsQueryCount:
+    @pytest.fixture(autouse=True)
+    def setup(self, settings, seller_user, category):
+        # cachalot отдает повторные запросы из кэша и искажает подсчет
+        settings.CACHALOT_ENABLED = False
+        self.url = reverse('Products')
+        self.seller = seller_user
+        self.category = category
+
+    def _add_products(self, count, offset=0):
+        for index in range(offset, offset + count):
+            product = Product.objects.create(name=f'Продукт {index:03}', price=10, quantity=1, seller=self.seller)
+            Parameters.objects.create(product=product, name='Цвет', value='черный')
+            Parameters.objects.create(product=product, name='Вес', value='1 кг')
+            product.categories.add(self.category)
+
+    def _count_queries(self, api_client, params):
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get(self.url, params)
+        assert response.status_code == status.HTTP_200_OK
+        # запросы профилировщика silk (в том числе EXPLAIN и точки сохранения) к подсчету не относятся
+        return len([query for query in context.captured_queries
+                    if query['sql'].startswith('SELECT') and 'silk_' not in query['sql']])
+
+    def test_full_listing_query_count_is_constant(self, api_client):
+        self._add_products(2)
+        small = self._count_queries(api_client, {'page_size': 100})
+        self._add_products(20, offset=2)
+        large = self._count_queries(api_client, {'page_size': 100})
+        assert small == large
+
+    def test_categories_listing_query_count_is_constant(self, api_client):
+        self._add_products(2)
+        small = self._count_queries(api_client, {'categories': str(self.category.id)})
+        self._add_products(20, offset=2)
+        large = self._count_queries(api_client, {'categories': str(self.category.id)})
+        assert small == large
+
+    def test_single_product_query_count(self, api_client):
+        self._add_products(1)
+        assert self._count_queries(api_client, {'name': 'Продукт 000'}) <= 4
+
+
 #тестируем работу с параметрами продукта
 @pytest.mark.django_db
 class TestProductParametersView:
@@ -490,6 +1398,54 @@ class TestCartView:
         assert response.status_code == status.HTTP_200_OK
         assert 'Cart_products' in response.data
 
+    def _cart_queries(self, client):
+        with cachalot_disabled(), CaptureQueriesContext(connection) as context:
+            response = client.get(self.url)
+        assert response.status_code == status.HTTP_200_OK
+        return response, len([query for query in context.captured_queries
+                              if query['sql'].startswith('SELECT') and 'silk_' not in query['sql']])
+
+    def test_get_cart_lines_in_one_query(self, authenticated_buyer_client, another_seller_user):
+        cart, _ = Cart.objects.get_or_create(user=self.buyer)
+        CartProduct.objects.create(cart=cart, product=self.product, quantity=3)
+        _, small = self._cart_queries(authenticated_buyer_client)
+
+        for i in range(5):
+            product = Product.objects.create(name=f'Товар {i}', price=Decimal('0.10'), quantity=5, seller=another_seller_user)
+            CartProduct.objects.create(cart=cart, product=product, quantity=i + 1)
+        response, large = self._cart_queries(authenticated_buyer_client)
+        assert small == large
+        self.product.refresh_from_db()
+
+        lines = {line['name']: line for line in response.data['Cart_products']}
+        assert lines['Товар 4']['subtotal'] == Decimal('0.50')
+        assert lines['Товар 4']['seller'] == another_seller_user.username
+        assert lines[self.product.name]['subtotal'] == self.product.price * 3
+        assert response.data['Total_price'] == self.product.price * 3 + Decimal('1.50') == cart.TotalPrice()
+
+    def test_cart_summary_is_one_row(self, authenticated_buyer_client, seller_user):
+        other = Product.objects.create(name='Чехол', price=Decimal('2.50'), quantity=10, seller=seller_user)
+        authenticated_buyer_client.post(reverse('CartBatch'), {
+            "items": [{"id": self.product.id, "quantity": 2}, {"id": other.id, "quantity": 4}]}, format='json')
+        authenticated_buyer_client.put(self.url, {"id": other.id, "quantity": 3})
+        with cachalot_disabled(), CaptureQueriesContext(connection) as context:
+            response = authenticated_buyer_client.get(reverse('CartSummary'))
+        assert response.status_code == status.HTTP_200_OK
+        assert len([query for query in context.captured_queries
+                    if query['sql'].startswith('SELECT') and 'Products_cart' in query['sql']]) == 1
+        assert (response.data['items_count'], response.data['total_price']) == (5, Decimal('207.50'))
+
+        # изменение цены продавцом сразу отражается в итогах корзины
+        seller_client = APIClient()
+        seller_client.force_authenticate(user=seller_user)
+        session = seller_client.session
+        session['user_id'] = seller_user.id
+        session.save()
+        assert seller_client.put(reverse('Products'), {"id": other.id, "price": '3.00'}).status_code == status.HTTP_200_OK
+        response = authenticated_buyer_client.get(reverse('CartSummary'))
+        assert response.data['total_price'] == Decimal('209.00')
+        assert response.data['total_price'] == Cart.objects.get(user=self.buyer).TotalPrice()
+
     def test_checkout_cart(self, authenticated_buyer_client):
         # Добавляем товар в корзину
         cart, _ = Cart.objects.get_or_create(user=self.buyer)
@@ -505,6 +1461,114 @@ class TestCartView:
         assert self.product.quantity == 0  # Исходное количество было 10
         assert self.product.is_available is False
 
+    def test_checkout_is_set_based(self, authenticated_buyer_client, seller_user):
+        cart, _ = Cart.objects.get_or_create(user=self.buyer)
+        for i in range(5):
+            product = Product.objects.create(name=f'Товар {i}', price=Decimal('1.50'), quantity=3, seller=seller_user)
+            CartProduct.objects.create(cart=cart, product=product, quantity=i % 3 + 1)
+        Contact.objects.create(user=self.buyer, city='City', street='Street', phone='1234567890')
+        with cachalot_disabled(), CaptureQueriesContext(connection) as context:
+            response = authenticated_buyer_client.post(self.url)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['total_price'] == Decimal('13.50')
+        # остатки всех позиций уменьшаются одним UPDATE (плюс снятие с продажи закончившихся)
+        assert len([query for query in context.captured_queries
+                    if query['sql'].startswith('UPDATE "Products_product"')]) == 2
+        assert sorted(Product.objects.filter(seller=seller_user, name__startswith='Товар').values_list(
+            'quantity', 'is_available')) == [(0, False), (1, True), (1, True), (2, True), (2, True)]
+        cart.refresh_from_db()
+        assert (cart.items_count, cart.total_price, cart.cart_products.count()) == (0, Decimal('0.00'), 0)
+
+    def test_checkout_rolls_back_when_stock_is_gone(self, authenticated_buyer_client, seller_user, monkeypatch):
+        other = Product.objects.create(name='Чехол', price=Decimal('2.50'), quantity=10, seller=seller_user)
+        cart, _ = Cart.objects.get_or_create(user=self.buyer)
+        CartProduct.objects.create(cart=cart, product=other, quantity=2)
+        CartProduct.objects.create(cart=cart, product=self.product, quantity=4)
+        Contact.objects.create(user=self.buyer, city='City', street='Street', phone='1234567890')
+        # остаток забирает параллельный заказ сразу после проверки корзины, до списания
+        check = views.checkout_problem
+
+        def check_then_sell_out(lines, stock):
+            problem = check(lines, stock)
+            Product.objects.filter(pk=self.product.pk).update(quantity=3)
+            return problem
+
+        monkeypatch.setattr(views, 'checkout_problem', check_then_sell_out)
+        response = authenticated_buyer_client.post(self.url)
+        assert response.status_code == status.HTTP_406_NOT_ACCEPTABLE
+        assert response.data['id'] == self.product.id
+        other.refresh_from_db()
+        assert other.quantity == 10
+        assert not Order.objects.filter(user=self.buyer).exists()
+        assert cart.cart_products.count() == 2
+
+    def test_checkout_conflict_when_stock_returns(self, authenticated_buyer_client, monkeypatch):
+        cart, _ = Cart.objects.get_or_create(user=self.buyer)
+        CartProduct.objects.create(cart=cart, product=self.product, quantity=4)
+        Contact.objects.create(user=self.buyer, city='City', street='Street', phone='1234567890')
+        check = views.checkout_problem
+        calls = []
+
+        # товар закончился до списания и снова появился до повторной проверки
+        def sell_out_then_restock(lines, stock):
+            calls.append(stock)
+            quantity = 3 if len(calls) == 1 else 10
+            Product.objects.filter(pk=self.product.pk).update(quantity=quantity)
+            return check(lines, stock) if len(calls) == 1 else check(lines, {self.product.id: (quantity, True)})
+
+        monkeypatch.setattr(views, 'checkout_problem', sell_out_then_restock)
+        response = authenticated_buyer_client.post(self.url)
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert not Order.objects.filter(user=self.buyer).exists()
+        assert cart.cart_products.count() == 1
+
+    def test_double_submit_creates_one_order(self, authenticated_buyer_client, monkeypatch):
+        cart, _ = Cart.objects.get_or_create(user=self.buyer)
+        CartProduct.objects.create(cart=cart, product=self.product, quantity=4)
+        Contact.objects.create(user=self.buyer, city='City', street='Street', phone='1234567890')
+        check = views.checkout_problem
+        responses = []
+
+        # повторная отправка формы оформляет заказ после проверки корзины первым запросом
+        def check_then_resubmit(lines, stock):
+            if not responses:
+                responses.append(None)
+                responses.append(authenticated_buyer_client.post(self.url))
+            return check(lines, stock)
+
+        monkeypatch.setattr(views, 'checkout_problem', check_then_resubmit)
+        response = authenticated_buyer_client.post(self.url)
+        assert responses[1].status_code == status.HTTP_201_CREATED
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert Order.objects.filter(user=self.buyer).count() == 1
+        self.product.refresh_from_db()
+        assert self.product.quantity == 6
+
+    def test_checkout_conflict_when_cart_changes(self, authenticated_buyer_client, monkeypatch):
+        cart, _ = Cart.objects.get_or_create(user=self.buyer)
+        line = CartProduct.objects.create(cart=cart, product=self.product, quantity=4)
+        Contact.objects.create(user=self.buyer, city='City', street='Street', phone='1234567890')
+        check = views.checkout_problem
+
+        # количество в корзине меняется после проверки корзины
+        def check_then_change(lines, stock):
+            CartProduct.objects.filter(pk=line.pk).set_quantity(9)
+            return check(lines, stock)
+
+        monkeypatch.setattr(views, 'checkout_problem', check_then_change)
+        response = authenticated_buyer_client.post(self.url)
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert not Order.objects.filter(user=self.buyer).exists()
+        assert list(cart.cart_products.values_list('quantity', flat=True)) == [9]
+        self.product.refresh_from_db()
+        assert self.product.quantity == 10
+
+    def test_checkout_problem_sums_lines_of_product(self):
+        line = type('Line', (), {'product_id': self.product.id, 'quantity': 3, 'product': self.product})
+        response = views.checkout_problem([line, line], {self.product.id: (5, True)})
+        assert response.status_code == status.HTTP_406_NOT_ACCEPTABLE
+        assert views.checkout_problem([line], {self.product.id: (5, True)}) is None
+
     def test_remove_from_cart(self, authenticated_buyer_client):
         # Создаем корзину и добавляем товар
         cart, _ = Cart.objects.get_or_create(user=self.buyer)
@@ -523,4 +1587,201 @@ class TestCartView:
 
         # Проверяем ответ и состояние корзины
         assert response.status_code == status.HTTP_200_OK
-        assert cart.products.count() == 0
\ No newline at end of file
+        assert cart.products.count() == 0
+
+# тестируем пакетное изменение корзины
+@pytest.mark.django_db
+class TestCartBatchView:
+    @pytest.fixture(autouse=True)
+    def setup(self, buyer_user, product, seller_user):
+        self.url = reverse('CartBatch')
+        self.buyer = buyer_user
+        self.product = product
+        self.seller = seller_user
+
+    def _products(self, count):
+        return [Product.objects.create(name=f'Товар {i}', price=Decimal('1.00'), quantity=5, seller=self.seller)
+                for i in range(count)]
+
+    def _batch_queries(self, client, data):
+        with cachalot_disabled(), CaptureQueriesContext(connection) as context:
+            response = client.post(self.url, data, format='json')
+        assert response.status_code == status.HTTP_200_OK, response.data
+        return response, len([query for query in context.captured_queries if 'silk_' not in query['sql']])
+
+    def test_batch_upserts_and_removes(self, authenticated_buyer_client):
+        first, second, third = self._products(3)
+        cart, _ = Cart.objects.get_or_create(user=self.buyer)
+        CartProduct.objects.create(cart=cart, product=first, quantity=1)
+        CartProduct.objects.create(cart=cart, product=second, quantity=1)
+        response = authenticated_buyer_client.post(self.url, {
+            "items": [{"id": first.id, "quantity": 3}, {"id": third.id, "quantity": 2}],
+            "remove": [second.id, self.product.id]
+        }, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['id'] == cart.id
+        assert [(line['id'], line['quantity']) for line in response.data['Cart_products']] == [(first.id, 3), (third.id, 2)]
+        assert response.data['Total_price'] == Decimal('5.00')
+        assert dict(cart.cart_products.values_list('product_id', 'quantity')) == {first.id: 3, third.id: 2}
+
+    def test_batch_query_count_does_not_depend_on_size(self, authenticated_buyer_client):
+        products = self._products(22)
+        cart, _ = Cart.objects.get_or_create(user=self.buyer)
+        for product in products[:2] + products[10:12]:
+            CartProduct.objects.create(cart=cart, product=product, quantity=1)
+        _, small = self._batch_queries(authenticated_buyer_client, {
+            "items": [{"id": products[0].id, "quantity": 2}, {"id": products[2].id, "quantity": 1}],
+            "remove": [products[1].id]
+        })
+        _, large = self._batch_queries(authenticated_buyer_client, {
+            "items": [{"id": product.id, "quantity": 4} for product in products[10:12] + products[14:22]],
+            "remove": [product.id for product in products[:10]]
+        })
+        assert small == large
+
+    def test_apply_upserts_with_loaded_prices(self):
+        first, second = self._products(2)
+        cart, _ = Cart.objects.get_or_create(user=self.buyer)
+        CartProduct.objects.create(cart=cart, product=first, quantity=1)
+        with cachalot_disabled(), CaptureQueriesContext(connection) as context:
+            carts.DatabaseCartStore().apply(self.buyer.id, {first.id: 3, second.id: 2}, [],
+                                            {first.id: Decimal('1.00'), second.id: Decimal('1.00')})
+        # цены не перечитываются, новые и измененные позиции записываются одним INSERT ... ON CONFLICT
+        assert not [query for query in context.captured_queries if 'FROM "Products_product"' in query['sql']]
+        inserts = [query['sql'] for query in context.captured_queries if query['sql'].startswith('INSERT INTO "Products_cartproduct"')]
+        assert len(inserts) == 1 and 'ON CONFLICT' in inserts[0]
+        cart.refresh_from_db()
+        assert (cart.items_count, cart.total_price) == (5, Decimal('5.00'))
+        assert dict(cart.cart_products.values_list('product_id', 'quantity')) == {first.id: 3, second.id: 2}
+
+    def test_batch_is_all_or_nothing(self, authenticated_buyer_client):
+        first, second = self._products(2)
+        second.is_available = False
+        second.save()
+        response = authenticated_buyer_client.post(self.url, {
+            "items": [{"id": first.id, "quantity": 2}, {"id": second.id, "quantity": 1},
+                      {"id": self.product.id, "quantity": 100}]
+        }, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert [error['id'] for error in response.data['errors']] == [second.id, self.product.id]
+        assert not CartProduct.objects.exists()
+
+        response = authenticated_buyer_client.post(self.url, {
+            "items": [{"id": first.id, "quantity": 2}, {"id": 999999, "quantity": 1}]
+        }, format='json')
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.data['ids'] == [999999]
+        assert not CartProduct.objects.exists()
+
+    def test_batch_rejects_invalid_payload(self, authenticated_buyer_client):
+        for data in ({}, {"items": [{"id": self.product.id, "quantity": 1}], "remove": [self.product.id]},
+                     {"items": [{"id": self.product.id, "quantity": 1}, {"id": self.product.id, "quantity": 2}]},
+                     {"items": [{"id": self.product.id, "quantity": 0}]}):
+            response = authenticated_buyer_client.post(self.url, data, format='json')
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_batch_requires_permission(self, authenticated_seller_client):
+        response = authenticated_seller_client.post(self.url, {"items": [{"id": self.product.id, "quantity": 1}]},
+                                                    format='json')
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+# тестируем хранилище корзины в кэше с отложенной записью в БД
+@pytest.mark.django_db
+class TestCacheCartStore:
+    @pytest.fixture(autouse=True)
+    def setup(self, buyer_user, product, settings, monkeypatch, clear_cache_before_each_test):
+        settings.CART_BACKEND = 'cache'
+        self.url = reverse('Cart')
+        self.buyer = buyer_user
+        self.product = product
+        self.scheduled = []
+        monkeypatch.setattr(persist_cart, 'apply_async', lambda args, countdown: self.scheduled.append(args))
+
+    def test_changes_stay_in_cache_until_persisted(self, authenticated_buyer_client):
+        authenticated_buyer_client.patch(reverse('Products'), {"id": self.product.id, "quantity": 2})
+        with cachalot_disabled(), CaptureQueriesContext(connection) as context:
+            response = authenticated_buyer_client.put(self.url, {"id": self.product.id, "quantity": 3})
+        assert response.status_code == status.HTTP_200_OK
+        assert not [query for query in context.captured_queries if 'Products_cart' in query['sql']]
+        assert not CartProduct.objects.exists()
+        # запись в БД запланирована один раз на все изменения
+        assert self.scheduled == [(self.buyer.id,)]
+
+        response = authenticated_buyer_client.get(self.url)
+        assert [(line['id'], line['quantity']) for line in response.data['Cart_products']] == [(self.product.id, 3)]
+
+        persist_cart(self.buyer.id)
+        assert list(CartProduct.objects.values_list('product_id', 'quantity')) == [(self.product.id, 3)]
+        authenticated_buyer_client.delete(self.url, {"id": self.product.id}, format='json')
+        persist_cart(self.buyer.id)
+        assert not CartProduct.objects.exists()
+
+    def test_checkout_uses_cached_cart(self, authenticated_buyer_client):
+        Contact.objects.create(user=self.buyer, city='City', street='Street', phone='1234567890')
+        authenticated_buyer_client.patch(reverse('Products'), {"id": self.product.id, "quantity": 4})
+        response = authenticated_buyer_client.post(self.url)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['total_price'] == self.product.price * 4
+        self.product.refresh_from_db()
+        assert self.product.quantity == 6
+        # после заказа корзина пуста и в БД, и в кэше
+        assert not CartProduct.objects.exists()
+        assert authenticated_buyer_client.get(self.url).data['Cart_products'] == []
+
+    def test_batch_changes_cached_cart(self, authenticated_buyer_client):
+        authenticated_buyer_client.patch(reverse('Products'), {"id": self.product.id, "quantity": 2})
+        response = authenticated_buyer_client.post(reverse('CartBatch'), {
+            "items": [{"id": self.product.id, "quantity": 5}]}, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert [(line['id'], line['quantity']) for line in response.data['Cart_products']] == [(self.product.id, 5)]
+        assert not CartProduct.objects.exists()
+        persist_cart(self.buyer.id)
+        assert list(CartProduct.objects.values_list('product_id', 'quantity')) == [(self.product.id, 5)]
+
+    def test_summary_follows_cached_cart(self, authenticated_buyer_client):
+        authenticated_buyer_client.patch(reverse('Products'), {"id": self.product.id, "quantity": 2})
+        response = authenticated_buyer_client.get(reverse('CartSummary'))
+        assert (response.data['items_count'], response.data['total_price']) == (2, Decimal('200.00'))
+        persist_cart(self.buyer.id)
+        cart = Cart.objects.get(user=self.buyer)
+        assert (cart.items_count, cart.total_price) == (2, Decimal('200.00'))
+
+    def test_change_waits_for_cart_lock(self):
+        store = carts.CacheCartStore()
+        store.set_quantity(self.buyer.id, self.product.id, 1)
+        # блокировку держит запись корзины в БД - изменение ждет ее снятия
+        with store._lock(self.buyer.id):
+            thread = threading.Thread(target=store.set_quantity, args=(self.buyer.id, self.product.id, 3))
+            thread.start()
+            thread.join(0.2)
+            assert thread.is_alive()
+            assert store._load(self.buyer.id)['lines'] == {self.product.id: 1}
+        thread.join()
+        assert store._load(self.buyer.id)['lines'] == {self.product.id: 3}
+
+    def test_persist_waits_for_checkout(self):
+        store = carts.CacheCartStore()
+        store.set_quantity(self.buyer.id, self.product.id, 2)
+        # задача persist_cart, запущенная во время оформления заказа, ждет его окончания
+        # и не восстанавливает оформленную корзину
+        with store.checkout(self.buyer.id):
+            assert list(CartProduct.objects.values_list('product_id', 'quantity')) == [(self.product.id, 2)]
+            thread = threading.Thread(target=store.flush, args=(self.buyer.id,))
+            thread.start()
+            thread.join(0.2)
+            assert thread.is_alive()
+            CartProduct.objects.filter(cart__user=self.buyer).delete()
+        thread.join()
+        assert not CartProduct.objects.exists()
+        assert store._load(self.buyer.id)['lines'] == {}
+
+    def test_repeated_flush_keeps_one_line(self):
+        store = carts.CacheCartStore()
+        store.set_quantity(self.buyer.id, self.product.id, 2)
+        store.flush(self.buyer.id)
+        store.set_quantity(self.buyer.id, self.product.id, 5)
+        store.flush(self.buyer.id)
+        store.flush(self.buyer.id)
+        assert list(CartProduct.objects.values_list('product_id', 'quantity')) == [(self.product.id, 5)]
+        cart = Cart.objects.get(user=self.buyer)
+        assert (cart.items_count, cart.total_price) == (5, Decimal('500.00'))
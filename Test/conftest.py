@@ -3,14 +3,15 @@ from django.contrib.auth.models import Group, Permission
 from Orders.models import Order, OrderProduct, SellerOrder
 from Products.models import Product, Category, Cart, CartProduct
 from Users.models import MarketUser, UserGroup
-from django.core.cache import cache
+from django.core.cache import caches
 from django.core.management import call_command
 
 
 @pytest.fixture(scope='session')
-def django_db_setup(django_db_blocker):
+def django_db_setup(django_db_setup, django_db_blocker):
     """
     Фикстура для подготовки БД путем вызова management-команды перед началом сессии тестирования.
+    Тесты работают с тестовой БД, которую создает pytest-django, а не с db.sqlite3.
     """
     with django_db_blocker.unblock():
         call_command('setup_permissions')
@@ -164,8 +165,10 @@ def clear_cache_before_each_test():
     """
     Фикстура для автоматической очистки кэша перед каждым тестом.
     autouse=True означает, что она будет применяться ко всем тестам в модуле/сессии.
+    Очищаются все кэши из CACHES, в том числе общий кэш корзин.
     """
-    cache.clear()
+    for cache in caches.all():
+        cache.clear()
 
 
 